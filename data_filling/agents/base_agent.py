@@ -1,7 +1,34 @@
 # data_filling/agents/base_agent.py
 
-import base64, json, cv2, httpx, numpy as np
-from openai import OpenAI
+import asyncio, json, threading, time, httpx, numpy as np
+from openai import APIConnectionError, AsyncOpenAI, InternalServerError, OpenAI, RateLimitError
+
+from data_filling.data.io import encode_frame_b64
+from data_filling.tools.build_and_split_prompt import estimate_tokens_from_messages
+from data_filling.utils.sqlite_cache import get_sqlite_cache
+from .rate_limiter import get_rate_limiter
+
+
+# ---------------------------------------------------------------------- #
+#  Boucle asyncio partagée (thread daemon) pour les appels AsyncOpenAI
+# ---------------------------------------------------------------------- #
+_LOOP: asyncio.AbstractEventLoop | None = None
+_LOOP_LOCK = threading.Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """
+    Une seule boucle pour tout le process : le client AsyncOpenAI (et son
+    pool de connexions httpx) reste lié à la même boucle, quel que soit le
+    thread appelant (cf. max_workers).
+    """
+    global _LOOP
+    with _LOOP_LOCK:
+        if _LOOP is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="gpt-async-loop", daemon=True).start()
+            _LOOP = loop
+    return _LOOP
 
 
 class BaseGPTAgent:
@@ -14,15 +41,47 @@ class BaseGPTAgent:
         self._config      = config
         self._model_name  = config.get("openai_model", "gpt-4o")
         self._client: OpenAI = self._build_client()
+        self._aclient: AsyncOpenAI = self._build_async_client()
+        # ordonnanceur RPM/TPM partagé par tous les agents du process
+        self._limiter = get_rate_limiter(config)
+        self._max_rate_retries = int((config.get("rate_limit") or {}).get("max_retries", 5))
+        # cache disque des réponses (None si `response_cache` absent)
+        self._cache = get_sqlite_cache(config.get("response_cache"))
 
-    def _build_client(self) -> OpenAI:
+    def _api_key(self) -> str:
         api_key = self._config.get("openai_api_key")
         if not api_key:
             raise ValueError("Missing 'openai_api_key' in config.")
+        return api_key
+
+    def _build_client(self) -> OpenAI:
+        api_key = self._api_key()
+        # openai_base_url : serveur compatible (proxy, serveur local de test)
+        base_url = self._config.get("openai_base_url") or None
+        # max_retries=0 : les nouveaux essais (429 compris) passent par l'ordonnanceur
         if not self._config.get("verify_ssl", True):
             print("⚠️ SSL verification disabled for OpenAI client (dev mode).")
-            return OpenAI(api_key=api_key, http_client=httpx.Client(verify=False))
-        return OpenAI(api_key=api_key)
+            return OpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                          http_client=httpx.Client(verify=False))
+        return OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+
+    def _build_async_client(self) -> AsyncOpenAI:
+        api_key = self._api_key()
+        base_url = self._config.get("openai_base_url") or None
+        if not self._config.get("verify_ssl", True):
+            return AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0,
+                               http_client=httpx.AsyncClient(verify=False))
+        return AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+
+    @property
+    def client(self) -> OpenAI:
+        """Client synchrone (fichiers / batches)."""
+        return self._client
+
+    @staticmethod
+    def _run_sync(coro):
+        """Exécute une coroutine sur la boucle partagée et attend le résultat."""
+        return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result()
 
     # ------------------------------------------------------------------ #
     #  Chat helper (robuste)
@@ -34,26 +93,81 @@ class BaseGPTAgent:
             else {"max_tokens": n_tokens}
         )
 
-    def _chat(self, *, messages, n_tokens=4096, temperature: float = 0.0, **extra):
+    def _trials(self, n_tokens: int, temperature: float, extra: dict) -> list:
         """
-        Envoie la requête chat. Essaye successivement :
+        Jeux de paramètres essayés successivement :
         1. full params (temperature + n_tokens + extra)
         2. sans temperature
         3. sans extra ni temperature
         4. seulement model/messages
         """
-        base = dict(model=self._model_name, messages=messages)
-        trials = [
+        return [
             {**self._completion_param(n_tokens), "temperature": temperature, **extra},
             {**self._completion_param(n_tokens), **extra},
             self._completion_param(n_tokens),
             {},
         ]
 
+    def chat_body(self, *, messages, n_tokens=4096, temperature: float = 0.0, **extra) -> dict:
+        """Corps de requête /v1/chat/completions (1ᵉʳ essai de _trials, pour l'API Batch)."""
+        return dict(
+            model=self._model_name,
+            messages=messages,
+            **self._trials(n_tokens, temperature, extra)[0],
+        )
+
+    def _retry_delay(self, err: Exception, attempt: int) -> float:
+        """
+        Erreur d'un appel → délai local avant nouvel essai, sinon relance.
+        429 : pause globale de l'ordonnanceur (Retry-After), appliquée par
+        la réservation suivante ; 5xx / réseau : backoff exponentiel.
+        """
+        if isinstance(err, RateLimitError):
+            delay = self._limiter.on_rate_limited(getattr(err.response, "headers", None))
+            print(f"⏳ 429 rate limited, pausing {delay:.1f}s ({attempt + 1}/{self._max_rate_retries})")
+            local = 0.0
+        elif isinstance(err, (APIConnectionError, InternalServerError)):
+            local = min(8.0, 0.5 * 2 ** attempt)
+            print(f"⚠️ {type(err).__name__}, retrying in {local:.1f}s ({attempt + 1}/{self._max_rate_retries})")
+        else:
+            raise err
+        if attempt == self._max_rate_retries:
+            raise err
+        return local
+
+    def _create(self, tokens: int, **kwargs):
+        """Un appel API via l'ordonnanceur ; 429 → pause globale puis nouvel essai."""
+        for attempt in range(self._max_rate_retries + 1):
+            self._limiter.acquire(tokens)
+            try:
+                raw = self._client.chat.completions.with_raw_response.create(**kwargs)
+            except Exception as e:
+                time.sleep(self._retry_delay(e, attempt))
+                continue
+            self._limiter.update_from_headers(raw.headers)
+            return raw.parse()
+
+    async def _acreate(self, tokens: int, **kwargs):
+        for attempt in range(self._max_rate_retries + 1):
+            await self._limiter.aacquire(tokens)
+            try:
+                raw = await self._aclient.chat.completions.with_raw_response.create(**kwargs)
+            except Exception as e:
+                await asyncio.sleep(self._retry_delay(e, attempt))
+                continue
+            self._limiter.update_from_headers(raw.headers)
+            return raw.parse()
+
+    def _chat(self, *, messages, n_tokens=4096, temperature: float = 0.0, **extra):
+        """Envoie la requête chat (bloquant) avec repli sur les paramètres."""
+        base = dict(model=self._model_name, messages=messages)
+        # OpenAI décompte aussi max_tokens du TPM dès l'envoi
+        tokens = estimate_tokens_from_messages(messages, self._model_name) + n_tokens
+
         last_err = None
-        for params in trials:
+        for params in self._trials(n_tokens, temperature, extra):
             try:
-                return self._client.chat.completions.create(**base, **params)
+                return self._create(tokens, **base, **params)
             except Exception as e:
                 last_err = e
                 # on itère si l'erreur mentionne « unsupported parameter »
@@ -61,6 +175,22 @@ class BaseGPTAgent:
                     break
         raise last_err
 
+    async def _achat(self, *, messages, n_tokens=4096, temperature: float = 0.0, **extra):
+        """Variante asyncio de _chat() (AsyncOpenAI), mêmes replis."""
+        base = dict(model=self._model_name, messages=messages)
+        # OpenAI décompte aussi max_tokens du TPM dès l'envoi
+        tokens = estimate_tokens_from_messages(messages, self._model_name) + n_tokens
+
+        last_err = None
+        for params in self._trials(n_tokens, temperature, extra):
+            try:
+                return await self._acreate(tokens, **base, **params)
+            except Exception as e:
+                last_err = e
+                if "unsupported parameter" not in str(e).lower():
+                    break
+        raise last_err
+
     # ------------------------------------------------------------------ #
     #  Parsing JSON de la réponse
     # ------------------------------------------------------------------ #
@@ -87,7 +217,4 @@ class BaseGPTAgent:
     # ------------------------------------------------------------------ #
     @staticmethod
     def encode_bgr_to_b64(frame: np.ndarray) -> str:
-        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-        if not ok:
-            raise ValueError("Failed to encode frame.")
-        return base64.b64encode(buf).decode()
+        return encode_frame_b64(frame)
@@ -0,0 +1,186 @@
+# data_filling/agents/rate_limiter.py
+
+from __future__ import annotations
+import asyncio
+import re
+import threading
+import time
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def _parse_duration(value) -> float | None:
+    """'6m0s', '1.5s', '20ms' (format x-ratelimit-reset-*) → secondes."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(n) * _UNITS[u] for n, u in parts)
+
+
+class RateLimiter:
+    """
+    Ordonnanceur partagé des appels OpenAI (seaux à jetons RPM / TPM).
+
+    Chaque appel réserve 1 requête + son estimation de tokens ; le solde
+    peut devenir négatif, l'appelant attend alors le temps de recharge.
+    Les réservations sont donc servies dans l'ordre d'arrivée, quel que
+    soit le thread ou la coroutine. Les en-têtes `x-ratelimit-*` recalent
+    les seaux sur l'état réel du compte, un 429 (`Retry-After`) met tous
+    les appels en pause.
+    """
+
+    def __init__(self, rpm: float | None = None, tpm: float | None = None):
+        self._rpm = float(rpm) if rpm else None
+        self._tpm = float(tpm) if tpm else None
+        self._req_level = self._rpm or 0.0
+        self._tok_level = self._tpm or 0.0
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "throttled": 0, "rate_limited": 0,
+                       "wait_total": 0.0, "wait_max": 0.0}
+
+    # ------------------------------------------------------------------ #
+    #  Réservation
+    # ------------------------------------------------------------------ #
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        self._updated = now
+        if self._rpm:
+            self._req_level = min(self._rpm, self._req_level + elapsed * self._rpm / 60.0)
+        if self._tpm:
+            self._tok_level = min(self._tpm, self._tok_level + elapsed * self._tpm / 60.0)
+
+    def _reserve(self, tokens: int) -> float:
+        """Réserve la capacité et renvoie le délai d'attente (s)."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            wait = max(0.0, self._paused_until - now)
+            if self._rpm:
+                self._req_level -= 1
+                if self._req_level < 0:
+                    wait = max(wait, -self._req_level * 60.0 / self._rpm)
+            if self._tpm:
+                self._tok_level -= min(tokens, self._tpm)
+                if self._tok_level < 0:
+                    wait = max(wait, -self._tok_level * 60.0 / self._tpm)
+
+            self._stats["requests"] += 1
+            if wait > 0:
+                self._stats["throttled"] += 1
+                self._stats["wait_total"] += wait
+                self._stats["wait_max"] = max(self._stats["wait_max"], wait)
+            return wait
+
+    def acquire(self, tokens: int = 0) -> float:
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self, tokens: int = 0) -> float:
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    # ------------------------------------------------------------------ #
+    #  Retour d'information de l'API
+    # ------------------------------------------------------------------ #
+    def pause(self, seconds: float):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers):
+        """Recale les seaux sur x-ratelimit-limit/remaining/reset-*."""
+        if not headers:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            for kind in ("requests", "tokens"):
+                limit = headers.get(f"x-ratelimit-limit-{kind}")
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                try:
+                    limit = float(limit) if limit is not None else None
+                    remaining = float(remaining) if remaining is not None else None
+                except ValueError:
+                    continue
+
+                if kind == "requests":
+                    if limit and not self._rpm:
+                        self._rpm, self._req_level = limit, limit
+                    if remaining is not None and self._rpm:
+                        self._req_level = min(self._req_level, remaining)
+                else:
+                    if limit and not self._tpm:
+                        self._tpm, self._tok_level = limit, limit
+                    if remaining is not None and self._tpm:
+                        self._tok_level = min(self._tok_level, remaining)
+
+                if remaining is not None and remaining <= 0:
+                    reset = _parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                    if reset:
+                        self._paused_until = max(self._paused_until, time.monotonic() + reset)
+
+    def on_rate_limited(self, headers) -> float:
+        """429 reçu : pause globale selon Retry-After (ou reset-*, sinon 1 s)."""
+        delay = None
+        if headers:
+            if headers.get("retry-after-ms") is not None:
+                delay = _parse_duration(headers.get("retry-after-ms"))
+                delay = delay / 1000.0 if delay is not None else None
+            if delay is None:
+                delay = _parse_duration(headers.get("retry-after"))
+            if delay is None:
+                resets = [_parse_duration(headers.get(f"x-ratelimit-reset-{k}"))
+                          for k in ("requests", "tokens")]
+                resets = [r for r in resets if r]
+                delay = max(resets) if resets else None
+        delay = delay if delay is not None else 1.0
+        with self._lock:
+            self._stats["rate_limited"] += 1
+        self.pause(delay)
+        return delay
+
+    # ------------------------------------------------------------------ #
+    #  Statistiques
+    # ------------------------------------------------------------------ #
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["wait_avg"] = stats["wait_total"] / stats["requests"] if stats["requests"] else 0.0
+        return stats
+
+    def report(self) -> str:
+        s = self.stats()
+        return (
+            f"⏱️ OpenAI scheduler: {s['requests']} requests, {s['throttled']} throttled, "
+            f"{s['rate_limited']} × 429, queue wait total {s['wait_total']:.1f}s "
+            f"(avg {s['wait_avg']:.2f}s, max {s['wait_max']:.1f}s)"
+        )
+
+
+# ---------------------------------------------------------------------- #
+#  Instance partagée par tous les agents du process
+# ---------------------------------------------------------------------- #
+_LIMITER: RateLimiter | None = None
+_LIMITER_LOCK = threading.Lock()
+
+
+def get_rate_limiter(config: dict | None = None) -> RateLimiter:
+    """Ordonnanceur du process, créé au premier appel depuis `rate_limit` (conf)."""
+    global _LIMITER
+    with _LIMITER_LOCK:
+        if _LIMITER is None:
+            opts = (config or {}).get("rate_limit") or {}
+            _LIMITER = RateLimiter(rpm=opts.get("rpm"), tpm=opts.get("tpm"))
+    return _LIMITER
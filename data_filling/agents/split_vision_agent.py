@@ -1,6 +1,7 @@
 # data_filling/agents/split_vision_agent.py
 
 from __future__ import annotations
+import asyncio
 from typing import Dict, List, Tuple
 
 from .base_agent import BaseGPTAgent
@@ -8,11 +9,22 @@ from data_filling.tools.build_and_split_prompt import (
     smart_split_prompt,
     build_prompt_messages,
 )
+from data_filling.tools.image_payload import low_detail_b64
+from data_filling.tools.template import CompiledTemplate
 
 
 class SplitVisionAgent(BaseGPTAgent):
     """Découpe les champs, interroge GPT, valide les réponses."""
 
+    def __init__(self, config: dict, template: CompiledTemplate | None = None):
+        super().__init__(config)
+        # template compilé : fragments JSON + valeurs admises précalculés
+        self._template = template
+        self._fragments = template.fragments if template is not None else None
+        # detail d'image : indice par champ (template), sinon image_payload.detail
+        self._details = template.details if template is not None else None
+        self._default_detail = (config.get("image_payload") or {}).get("detail")
+
     # ------------------------------------------------------------------ #
     #  Interface publique
     # ------------------------------------------------------------------ #
@@ -25,35 +37,78 @@ class SplitVisionAgent(BaseGPTAgent):
             extra_context: str | None = None,  # 🆕
             double_check: bool = False,
             max_fields_per_chunk: int | None = None,
+            answered: set | None = None,
     ) -> Dict:
-        first_pass = self._run_and_retry(
-            prompt_dict, images_b64, max_fields_per_chunk, ocr_context, extra_context
-        )
+        """
+        Tous les champs de prompt_dict (N/A si non obtenus). answered (set)
+        reçoit les clés réellement renvoyées par le modèle et validées, par
+        opposition aux N/A de remplissage (réponse invalide après retry,
+        découpage abandonné).
+        """
+        return self._run_sync(self._apredict_fields(
+            prompt_dict,
+            images_b64,
+            ocr_context=ocr_context,
+            extra_context=extra_context,
+            double_check=double_check,
+            max_fields_per_chunk=max_fields_per_chunk,
+            answered=answered,
+        ))
 
+    async def _apredict_fields(
+            self,
+            prompt_dict: Dict,
+            images_b64: List[str],
+            *,
+            ocr_context: str | None = None,
+            extra_context: str | None = None,
+            double_check: bool = False,
+            max_fields_per_chunk: int | None = None,
+            answered: set | None = None,
+    ) -> Dict:
         if not double_check:
+            first_pass = await self._run_and_retry(
+                prompt_dict, images_b64, max_fields_per_chunk, ocr_context, extra_context
+            )
+            if answered is not None:
+                answered.update(first_pass)
             return self._fill_na(prompt_dict, first_pass)
 
-        second_pass = self._run_and_retry(prompt_dict, images_b64, max_fields_per_chunk, ocr_context, extra_context)
+        # les deux passes sont indépendantes : lancées ensemble
+        # (seule la 1ʳᵉ lit le cache : la vérification veut un tirage neuf)
+        first_pass, second_pass = await asyncio.gather(
+            self._run_and_retry(prompt_dict, images_b64, max_fields_per_chunk, ocr_context, extra_context),
+            self._run_and_retry(prompt_dict, images_b64, max_fields_per_chunk, ocr_context, extra_context,
+                                use_cache=False),
+        )
         agreed, conflicts = self._compare(first_pass, second_pass, prompt_dict)
 
+        final_retry = {}
         if conflicts:
-            final_retry = self._run_and_retry(conflicts, images_b64, max_fields_per_chunk, ocr_context, extra_context)
+            final_retry = await self._run_and_retry(conflicts, images_b64, max_fields_per_chunk, ocr_context,
+                                                    extra_context, use_cache=False)
             agreed.update(final_retry)
 
+        if answered is not None:  # accord sur « absent des deux passes » ≠ réponse
+            answered.update(k for k in agreed if k in first_pass or k in final_retry)
         return self._fill_na(prompt_dict, agreed)
 
     # ------------------------------------------------------------------ #
     #  Implémentation privée
     # ------------------------------------------------------------------ #
-    def _run_and_retry(
+    async def _run_and_retry(
             self,
             fields: Dict,
             images_b64: List[str],
             max_fields_per_chunk: int | None,
             ocr_context: str | None = None,
             extra_context: str | None = None,  # 🆕
+            *,
+            use_cache: bool = True,
     ) -> Dict:
-        validated, invalids = self._ask_chunks(fields, images_b64, max_fields_per_chunk, ocr_context, extra_context)
+        validated, invalids = await self._ask_chunks(
+            fields, images_b64, max_fields_per_chunk, ocr_context, extra_context, use_cache=use_cache
+        )
         print("fields", fields, "\n")
         print("ocr_context",ocr_context,"\n")
         print("validated ", validated, "\ninvalids ", invalids, "\n\n")
@@ -68,16 +123,17 @@ class SplitVisionAgent(BaseGPTAgent):
             if k in fields
         }
 
-        retry_valid, _ = self._ask_chunks(
-            invalids_prompt, images_b64, max_fields_per_chunk, ocr_context, extra_context, retry=True
+        retry_valid, _ = await self._ask_chunks(
+            invalids_prompt, images_b64, max_fields_per_chunk, ocr_context, extra_context,
+            retry=True, use_cache=use_cache,
         )
 
         print("retry_valid", retry_valid)
         validated.update(retry_valid)
         return validated
 
-    # ---------- découpe + GPT -----------------------------------------
-    def _ask_chunks(
+    # ---------- découpe + GPT (chunks envoyés en parallèle) ------------
+    async def _ask_chunks(
             self,
             prompt_data: Dict,
             images_b64: List[str],
@@ -86,8 +142,47 @@ class SplitVisionAgent(BaseGPTAgent):
             extra_context: str | None = None,  # 🆕
             *,
             retry: bool = False,
+            use_cache: bool = True,
     ) -> Tuple[Dict, Dict]:
-        chunks = smart_split_prompt(
+        chunks = self._split_chunks(
+            prompt_data, images_b64, max_fields_per_chunk, ocr_context, extra_context, retry=retry
+        )
+        if not chunks:  # découpage abandonné : champs absents → N/A (_fill_na)
+            return {}, {}
+
+        for i, (field_chunk, _, detail) in enumerate(chunks, 1):
+            print(f"🧩 GPT {'Retry ' if retry else ''}{i}/{len(chunks)} — {len(field_chunk)} fields"
+                  + (f" (detail: {detail})" if detail else ""))
+
+        # toutes les requêtes de la passe partent ensemble ; on attend la fin
+        # de chacune avant de propager une éventuelle erreur
+        responses = await asyncio.gather(
+            *(
+                self._call_gpt(field_chunk, img_chunk, ocr_context, extra_context, detail=detail, use_cache=use_cache)
+                for field_chunk, img_chunk, detail in chunks
+            ),
+            return_exceptions=True,
+        )
+
+        raw: Dict = {}
+        for resp in responses:  # ordre des chunks conservé
+            if isinstance(resp, BaseException):
+                raise resp
+            raw.update(resp)
+
+        return self._validate_resp(raw, prompt_data)
+
+    def _split_chunks(
+            self,
+            prompt_data: Dict,
+            images_b64: List[str],
+            max_fields_per_chunk: int | None,
+            ocr_context: str | None = None,
+            extra_context: str | None = None,
+            *,
+            retry: bool = False,
+    ) -> List[Tuple[Dict, List[str], str | None]]:
+        return smart_split_prompt(
             prompt_data,
             images_b64,
             ocr_context=ocr_context,
@@ -97,31 +192,79 @@ class SplitVisionAgent(BaseGPTAgent):
             max_images_per_chunk=6,
             max_tokens=10_000,
             max_chunks=15 if not retry else 10,
+            fragments=self._fragments,
+            details=self._details,
+            default_detail=self._default_detail,
         )
-        if not chunks:
-            return {k: "N/A" for k in prompt_data}, {}
 
-        raw: Dict = {}
-        for i, (field_chunk, img_chunk) in enumerate(chunks, 1):
-            print(f"🧩 GPT {'Retry ' if retry else ''}{i}/{len(chunks)} — {len(field_chunk)} fields")
-            resp = self._call_gpt(field_chunk, img_chunk, ocr_context, extra_context)
-            raw.update(resp)
+    @staticmethod
+    def _chunk_images(images_b64: List[str], detail: str | None) -> List[str]:
+        """detail low : images réduites à 512 px (l'API ne lit pas au-delà)."""
+        return [low_detail_b64(b64) for b64 in images_b64] if detail == "low" else images_b64
 
-        return self._validate_resp(raw, prompt_data)
+    def render_chunk_requests(
+            self,
+            prompt_data: Dict,
+            images_b64: List[str],
+            max_fields_per_chunk: int | None,
+            ocr_context: str | None = None,
+            extra_context: str | None = None,
+            *,
+            retry: bool = False,
+    ) -> List[Dict] | None:
+        """
+        Corps de requête chat de chaque chunk, tels que _ask_chunks les
+        enverrait (mode Batch API). None si le découpage est abandonné.
+        """
+        chunks = self._split_chunks(
+            prompt_data, images_b64, max_fields_per_chunk, ocr_context, extra_context, retry=retry
+        )
+        if not chunks:
+            return None
+        return [
+            self.chat_body(
+                messages=build_prompt_messages(
+                    field_chunk, self._chunk_images(img_chunk, detail), ocr_context=ocr_context,
+                    extra_context=extra_context, fragments=self._fragments, detail=detail,
+                ),
+                n_tokens=10_000,
+                response_format={"type": "json_object"},
+            )
+            for field_chunk, img_chunk, detail in chunks
+        ]
 
     # ---------- appel GPT unique --------------------------------------
-    def _call_gpt(self, fields, images_b64, ocr_context, extra_context):
-        messages = build_prompt_messages(fields, images_b64, ocr_context=ocr_context, extra_context=extra_context)
+    async def _call_gpt(self, fields, images_b64, ocr_context, extra_context, *, detail: str | None = None,
+                        use_cache: bool = True):
+        if detail == "low":
+            # décodage / resize / ré-encodage cv2 hors de la boucle (partagée par les chunks en vol)
+            images_b64 = await asyncio.to_thread(self._chunk_images, images_b64, detail)
+        messages = build_prompt_messages(
+            fields, images_b64, ocr_context=ocr_context, extra_context=extra_context,
+            fragments=self._fragments, detail=detail,
+        )
+        response_format = {"type": "json_object"}
+
+        # même modèle + mêmes messages (temperature 0) → réponse relue sur disque
+        cache_key = None
+        if self._cache is not None and use_cache:
+            cache_key = self._cache.make_key(self._model_name, messages, response_format)
+            # SQLite hors de la boucle : ne bloque pas les autres requêtes en vol
+            cached = await asyncio.to_thread(self._cache.get, cache_key)
+            if cached is not None:
+                data = self.parse_json_response(cached)
+                if data:
+                    return data
 
         try:
-            response = self._chat(
+            response = await self._achat(
                 messages=messages,
                 n_tokens=10_000,
-                response_format={"type": "json_object"},
+                response_format=response_format,
             )
         except Exception as err:
             print("⚠️ first _chat() failed →", err)
-            response = self._chat(messages=messages, n_tokens=4_000)
+            response = await self._achat(messages=messages, n_tokens=4_000)
 
         raw_txt = response.choices[0].message.content
 
@@ -131,6 +274,9 @@ class SplitVisionAgent(BaseGPTAgent):
         if not data:  # vide ou mal parsé
             raise ValueError("GPT returned no valid JSON")
 
+        if cache_key is not None:
+            await asyncio.to_thread(self._cache.set, cache_key, raw_txt)
+
         return data
 
     # ---------- validation & helpers ----------------------------------
@@ -141,13 +287,17 @@ class SplitVisionAgent(BaseGPTAgent):
                 continue
 
             val = str(v).strip()
-            accepted = ref_prompt[k].get("accepted_values", [])
+            if self._template is not None and k in self._template.accepted:
+                accepted = self._template.accepted[k]  # frozenset, None = texte libre
+            else:
+                accepted = ref_prompt[k].get("accepted_values", [])
+                accepted = frozenset(accepted) if isinstance(accepted, list) and accepted else None
 
             if val == "N/A":
                 valid[k] = "N/A"
 
             # --- ① accepted = LISTE non vide  → contrôle strict
-            elif isinstance(accepted, list) and accepted:
+            elif accepted is not None:
                 if val in accepted:
                     valid[k] = val
                 else:
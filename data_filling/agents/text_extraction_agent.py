@@ -1,10 +1,13 @@
 # data_filling/agents/text_extraction_agent.py
 
 from __future__ import annotations
+import base64
+import hashlib
 from typing import List
 
 from .base_agent import BaseGPTAgent
 from data_filling.tools.extract_text import build_extract_text_messages
+from data_filling.utils.sqlite_cache import get_sqlite_cache
 
 
 class TextExtractionAgent(BaseGPTAgent):
@@ -14,15 +17,54 @@ class TextExtractionAgent(BaseGPTAgent):
     Utilise le helper _chat() du BaseGPTAgent, donc fonctionne
     indifféremment avec les modèles o-series (« o1 », « o3 », …)
     ou GPT-4 / GPT-4o / GPT-3.5-turbo.
+
+    Cache `ocr_cache` : la transcription ne dépend que de la 1ʳᵉ image
+    (cf. build_extract_text_messages) → clé = hash de ses octets décodés.
+    Sans section `ocr_cache`, ces clés vont dans `response_cache` (comme
+    avant l'ajout du cache dédié) : une conf existante reste en cache.
     """
 
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self._ocr_cache = get_sqlite_cache(config.get("ocr_cache")) or self._cache
+
+    # ------------------------------------------------------------------ #
+    #  Cache par image
+    # ------------------------------------------------------------------ #
+    def _ocr_key(self, images_b64: List[str]) -> str | None:
+        if self._ocr_cache is None or not images_b64:
+            return None
+        digest = hashlib.sha256(base64.b64decode(images_b64[0])).hexdigest()
+        return self._ocr_cache.make_key("ocr", self._model_name, digest)
+
+    def lookup(self, images_b64: List[str]) -> str | None:
+        """Transcription déjà connue pour cette image (None sinon)."""
+        key = self._ocr_key(images_b64)
+        return self._ocr_cache.get(key) if key else None
+
+    def remember(self, images_b64: List[str], text: str):
+        key = self._ocr_key(images_b64)
+        if key:
+            self._ocr_cache.set(key, text)
+
+    def render_request(self, images_b64: List[str]) -> dict:
+        """Corps de requête équivalent à extract() (mode Batch API)."""
+        return self.chat_body(
+            messages=build_extract_text_messages(images_b64), n_tokens=10000, temperature=0
+        )
+
     def extract(self, images_b64: List[str]) -> str:
-        messages = build_extract_text_messages(images_b64)
+        cached = self.lookup(images_b64)
+        if cached is not None:
+            return cached
 
+        messages = build_extract_text_messages(images_b64)
 
         # _chat() gère automatiquement max_tokens vs max_completion_tokens
         # et retire temperature si le modèle ne l’accepte pas.
         # et retire temperature si le modèle ne l’accepte pas.
         resp = self._chat(messages=messages, n_tokens=10000, temperature=0)
 
-        return resp.choices[0].message.content.strip()
+        text = resp.choices[0].message.content.strip()
+        self.remember(images_b64, text)
+        return text
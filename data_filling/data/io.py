@@ -1,7 +1,21 @@
 # data_filling/data/io.py
 
+import base64
 import os
-from data_filling.tools.video_to_frames import extract_keyframes_dynamic, extract_frames_regularly
+import numpy as np
+from data_filling.tools.frame_pruning import dhash, prune_similar
+from data_filling.tools.image_payload import encode_jpeg_budget, fit_to_tiles
+from data_filling.tools.video_to_frames import (
+    extract_keyframes_dynamic,
+    extract_frames_regularly,
+    extract_iframes,
+    keyframes_from_scores,
+    read_frames_segment,
+    regular_interval,
+    scene_scores_segment,
+    video_segments,
+    video_meta,
+)
 import cv2
 
 
@@ -17,17 +31,23 @@ def detect_media(path: str) -> str:
 import cv2
 
 def get_images_from_case(case_path, mode="dynamic"):
+    """case_path : chemins de médias, ou images déjà décodées (BGR, chemin en mémoire)."""
     if not case_path:
         raise ValueError("No input provided.")
 
     all_images = []
 
     for path in case_path:
+        if isinstance(path, np.ndarray):
+            all_images.append(path)
+            continue
         media_type = detect_media(path)
         if media_type == "video":
             print(f"🎥 Extracting frames from video: {path} (mode={mode})")
             if mode == "regular":
                 frames = extract_frames_regularly(path)
+            elif mode == "keyframes":
+                frames = extract_iframes(path)
             else:
                 frames = extract_keyframes_dynamic(path)
             all_images.extend(frames)
@@ -40,3 +60,131 @@ def get_images_from_case(case_path, mode="dynamic"):
                 print(f"⚠️ Could not read image: {path}")
 
     return all_images
+
+
+# ------------------------------------------------------------------ #
+#  Frames → JPEG base64 (éventuellement dans un pool de processus)
+# ------------------------------------------------------------------ #
+def encode_frame_b64(frame, payload: dict | None = None) -> str:
+    """
+    payload : {detail, max_bytes, snap_tiles} → frame ramenée à la grille
+    de tuiles du modèle et JPEG tenu sous max_bytes (cf. image_payload).
+    """
+    if not payload:
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        if not ok:
+            raise ValueError("Failed to encode frame.")
+        return base64.b64encode(buf).decode()
+    frame = fit_to_tiles(frame, payload.get("detail", "high"), snap=payload.get("snap_tiles", 0.1))
+    return base64.b64encode(encode_jpeg_budget(frame, payload.get("max_bytes"))).decode()
+
+
+def encode_media_b64(path: str, mode: str = "dynamic", signed: bool = False, payload: dict | None = None) -> list:
+    """
+    Un média → images base64. Fonction de module : exécutable en sous-processus.
+    signed=True : paires (base64, dHash) pour l'élagage côté parent.
+    """
+    return _encode_frames(get_images_from_case([path], mode=mode), signed, payload)
+
+
+def encode_segment_b64(path: str, start: int, stop: int | None, signed: bool = False,
+                       payload: dict | None = None, **select) -> list:
+    """Comme encode_media_b64, pour une tranche de vidéo (cf. read_frames_segment)."""
+    return _encode_frames(read_frames_segment(path, start, stop, **select), signed, payload)
+
+
+def _encode_frames(frames, signed: bool, payload: dict | None = None) -> list:
+    if signed:
+        return [(encode_frame_b64(f, payload), dhash(f)) for f in frames]
+    return [encode_frame_b64(f, payload) for f in frames]
+
+
+def _submit_media(pool, path: str, mode: str, signed: bool, segment_s, payload: dict | None = None):
+    """
+    Soumet un média au pool et renvoie une fonction qui collecte ses images.
+
+    Une vidéo plus longue que `segment_s` est découpée en tranches décodées
+    en parallèle ; en mode dynamic, les scores des tranches sont concaténés
+    et la sélection faite sur le clip entier, puis seules les frames
+    retenues sont relues, tranche par tranche. Résultat identique au
+    décodage séquentiel (qui sert de repli si les horodatages sont
+    irréguliers).
+    """
+    if isinstance(path, np.ndarray):  # déjà décodée : encodage JPEG seul
+        return pool.submit(_encode_frames, [path], signed, payload).result
+
+    segments = None
+    if mode in ("dynamic", "regular") and detect_media(path) == "video":
+        segments = video_segments(path, segment_s)
+    if not segments:
+        return pool.submit(encode_media_b64, path, mode, signed, payload).result
+
+    print(f"🎥 Extracting frames from video: {path} (mode={mode}, {len(segments)} segments)")
+    if mode == "regular":
+        interval = regular_interval(video_meta(path)[0])
+        futures = [
+            pool.submit(encode_segment_b64, path, start, stop, signed, payload, interval=interval)
+            for start, stop in segments
+        ]
+    else:
+        futures = [pool.submit(scene_scores_segment, path, start, stop) for start, stop in segments]
+
+    def collect() -> list:
+        try:
+            if mode == "dynamic":
+                selected = keyframes_from_scores(path, np.concatenate([fut.result() for fut in futures]))
+                parts = []
+                for start, stop in segments:
+                    indices = [i for i in selected if i >= start and (stop is None or i < stop)]
+                    if indices:
+                        parts.append(pool.submit(
+                            encode_segment_b64, path, indices[0], indices[-1] + 1, signed, payload, indices=indices
+                        ))
+            else:
+                parts = futures
+            return [img for fut in parts for img in fut.result()]
+        except (ValueError, IndexError) as e:
+            print(f"⚠️ Segmented decoding failed for {path} ({e}), decoding sequentially.")
+            return pool.submit(encode_media_b64, path, mode, signed, payload).result()
+
+    return collect
+
+
+def get_images_b64_from_case(case_path, mode="dynamic", pool=None, pruning=None, stats=None, segment_s=None,
+                             payload=None) -> list:
+    """
+    Comme get_images_from_case, mais renvoie directement les payloads
+    base64. Avec un pool, chaque média est décodé / encodé dans un
+    processus séparé : seul le texte base64 revient au parent. Les vidéos
+    de plus de `segment_s` secondes sont en plus découpées en tranches
+    (cf. _submit_media).
+
+    pruning : {max_hamming, max_frames} → retire les frames quasi
+    identiques (tous médias confondus) avant l'envoi au modèle.
+    stats (dict) reçoit le nombre de frames lues / écartées.
+    payload : taille / budget JPEG des images envoyées (cf. encode_frame_b64).
+    """
+    if not case_path:
+        raise ValueError("No input provided.")
+
+    if pool is None:
+        frames = get_images_from_case(case_path, mode=mode)
+        n_frames = len(frames)
+        if pruning:
+            keep = prune_similar([dhash(f) for f in frames], **pruning)
+            frames = [frames[i] for i in keep]
+        images = [encode_frame_b64(f, payload) for f in frames]
+    else:
+        collectors = [_submit_media(pool, path, mode, bool(pruning), segment_s, payload) for path in case_path]
+        images = []
+        for collect in collectors:  # ordre des médias conservé
+            images.extend(collect())
+        n_frames = len(images)
+        if pruning:
+            keep = prune_similar([sig for _, sig in images], **pruning)
+            images = [images[i][0] for i in keep]
+
+    if stats is not None:
+        stats["frames"] = n_frames
+        stats["dropped"] = n_frames - len(images)
+    return images
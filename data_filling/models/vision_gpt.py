@@ -1,17 +1,16 @@
 # data_filling/models/vision_gpt.py
 
-import copy
+import json
+import threading
+import time
 from typing import List
 
-import numpy as np
-from data_filling.data.io import get_images_from_case
-from data_filling.tools.template import (
-    load_template,
-    transform_template_for_prompt,
-    revert_prompt_response,
-)
-from data_filling.tools.normalization import normalize_output
+from data_filling.data.io import get_images_b64_from_case
+from data_filling.tools.frame_pruning import pruning_settings
+from data_filling.tools.media_pool import get_media_pool
+from data_filling.tools.template import load_template, CompiledTemplate
 from data_filling.agents import SplitVisionAgent, TextExtractionAgent
+from data_filling.utils.sqlite_cache import get_sqlite_cache
 
 
 class VisionGPTModel:
@@ -27,66 +26,139 @@ class VisionGPTModel:
     def __init__(self, conf: dict):
         self.conf = conf
 
-        # template maître (immuable)
+        # template maître (immuable), compilé une fois pour toutes
         self._template = load_template(conf["template_path"])
-        self._prompt_tpl_clean = transform_template_for_prompt(self._template)
+        self._compiled = CompiledTemplate(self._template)
 
         # Agents
-        self._split_agent = SplitVisionAgent(conf)
+        self._split_agent = SplitVisionAgent(conf, template=self._compiled)
         self._ocr_agent   = TextExtractionAgent(conf)
 
+        # valeurs + provenance par champ (hash du champ, modèle, date)
+        self._field_store = get_sqlite_cache(conf.get("field_store"))
+        self._incremental = bool(conf.get("incremental", False))
+        # frame_pruning validé dès la construction (erreur de conf = échec immédiat)
+        self._pruning = pruning_settings(conf.get("frame_pruning"))
+        # lecture / fusion / écriture d'une même clé sérialisées (verrous par tranche)
+        self._store_locks = [threading.Lock() for _ in range(64)]
+
     # ------------------------------------------------------------------ #
     #  Helpers internes
     # ------------------------------------------------------------------ #
-    def _images_to_b64(self, media_paths: List[str]) -> List[str]:
-        frames = get_images_from_case(
+    def _images_to_b64(self, media_paths: List[str], stats: dict | None = None) -> List[str]:
+        # media_workers > 0 : décodage / encodage dans un pool de processus
+        images_b64 = get_images_b64_from_case(
             media_paths,
             mode=self.conf.get("video_frame_strategy", "dynamic"),
+            pool=get_media_pool(self.conf.get("media_workers", 0)),
+            pruning=self._pruning,
+            stats=stats,
+            segment_s=self.conf.get("video_segment_s"),
+            payload=self.conf.get("image_payload"),
         )
-        if not frames:
+        if not images_b64:
             raise ValueError("No frames found.")
-        return [self._split_agent.encode_bgr_to_b64(f) for f in frames]
-
-    def _prepare_prompt_dict(self) -> tuple[dict, dict]:
-        """
-        Copie défensive du template ; sépare champs avec prompt_ai
-        et ceux à remplir par N/A.
-        """
-        wanted, na = {}, {}
-        for k, meta in copy.deepcopy(self._prompt_tpl_clean).items():
-            if {"prompt_ai", "accepted_values"} <= meta.keys():
-                wanted[k] = meta
-            else:
-                na[k] = "N/A"
-        return wanted, na
+        return images_b64
 
     # ------------------------------------------------------------------ #
     #  API publique
     # ------------------------------------------------------------------ #
-    def predict(self, media_paths: List[str], context: str | None = None) -> dict:
-        imgs_b64 = self._images_to_b64(media_paths)
+    @property
+    def template(self) -> CompiledTemplate:
+        return self._compiled
 
-        wanted, na_fields = self._prepare_prompt_dict()
+    def prompt_fields(self) -> tuple[dict, dict]:
+        """(champs à demander à GPT, champs remplis par N/A) — vues en lecture seule."""
+        return self._compiled.wanted, self._compiled.na_fields
 
-        ocr_ctx = None
-        if self.conf.get("add_transcription", False):
-            ocr_ctx = self._ocr_agent.extract(imgs_b64) or None
+    def encode_media(self, media_paths: List[str], stats: dict | None = None) -> List[str]:
+        """Médias (images / vidéos) → liste d'images JPEG base64 (stats : frames lues / écartées)."""
+        return self._images_to_b64(media_paths, stats=stats)
 
-        validated = self._split_agent.predict_fields(
-            wanted,
-            imgs_b64,
-            ocr_context=ocr_ctx,
-            extra_context=context,  # 🆕 Ajout du paramètre
-            double_check=self.conf.get("double_check", False),
-            max_fields_per_chunk=self.conf.get("max_fields_per_chunk"),
-        )
+    def predict(self, media_paths: List[str], context: str | None = None) -> dict:
+        return self.predict_b64(self.encode_media(media_paths), context=context)
 
-        validated.update(na_fields)
+    def predict_b64(self, imgs_b64: List[str], context: str | None = None) -> dict:
+        """
+        Prédiction à partir d'images déjà encodées (cf. encode_media).
 
-        # ---------- revert + normalisation protégés -----------------
+        Avec `field_store` + `incremental`, seuls les champs ajoutés ou
+        modifiés depuis le dernier run (ou extraits avec un autre modèle)
+        sont redemandés pour ces mêmes médias + contexte.
+        """
+        wanted, na_fields = self.prompt_fields()
+
+        store_key, previous = None, {}
+        if self._field_store is not None:
+            store_key = self._field_store.make_key(imgs_b64, context or "")
+            if self._incremental:
+                previous = self._reusable_fields(store_key)
+        todo = {k: meta for k, meta in wanted.items() if k not in previous}
+        if previous:
+            print(f"♻️ {len(previous)}/{len(wanted)} fields reused, {len(todo)} to extract")
+
+        validated = dict(previous)
+        if todo:
+            ocr_ctx = None
+            if self.conf.get("add_transcription", False):
+                ocr_ctx = self._ocr_agent.extract(imgs_b64) or None
+
+            answered: set = set()
+            fresh = self._split_agent.predict_fields(
+                todo,
+                imgs_b64,
+                ocr_context=ocr_ctx,
+                extra_context=context,  # 🆕 Ajout du paramètre
+                double_check=self.conf.get("double_check", False),
+                max_fields_per_chunk=self.conf.get("max_fields_per_chunk"),
+                answered=answered,
+            )
+            validated.update(fresh)
+            if store_key is not None:
+                # N/A de remplissage non stockés : ces champs seront redemandés
+                self._save_fields(store_key, {k: v for k, v in fresh.items() if k in answered})
+
+        return self.finalize_prediction(validated, na_fields)
+
+    # ---------- provenance par champ ------------------------------------
+    def _load_fields(self, store_key: str) -> dict:
+        raw = self._field_store.get(store_key)
+        return json.loads(raw) if raw else {}
+
+    def _reusable_fields(self, store_key: str) -> dict:
+        """Valeurs stockées dont le champ (hash) et le modèle n'ont pas changé."""
+        hashes = self._compiled.field_hashes
+        model = self._split_agent._model_name
+        return {
+            k: entry["value"]
+            for k, entry in self._load_fields(store_key).items()
+            if k in hashes and entry.get("hash") == hashes[k] and entry.get("model") == model
+        }
+
+    def _save_fields(self, store_key: str, fresh: dict):
+        if not fresh:
+            return
+        hashes = self._compiled.field_hashes
+        now = time.strftime("%Y-%m-%dT%H:%M:%S")
+        with self._store_locks[hash(store_key) % len(self._store_locks)]:
+            entries = {k: v for k, v in self._load_fields(store_key).items() if k in hashes}
+            for k, value in fresh.items():
+                if k in hashes:
+                    entries[k] = {
+                        "value": value,
+                        "hash": hashes[k],
+                        "model": self._split_agent._model_name,
+                        "ts": now,
+                    }
+            self._field_store.set(store_key, json.dumps(entries, ensure_ascii=False))
+
+    def finalize_prediction(self, validated: dict, na_fields: dict) -> dict:
+        """Champs validés (clés normalisées) → colonnes du template."""
+        validated = {**validated, **na_fields}
+
+        # ---------- revert + normalisation protégés (template précompilé) -----------------
         try:
-            final = revert_prompt_response(validated, self._template)
-            final = normalize_output(final, self._template)
+            final = self._compiled.to_row(validated)
             if not isinstance(final, dict):
                 raise TypeError("Final result is not a dict")
         except Exception as e:
@@ -0,0 +1,161 @@
+# data_filling/pipelines/dedup.py
+
+import base64
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+from data_filling.tools.frame_pruning import dhash, hamming
+
+
+def dhash_b64(image_b64: str) -> tuple[int, str]:
+    """
+    Signature perceptuelle d'une image JPEG base64 : dHash 64 bits
+    (gradients en niveaux de gris) + teinte moyenne grossière (le dHash seul
+    confond deux packshots identiques de couleurs différentes). Quasi stable
+    malgré un ré-encodage, un redimensionnement ou des métadonnées
+    différentes : comparer les dHash à distance de Hamming près.
+    """
+    buf = np.frombuffer(base64.b64decode(image_b64), dtype=np.uint8)
+    img = cv2.imdecode(buf, cv2.IMREAD_REDUCED_COLOR_4)
+    if img is None:
+        raise ValueError("Failed to decode image for dHash.")
+    tint = "".join(str(int(c) // 64) for c in img.reshape(-1, 3).mean(axis=0))
+    return dhash(img), tint
+
+
+class MediaDeduper:
+    """
+    Prédit une seule fois par jeu de médias identique (+ même contexte) et
+    partage le résultat entre toutes les lignes concernées.
+
+    Les images base64 sont ré-encodées depuis les pixels décodés
+    (encode_frame_b64) : deux fichiers aux pixels identiques donnent les
+    mêmes payloads, quels que soient l'URL, le nom ou les métadonnées.
+    mode="perceptual" rapproche un jeu de médias d'un jeu déjà vu (même
+    contexte, même nombre d'images, mêmes teintes) dont chaque dHash est à
+    au plus `max_hamming` bits (ré-encodages, tailles différentes).
+
+    Seuls les `max_entries` jeux les plus récemment utilisés sont gardés
+    (LRU, prédictions en cours exclues) : la mémoire ne croît pas avec
+    l'entrée. Si la prédiction d'origine échoue, la ligne suivante retente.
+    """
+
+    def __init__(self, mode: str = "exact", max_hamming: int = 6, max_entries: int | None = 10_000):
+        if mode not in ("exact", "perceptual"):
+            raise ValueError(f"Unknown dedup_media mode: {mode}")
+        self.mode = mode
+        self.max_hamming = int(max_hamming)
+        self.max_entries = int(max_entries) if max_entries else None
+        self.rows = 0
+        self.unique = 0
+        self._lock = threading.Lock()
+        self._results: OrderedDict = OrderedDict()
+        # perceptual : (contexte, nb d'images) → {clé : signatures triées}
+        self._signatures: dict = {}
+
+    def key(self, images_b64: list, context: str | None = None) -> str:
+        if self.mode == "perceptual":
+            return self._perceptual_key(sorted(dhash_b64(b64) for b64 in images_b64), context or "")
+        hashes = [hashlib.sha256(b64.encode("ascii")).hexdigest() for b64 in images_b64]
+        # jeu de médias : l'ordre des fichiers ne compte pas
+        payload = json.dumps([sorted(hashes), context or ""], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    # ---------- perceptual : appariement à distance de Hamming ----------
+    def _matches(self, sigs: list, known: list) -> bool:
+        """Chaque image a une homologue distincte (même teinte, dHash proche)."""
+        free = list(known)
+        for h, tint in sigs:
+            for i, (h2, tint2) in enumerate(free):
+                if tint == tint2 and hamming(h, h2) <= self.max_hamming:
+                    del free[i]
+                    break
+            else:
+                return False
+        return True
+
+    def _perceptual_key(self, sigs: list, context: str) -> str:
+        bucket = (context, len(sigs))
+        with self._lock:
+            known = self._signatures.setdefault(bucket, {})
+            for key, other in known.items():
+                if self._matches(sigs, other):
+                    return key
+            payload = json.dumps([[f"{h:016x}-{t}" for h, t in sigs], context], ensure_ascii=False)
+            key = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+            known[key] = sigs
+            return key
+
+    def _forget(self, key: str):
+        """Retire `key` (appelé sous self._lock)."""
+        self._results.pop(key, None)
+        for bucket, known in list(self._signatures.items()):
+            if known.pop(key, None) is not None:
+                if not known:
+                    del self._signatures[bucket]
+                break
+
+    def _evict(self):
+        """LRU : retire les plus anciens résultats terminés au-delà de max_entries."""
+        if not self.max_entries or len(self._results) <= self.max_entries:
+            return
+        for key in [k for k, fut in self._results.items() if fut.done()]:
+            if len(self._results) <= self.max_entries:
+                break
+            self._forget(key)
+
+    def run(self, key: str, predict) -> dict:
+        """predict() pour la 1ʳᵉ ligne de `key`, copie du résultat pour les suivantes."""
+        with self._lock:
+            self.rows += 1
+        while True:
+            with self._lock:
+                fut = self._results.get(key)
+                owner = fut is None
+                if owner:
+                    fut = Future()
+                    self._results[key] = fut
+                    self.unique += 1
+                    self._evict()
+                else:
+                    self._results.move_to_end(key)
+            if not owner:
+                try:
+                    return dict(fut.result())
+                except Exception:
+                    continue  # l'original a échoué : on retente nous-mêmes
+
+            try:
+                result = predict()
+            except Exception as e:
+                with self._lock:
+                    self._forget(key)
+                    self.unique -= 1
+                fut.set_exception(e)
+                raise
+            fut.set_result(result)
+            return dict(result)
+
+    def report(self) -> str:
+        return (
+            f"♊ Media dedup ({self.mode}): {self.rows} rows predicted from "
+            f"{self.unique} unique media sets ({self.rows - self.unique} reused)"
+        )
+
+
+def get_deduper(conf: dict) -> MediaDeduper | None:
+    """`dedup_media` : null (désactivé) | exact | perceptual."""
+    mode = conf.get("dedup_media")
+    if not mode:
+        return None
+    return MediaDeduper(
+        mode,
+        max_hamming=conf.get("dedup_max_hamming", 6),
+        max_entries=conf.get("dedup_max_entries", 10_000),
+    )
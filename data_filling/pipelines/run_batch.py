@@ -0,0 +1,405 @@
+# data_filling/pipelines/run_batch.py
+
+import json
+import os
+import time
+
+from data_filling.agents import SplitVisionAgent, TextExtractionAgent
+from data_filling.models import get_model
+from .run_from_csv import iter_csv_jobs, build_csv_media_stages
+from .run_from_folder import iter_folder_jobs, build_folder_media_stages
+from .streaming import run_stages, append_jsonl, finalize_csv, cleanup_files, load_column_order
+
+_TERMINAL = {"completed", "failed", "expired", "cancelled"}
+
+
+class BatchRun:
+    """
+    Exécution hors-ligne via l'API Batch d'OpenAI, reprenable.
+
+    Chaque étape du mode temps réel devient un « round » = un ou plusieurs
+    batches (découpés selon les limites de taille de l'API) :
+        ocr → main (passe 1, + passe 2 si double_check) → retry
+            → conflict → conflict_retry (double_check seulement)
+    Tout l'état (lignes préparées, ids de fichiers / batches, réponses
+    validées) vit dans `work_dir/state.json` : relancer la même config
+    reprend là où le process s'est arrêté, sans resoumettre un batch.
+    """
+
+    def __init__(self, conf: dict):
+        self.conf = conf
+        opts = conf.get("batch") or {}
+        self.work_dir = opts.get("work_dir") or os.path.splitext(conf["output_path"])[0] + "_batch"
+        self.poll_interval = float(opts.get("poll_interval", 60))
+        self.completion_window = opts.get("completion_window", "24h")
+        self.max_requests = int(opts.get("max_requests_per_batch", 50_000))
+        self.max_bytes = int(opts.get("max_bytes_per_batch", 190 * 1024 * 1024))
+
+        self.from_csv = "dataset_link" in conf
+        self.double_check = conf.get("double_check", False)
+        self.max_fields_per_chunk = conf.get("max_fields_per_chunk")
+
+        self.model = get_model(conf)
+        self.agent = SplitVisionAgent(conf, template=self.model.template)
+        self.ocr_agent = TextExtractionAgent(conf)
+        self.client = self.agent.client
+        self.wanted, self.na_fields = self.model.prompt_fields()
+
+        os.makedirs(os.path.join(self.work_dir, "media"), exist_ok=True)
+        self.state_path = os.path.join(self.work_dir, "state.json")
+        self.state = self._load_state()
+
+    # ------------------------------------------------------------------ #
+    #  État persistant
+    # ------------------------------------------------------------------ #
+    def _load_state(self) -> dict:
+        if os.path.isfile(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            print(f"♻️ Resuming batch run from {self.state_path}")
+            return state
+        return {"prepared": False, "rows": {}, "rounds": {}}
+
+    def _save_state(self):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp, self.state_path)
+
+    def _live_rows(self):
+        for key, row in sorted(self.state["rows"].items(), key=lambda kv: kv[1]["order"]):
+            if not row.get("error"):
+                yield key, row
+
+    def _load_images(self, row: dict) -> list:
+        with open(os.path.join(self.work_dir, row["media"]), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    # ------------------------------------------------------------------ #
+    #  0. Préparation : médias → images base64 sur disque
+    # ------------------------------------------------------------------ #
+    def prepare(self):
+        if self.state["prepared"]:
+            return
+
+        if self.from_csv:
+            jobs, stages = iter_csv_jobs(self.conf), build_csv_media_stages(self.conf, self.model)
+        else:
+            jobs, stages = iter_folder_jobs(self.conf), build_folder_media_stages(self.conf, self.model)
+
+        rows = self.state["rows"]
+
+        def _todo():
+            for order, job in enumerate(jobs):
+                job["order"] = order
+                if str(job["id"]) not in rows:
+                    yield job
+
+        n_new = 0
+        for job, ok in run_stages(_todo(), stages, queue_size=self.conf.get("stage_queue_size", 8)):
+            cleanup_files(job["tmp_files"])
+            if not ok:
+                continue
+            key = str(job["id"])
+            media = os.path.join("media", f"{job['order']:08d}.json")
+            with open(os.path.join(self.work_dir, media), "w", encoding="utf-8") as f:
+                json.dump(job["images_b64"], f)
+            rows[key] = {
+                "id": job["id"] if not self.from_csv else int(job["id"]),
+                "order": job["order"],
+                "link": job.get("url"),
+                "context": job.get("context"),
+                "media": media,
+                "ocr": None,
+                "passes": {},
+            }
+            n_new += 1
+            if n_new % 50 == 0:
+                self._save_state()
+
+        self.state["prepared"] = True
+        self._save_state()
+        print(f"📦 {len(rows)} rows prepared")
+
+    # ------------------------------------------------------------------ #
+    #  Round générique : build JSONL → submit → poll → résultats
+    # ------------------------------------------------------------------ #
+    def _run_round(self, name: str, requests_for_row, on_results):
+        """
+        requests_for_row(key, row) → {tag: [corps de requête]} (vide = rien)
+        on_results(key, row, {tag: [contenu | None]}) met à jour la ligne.
+        """
+        rounds = self.state["rounds"]
+        rnd = rounds.get(name)
+        if rnd and rnd["status"] == "done":
+            return
+
+        if not rnd:
+            rnd = self._build_round(name, requests_for_row)
+            rounds[name] = rnd
+            self._save_state()
+
+        if rnd["parts"]:
+            self._submit_and_wait(name, rnd)
+        results = self._read_results(rnd)
+
+        for key, tags in rnd["requests"].items():
+            row = self.state["rows"][key]
+            grouped = {
+                tag: [results.get(f"{key}|{tag}|{i}") for i in range(n)]
+                for tag, n in tags.items()
+            }
+            try:
+                on_results(key, row, grouped)
+            except Exception as e:
+                print(f"❌ {row['id']} ({name}): {e}")
+                row["error"] = str(e)
+
+        rnd["status"] = "done"
+        self._save_state()
+
+    def _build_round(self, name: str, requests_for_row) -> dict:
+        parts, requests = [], {}
+        out, n_req, n_bytes = None, 0, 0
+
+        for key, row in self._live_rows():
+            try:
+                per_tag = requests_for_row(key, row) or {}
+            except Exception as e:
+                print(f"❌ {row['id']} ({name}): {e}")
+                row["error"] = str(e)
+                continue
+            for tag, bodies in per_tag.items():
+                requests.setdefault(key, {})[tag] = len(bodies)
+                for i, body in enumerate(bodies):
+                    line = json.dumps({
+                        "custom_id": f"{key}|{tag}|{i}",
+                        "method": "POST",
+                        "url": "/v1/chat/completions",
+                        "body": body,
+                    }) + "\n"
+                    size = len(line.encode("utf-8"))
+                    if out is None or n_req >= self.max_requests or n_bytes + size > self.max_bytes:
+                        if out is not None:
+                            out.close()
+                        path = os.path.join(self.work_dir, f"{name}_{len(parts):03d}.input.jsonl")
+                        parts.append({"input": path})
+                        out, n_req, n_bytes = open(path, "w", encoding="utf-8"), 0, 0
+                    out.write(line)
+                    n_req += 1
+                    n_bytes += size
+        if out is not None:
+            out.close()
+
+        n_total = sum(sum(t.values()) for t in requests.values())
+        print(f"🗂️ Round '{name}': {n_total} requests in {len(parts)} batch file(s)")
+        return {"status": "submitted", "parts": parts, "requests": requests}
+
+    def _submit_and_wait(self, name: str, rnd: dict):
+        for part in rnd["parts"]:
+            if not part.get("file_id"):
+                with open(part["input"], "rb") as f:
+                    part["file_id"] = self.client.files.create(file=f, purpose="batch").id
+                self._save_state()
+            if not part.get("batch_id"):
+                part["batch_id"] = self.client.batches.create(
+                    input_file_id=part["file_id"],
+                    endpoint="/v1/chat/completions",
+                    completion_window=self.completion_window,
+                ).id
+                self._save_state()
+                print(f"🚀 Batch submitted ({name}) → {part['batch_id']}")
+
+        while True:
+            pending = [p for p in rnd["parts"] if not p.get("done")]
+            for part in pending:
+                batch = self.client.batches.retrieve(part["batch_id"])
+                if batch.status not in _TERMINAL:
+                    counts = batch.request_counts
+                    done = f"{counts.completed}/{counts.total}" if counts else "?"
+                    print(f"⏳ {part['batch_id']} ({name}): {batch.status} {done}")
+                    continue
+                if batch.status != "completed":
+                    print(f"⚠️ {part['batch_id']} ({name}) ended with status '{batch.status}'")
+                part["output"] = part["input"].replace(".input.", ".output.")
+                with open(part["output"], "wb") as f:
+                    for file_id in (batch.output_file_id, batch.error_file_id):
+                        if file_id:
+                            f.write(self.client.files.content(file_id).content)
+                part["done"] = True
+                self._save_state()
+            if all(p.get("done") for p in rnd["parts"]):
+                return
+            time.sleep(self.poll_interval)
+
+    @staticmethod
+    def _read_results(rnd: dict) -> dict:
+        """custom_id → contenu texte de la réponse (absent si erreur)."""
+        results = {}
+        for part in rnd["parts"]:
+            if not part.get("output") or not os.path.isfile(part["output"]):
+                continue
+            with open(part["output"], "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    rec = json.loads(line)
+                    resp = rec.get("response") or {}
+                    if resp.get("status_code") != 200:
+                        continue
+                    try:
+                        results[rec["custom_id"]] = resp["body"]["choices"][0]["message"]["content"]
+                    except (KeyError, IndexError, TypeError):
+                        pass
+        return results
+
+    # ------------------------------------------------------------------ #
+    #  Rounds métier (mêmes règles que SplitVisionAgent.predict_fields)
+    # ------------------------------------------------------------------ #
+    def _pass_requests(self, row: dict, tag: str, keys: list, *, retry: bool) -> dict:
+        if not keys:
+            return {}
+        fields = {k: self.wanted[k] for k in keys}
+        bodies = self.agent.render_chunk_requests(
+            fields,
+            self._load_images(row),
+            self.max_fields_per_chunk,
+            row["ocr"],
+            row["context"],
+            retry=retry,
+        )
+        if bodies is None:  # découpage abandonné → N/A (cf. _ask_chunks)
+            validated = {k: "N/A" for k in keys}
+            if retry:
+                row["passes"][tag]["validated"].update(validated)
+                row["passes"][tag]["invalid"] = []
+            else:
+                row["passes"][tag] = {"keys": keys, "validated": validated, "invalid": []}
+            return {}
+        if not retry:
+            row["passes"][tag] = {"keys": keys, "validated": {}, "invalid": []}
+        return {tag: bodies}
+
+    def _apply_pass(self, row: dict, grouped: dict, *, retry: bool):
+        for tag, contents in grouped.items():
+            p = row["passes"][tag]
+            keys = p["invalid"] if retry else p["keys"]
+            raw = {}
+            for content in contents:
+                data = self.agent.parse_json_response(content) if content else {}
+                if not data:
+                    raise ValueError("GPT returned no valid JSON")
+                raw.update(data)
+            validated, invalid = self.agent._validate_resp(raw, {k: self.wanted[k] for k in keys})
+            if retry:
+                p["validated"].update(validated)
+                p["invalid"] = []
+            else:
+                p["validated"], p["invalid"] = validated, list(invalid)
+
+    def _ocr_round(self):
+        def requests_for_row(key, row):
+            images = self._load_images(row)
+            cached = self.ocr_agent.lookup(images)
+            if cached is not None:  # image déjà transcrite : pas de requête
+                row["ocr"] = cached or None
+                return {}
+            return {"ocr": [self.ocr_agent.render_request(images)]}
+
+        def on_results(key, row, grouped):
+            content = grouped["ocr"][0]
+            if content is None:
+                raise ValueError("OCR request failed")
+            self.ocr_agent.remember(self._load_images(row), content.strip())
+            row["ocr"] = content.strip() or None
+
+        self._run_round("ocr", requests_for_row, on_results)
+
+    def _main_rounds(self):
+        tags = ["p1", "p2"] if self.double_check else ["p1"]
+
+        def main_requests(key, row):
+            out = {}
+            for tag in tags:
+                out.update(self._pass_requests(row, tag, list(self.wanted), retry=False))
+            return out
+
+        def retry_requests(key, row):
+            out = {}
+            for tag in tags:
+                out.update(self._pass_requests(row, tag, row["passes"][tag]["invalid"], retry=True))
+            return out
+
+        self._run_round("main", main_requests, lambda k, r, g: self._apply_pass(r, g, retry=False))
+        self._run_round("retry", retry_requests, lambda k, r, g: self._apply_pass(r, g, retry=True))
+
+    def _conflict_rounds(self):
+        for _, row in self._live_rows():
+            if "conflicts" not in row:
+                agreed, conflicts = self.agent._compare(
+                    row["passes"]["p1"]["validated"], row["passes"]["p2"]["validated"], self.wanted
+                )
+                row["agreed"], row["conflicts"] = agreed, list(conflicts)
+        self._save_state()
+
+        self._run_round(
+            "conflict",
+            lambda k, r: self._pass_requests(r, "c", r["conflicts"], retry=False),
+            lambda k, r, g: self._apply_pass(r, g, retry=False),
+        )
+        self._run_round(
+            "conflict_retry",
+            lambda k, r: self._pass_requests(r, "c", r["passes"].get("c", {}).get("invalid", []), retry=True),
+            lambda k, r, g: self._apply_pass(r, g, retry=True),
+        )
+
+    # ------------------------------------------------------------------ #
+    #  Exécution complète
+    # ------------------------------------------------------------------ #
+    def run(self):
+        self.prepare()
+        if self.conf.get("add_transcription", False):
+            self._ocr_round()
+        self._main_rounds()
+        if self.double_check:
+            self._conflict_rounds()
+        self.finalize()
+
+    def _final_fields(self, row: dict) -> dict:
+        if not self.double_check:
+            validated = row["passes"]["p1"]["validated"]
+        else:
+            validated = dict(row["agreed"])
+            validated.update(row["passes"].get("c", {}).get("validated", {}))
+        return self.agent._fill_na(self.wanted, validated)
+
+    def finalize(self):
+        out_csv = self.conf["output_path"]
+        os.makedirs(os.path.dirname(out_csv), exist_ok=True)
+        staging = out_csv + ".staging.jsonl"
+        cleanup_files([staging])
+        link_column_name = self.conf.get("link_column_name", "Link to Asset")
+
+        for _, row in self._live_rows():
+            pred = self.model.finalize_prediction(self._final_fields(row), self.na_fields)
+            if self.from_csv:
+                pred = {link_column_name: row["link"], **pred}
+            else:
+                pred["row_id"] = row["id"]
+            append_jsonl(staging, pred)
+
+        if self.from_csv:
+            n_rows = finalize_csv(staging, out_csv, self.conf, ordered_columns=load_column_order(self.conf))
+        else:
+            n_rows = finalize_csv(staging, out_csv, self.conf, index_col="row_id")
+        cleanup_files([staging])
+
+        if n_rows:
+            print(f"✅ saved → {out_csv}")
+        else:
+            print("⚠️ No predictions generated.")
+
+
+def run_pipeline_batch(conf: dict):
+    """Pipeline Batch API (CSV ou dossier), reprenable via batch.work_dir."""
+    BatchRun(conf).run()
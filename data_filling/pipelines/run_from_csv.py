@@ -1,57 +1,87 @@
 import os
 import pandas as pd
+from data_filling.agents.rate_limiter import get_rate_limiter
+from data_filling.data.io import detect_media
 from data_filling.models import get_model
-from data_filling.tools.post_rules import apply_logic_rules
-from .tool_pipeline import download_image_tmp, convert_png_to_jpg, optimize_image
-
-
-def run_pipeline_csv(conf: dict):
-    # 📌 Charge modèle
-    model = get_model(conf)
-
-    # 📌 Config de base
+from data_filling.tools.media_pool import get_media_pool, run_cached, run_in_pool
+from data_filling.utils.file_cache import get_file_cache
+from data_filling.utils.sqlite_cache import get_sqlite_cache
+from .dedup import get_deduper
+from .streaming import (
+    Stage, Journal, run_stages, cleanup_files, load_column_order,
+)
+from .tool_pipeline import download_image_cached, convert_png_to_jpg, optimize_image, load_image_array
+
+
+def iter_csv_jobs(conf: dict):
+    """
+    Un job par ligne du CSV source (lu par blocs : l'entrée n'est jamais
+    chargée en entier), dans la limite de nb_max.
+    """
     csv_path = conf["dataset_link"]["path"]
     url_column = conf["dataset_link"]["column"].strip()
     context_column = conf["dataset_link"].get("column_context", "").strip()  # 🆕
-    out_csv = conf["output_path"]
     nb_max = conf.get("nb_max")
-    convert_png = conf.get("convert_png", False)
-    use_optimize = conf.get("optimize_image", False)
-    save_as_jpeg = conf.get("save_as_jpeg", True)
-    link_column_name = conf.get("link_column_name", "Link to Asset")
-
-    os.makedirs(os.path.dirname(out_csv), exist_ok=True)
-
-    # 📌 Charge CSV source
-    df = pd.read_csv(csv_path)
-    if nb_max:
-        df = df.head(nb_max)
 
-    preds = []
-    tmp_files = []
+    n = 0
+    for df in pd.read_csv(csv_path, chunksize=1000):
+        for idx, row in df.iterrows():
+            if nb_max and n >= nb_max:
+                return
+            n += 1
+            context_text = None  # 🆕
+            if context_column and context_column in df.columns:
+                context_text = str(row[context_column]).strip() if not pd.isna(row[context_column]) else None
+            yield {"id": idx, "url": row[url_column], "context": context_text, "tmp_files": []}
 
-    for idx, row in df.iterrows():
-        url = row[url_column]
-        context_text = None  # 🆕
-        if context_column and context_column in df.columns:
-            context_text = str(row[context_column]).strip() if not pd.isna(row[context_column]) else None
 
-        print(f"\n========== ROW {idx} ==========")
-
-        # 1️⃣ Téléchargement
+def build_csv_media_stages(conf: dict, model) -> list:
+    """Étages fetch → preprocess → encode : remplit job["images_b64"]."""
+    convert_png = conf.get("convert_png", False)
+    use_optimize = conf.get("optimize_image", False)
+    save_as_jpeg = conf.get("save_as_jpeg", True)
+    fetch_workers = int(conf.get("download_prefetch", 4) or 1)
+    max_conn_host = int(conf.get("download_connections_per_host", 4) or 1)
+    media_pool = get_media_pool(conf.get("media_workers", 0))
+    media_cache = get_file_cache(conf.get("media_cache"))
+    url_cache = get_file_cache(conf.get("download_cache"))
+    in_memory = conf.get("in_memory_media", False)
+
+    # 1️⃣ Téléchargement
+    def fetch(job):
         try:
-            img_path = download_image_tmp(url, verify_ssl=False)
-            tmp_files.append(img_path)
-            print("✓ Downloaded", img_path)
+            source, temporary = download_image_cached(
+                job["url"], url_cache, in_memory=in_memory, verify_ssl=False, max_connections_per_host=max_conn_host
+            )
         except Exception as e:
-            print(f"❌ download error: {e}")
-            continue
+            print(f"❌ ROW {job['id']} download error: {e}")
+            return None
+        if isinstance(source, bytes):  # image en mémoire
+            job["data"] = source
+            print(f"✓ ROW {job['id']} downloaded ({len(source)} bytes in memory)")
+            return job
+        if temporary:
+            job["tmp_files"].append(source)
+        job["path"] = source
+        print(f"✓ ROW {job['id']} downloaded", source)
+        return job
+
+    def preprocess(job):
+        if "data" in job:
+            # 2️⃣+3️⃣ en mémoire : un seul décodage, aucun fichier
+            job["image"] = decode_in_memory(job["id"], job.pop("data"))
+            return job
+
+        img_path = job["path"]
+        if detect_media(img_path) == "video":  # frames extraites à l'étage encode
+            return job
 
         # 2️⃣ Conversion PNG → JPG
         if convert_png and img_path.lower().endswith(".png"):
             try:
-                img_path = convert_png_to_jpg(img_path)
-                tmp_files.append(img_path)
+                img_path, temporary = run_cached(media_cache, media_pool, convert_png_to_jpg, img_path)
+                if temporary:
+                    job["tmp_files"].append(img_path)
                 print("✓ PNG converted →", img_path)
             except Exception as e:
                 print(f"⚠️ convert error: {e}")
@@ -59,58 +89,114 @@ def run_pipeline_csv(conf: dict):
         # 3️⃣ Optimisation
         if use_optimize:
             try:
-                img_path = optimize_image(img_path, save_as_jpeg=save_as_jpeg)
-                tmp_files.append(img_path)
+                img_path, temporary = run_cached(
+                    media_cache, media_pool, optimize_image, img_path, save_as_jpeg=save_as_jpeg
+                )
+                if temporary:
+                    job["tmp_files"].append(img_path)
                 print("✓ Optimized →", img_path)
             except Exception as e:
                 print(f"⚠️ optimize error: {e}")
 
-        # 4️⃣ Prédiction
+        job["path"] = img_path
+        return job
+
+    def decode_in_memory(row_id, data: bytes):
         try:
-            pred = model.predict([img_path], context=context_text)  # 🆕 Ajout du contexte
-            if not isinstance(pred, dict):
-                raise ValueError("model.predict returned non-dict")
+            return run_in_pool(
+                media_pool, load_image_array, data,
+                convert_png=convert_png, optimize=use_optimize, save_as_jpeg=save_as_jpeg,
+            )
+        except Exception as e:
+            if not (convert_png or use_optimize):
+                raise
+            print(f"⚠️ ROW {row_id} preprocess error: {e}")
+            return run_in_pool(media_pool, load_image_array, data)
+
+    def encode(job):
+        stats = {}
+        media = [job.pop("image")] if "image" in job else [job["path"]]
+        job["images_b64"] = model.encode_media(media, stats=stats)
+        if stats.get("dropped"):
+            print(f"✂️ ROW {job['id']}: {stats['dropped']}/{stats['frames']} near-duplicate frames dropped")
+        cleanup_files(job["tmp_files"])
+        job["tmp_files"] = []
+        return job
+
+    return [
+        Stage("fetch", fetch, fetch_workers),
+        Stage("preprocess", preprocess, conf.get("preprocess_workers", 1)),
+        Stage("encode", encode, conf.get("encode_workers", 1)),
+    ]
 
-            # ✅ Ajoute le lien complet en premier
-            pred = {link_column_name: url, **pred}
 
-            preds.append(pred)
-            print("✓ Prediction OK")
-        except Exception as e:
-            print(f"❌ predict error: {e}")
-
-    # 5️⃣ Sortie CSV
-    if preds:
-        df_pred = pd.DataFrame(preds)
-
-        # 🔎 Post-rules éventuelles
-        if conf.get("logic_rules_path"):
-            df_pred = apply_logic_rules(df_pred, conf["logic_rules_path"])
-
-        # 🔎 Colonnes dans l'ordre voulu (optionnel)
-        ordered_columns = None
-        if conf.get("column_order"):
-            ordered_columns = conf["column_order"]
-        elif conf.get("column_order_path"):
-            with open(conf["column_order_path"]) as f:
-                ordered_columns = [line.strip() for line in f if line.strip()]
-
-        if ordered_columns:
-            for col in ordered_columns:
-                if col not in df_pred.columns:
-                    df_pred[col] = ""  # Ajoute colonne vide si manquante
-            df_pred = df_pred[ordered_columns]
-
-        # ✅ Sauvegarde CSV final
-        df_pred.to_csv(out_csv, index=False, encoding="utf-8-sig")
-        print(f"\n✅ Saved → {out_csv}")
+def run_pipeline_csv(conf: dict):
+    """
+    Pipeline CSV en flux : fetch (téléchargement, `download_prefetch`
+    threads) → preprocess → encode → predict (`max_workers`) → écriture
+    incrémentale. Mémoire constante quel que soit le nombre de lignes.
+    """
+    # 📌 Charge modèle
+    model = get_model(conf)
 
+    # 📌 Config de base
+    out_csv = conf["output_path"]
+    link_column_name = conf.get("link_column_name", "Link to Asset")
+
+    os.makedirs(os.path.dirname(out_csv), exist_ok=True)
+    # journal des lignes terminées (resume: true → reprise après crash)
+    journal = Journal(out_csv, resume=conf.get("resume", False))
+
+    # 4️⃣ Prédiction
+    # même image (+ même contexte) sur plusieurs lignes → une seule prédiction
+    deduper = get_deduper(conf)
+
+    def predict(job):
+        imgs_b64 = job.pop("images_b64")
+        if deduper is None:
+            pred = model.predict_b64(imgs_b64, context=job["context"])  # 🆕 Ajout du contexte
+        else:
+            pred = deduper.run(
+                deduper.key(imgs_b64, job["context"]),
+                lambda: model.predict_b64(imgs_b64, context=job["context"]),
+            )
+        if not isinstance(pred, dict):
+            raise ValueError("model.predict returned non-dict")
+
+        # ✅ Ajoute le lien complet en premier
+        job["pred"] = {link_column_name: job["url"], **pred}
+        print(f"✓ ROW {job['id']} prediction OK")
+        return job
+
+    stages = build_csv_media_stages(conf, model) + [
+        Stage("predict", predict, conf.get("max_workers", 1)),
+    ]
+
+    # ligne identifiée par position + URL : un CSV modifié n'est pas sauté à tort
+    jobs = (
+        job for job in iter_csv_jobs(conf)
+        if f"{job['id']}|{job['url']}" not in journal.done
+    )
+    for job, ok in run_stages(jobs, stages, queue_size=conf.get("stage_queue_size", 8)):
+        cleanup_files(job["tmp_files"])
+        if ok:
+            journal.append(f"{job['id']}|{job['url']}", int(job["id"]), job["pred"])
+
+    # 5️⃣ Sortie CSV (post-rules + ordre des colonnes, par blocs)
+    n_rows = journal.finalize(out_csv, conf, ordered_columns=load_column_order(conf))
+
+    if n_rows:
+        print(f"\n✅ Saved → {out_csv}")
     else:
         print("\n⚠️ No predictions.")
-
-    # 6️⃣ Nettoyage temporaire
-    for f in tmp_files:
-        try:
-            os.remove(f)
-        except Exception:
-            pass
+    print(get_rate_limiter().report())
+    if deduper is not None:
+        print(deduper.report())
+    for section, label in (("response_cache", "GPT response cache"), ("ocr_cache", "OCR cache")):
+        cache = get_sqlite_cache(conf.get(section))
+        if cache is not None:
+            print(cache.report(label))
+    for section, label in (("media_cache", "preprocessed media cache"), ("download_cache", "download cache")):
+        cache = get_file_cache(conf.get(section))
+        if cache is not None:
+            print(cache.report(label))
@@ -1,71 +1,163 @@
 # data_filling/pipelines/run_from_folder.py
 
 import os
-import pandas as pd
 
+from data_filling.agents.rate_limiter import get_rate_limiter
+from data_filling.data.io import detect_media
 from data_filling.models import get_model
-from data_filling.tools.post_rules import apply_logic_rules
-from .tool_pipeline import gather_media_files, optimize_image
+from data_filling.tools.media_pool import get_media_pool, run_cached, run_in_pool
+from data_filling.utils.file_cache import get_file_cache
+from data_filling.utils.sqlite_cache import get_sqlite_cache
+from .dedup import get_deduper
+from .streaming import Stage, Journal, run_stages, cleanup_files
+from .tool_pipeline import gather_media_files, convert_png_to_jpg, optimize_image, load_image_array
 
 
-def run_pipeline_folder(conf: dict):
-    """
-    Pipeline pour traiter un dossier structuré par row_id avec des fichiers média.
-    """
-    model            = get_model(conf)
-    root_dir         = conf["data_path"]
-    out_csv          = conf["output_path"]
+def iter_folder_jobs(conf: dict):
+    """Un job par sous-dossier row_id, dans l'ordre de sorted(row_id)."""
+    root_dir = conf["data_path"]
+    return (
+        {"id": row_id, "dir": os.path.join(root_dir, row_id), "tmp_files": []}
+        for row_id in sorted(os.listdir(root_dir))
+        if os.path.isdir(os.path.join(root_dir, row_id))
+    )
+
+
+def build_folder_media_stages(conf: dict, model) -> list:
+    """Étages fetch → preprocess → encode : remplit job["images_b64"]."""
     convert_png      = conf.get("convert_png", False)
     use_optimize     = conf.get("optimize_image", False)
     save_as_jpeg     = conf.get("save_as_jpeg", True)
+    media_pool       = get_media_pool(conf.get("media_workers", 0))
+    media_cache      = get_file_cache(conf.get("media_cache"))
+    in_memory        = conf.get("in_memory_media", False)
 
-    os.makedirs(os.path.dirname(out_csv), exist_ok=True)
-    preds, tmp_files = [], []
-
-    for row_id in sorted(os.listdir(root_dir)):
-        row_dir = os.path.join(root_dir, row_id)
-        if not os.path.isdir(row_dir):
-            continue
-
-        media, temps = gather_media_files(row_dir, convert_png=convert_png)
-        tmp_files.extend(temps)
-
+    def fetch(job):
+        media, _ = gather_media_files(job["dir"], convert_png=False)
         if not media:
-            print(f"⚠️ No media in {row_id}")
-            continue
+            print(f"⚠️ No media in {job['id']}")
+            return None
+        job["media"] = media
+        return job
+
+    def decode_in_memory(path: str):
+        """Comme le CSV : si convert / optimize échoue, décodage simple avant d'abandonner l'image."""
+        try:
+            return run_in_pool(
+                media_pool, load_image_array, path,
+                convert_png=convert_png, optimize=use_optimize, save_as_jpeg=save_as_jpeg,
+            )
+        except Exception as e:
+            if not (convert_png or use_optimize):
+                raise
+            print(f"⚠️ Preprocess error « {os.path.basename(path)} »: {e}")
+            return run_in_pool(media_pool, load_image_array, path)
 
-        optimized_media = []
-        for path in media:
+    def preprocess(job):
+        processed = []
+        for path in job["media"]:
+            if in_memory and detect_media(path) == "image":
+                # en mémoire : l'image décodée passe à l'étage encode, sans fichier
+                try:
+                    processed.append(decode_in_memory(path))
+                except Exception as e:
+                    print(f"⚠️ Decode error « {os.path.basename(path)} »: {e}")
+                continue
+            if convert_png and path.lower().endswith(".png"):
+                try:
+                    path, temporary = run_cached(media_cache, media_pool, convert_png_to_jpg, path)
+                    if temporary:
+                        job["tmp_files"].append(path)
+                except Exception as e:
+                    print(f"⚠️ PNG convert error « {os.path.basename(path)} »: {e}")
+                    continue
             if use_optimize:
                 try:
-                    opt_path = optimize_image(
+                    opt_path, temporary = run_cached(
+                        media_cache,
+                        media_pool,
+                        optimize_image,
                         path,
                         save_as_jpeg=save_as_jpeg
                     )
-                    tmp_files.append(opt_path)
-                    optimized_media.append(opt_path)
+                    if temporary:
+                        job["tmp_files"].append(opt_path)
+                    processed.append(opt_path)
                 except Exception as e:
                     print(f"⚠️ Optimize error « {os.path.basename(path)} »: {e}")
             else:
-                optimized_media.append(path)
+                processed.append(path)
+        job["media"] = processed
+        return job
 
-        print(f"🔍 {row_id} ({len(optimized_media)} files)")
-        try:
-            pred = model.predict(optimized_media)
-            pred["row_id"] = row_id
-            preds.append(pred)
-        except Exception as e:
-            print(f"❌ {row_id}: {e}")
+    def encode(job):
+        print(f"🔍 {job['id']} ({len(job['media'])} files)")
+        stats = {}
+        job["images_b64"] = model.encode_media(job["media"], stats=stats)
+        if stats.get("dropped"):
+            print(f"✂️ {job['id']}: {stats['dropped']}/{stats['frames']} near-duplicate frames dropped")
+        cleanup_files(job["tmp_files"])
+        job["tmp_files"] = []
+        return job
+
+    return [
+        Stage("fetch", fetch, 1),
+        Stage("preprocess", preprocess, conf.get("preprocess_workers", 1)),
+        Stage("encode", encode, conf.get("encode_workers", 1)),
+    ]
+
+
+def run_pipeline_folder(conf: dict):
+    """
+    Pipeline pour traiter un dossier structuré par row_id avec des fichiers média.
 
-    if preds:
-        df = pd.DataFrame(preds).set_index("row_id")
-        if conf.get("logic_rules_path"):
-            df = apply_logic_rules(df, conf["logic_rules_path"])
-        df.to_csv(out_csv, sep=",", encoding="utf-8-sig")
+    Étages reliés par des files bornées, chacun avec son parallélisme :
+    fetch (liste des médias) → preprocess (PNG/optimisation) → encode
+    (frames + base64) → predict (`max_workers`) → écriture. Les prédictions
+    sont écrites au fil de l'eau, dans l'ordre de sorted(row_id).
+    """
+    model            = get_model(conf)
+    out_csv          = conf["output_path"]
+
+    os.makedirs(os.path.dirname(out_csv), exist_ok=True)
+    # journal des lignes terminées (resume: true → reprise après crash)
+    journal = Journal(out_csv, resume=conf.get("resume", False))
+
+    # même jeu de médias dans plusieurs dossiers → une seule prédiction
+    deduper = get_deduper(conf)
+
+    def predict(job):
+        imgs_b64 = job.pop("images_b64")
+        if deduper is None:
+            pred = model.predict_b64(imgs_b64)
+        else:
+            pred = deduper.run(deduper.key(imgs_b64), lambda: model.predict_b64(imgs_b64))
+        pred["row_id"] = job["id"]
+        job["pred"] = pred
+        return job
+
+    stages = build_folder_media_stages(conf, model) + [
+        Stage("predict", predict, conf.get("max_workers", 1)),
+    ]
+
+    jobs = (job for job in iter_folder_jobs(conf) if job["id"] not in journal.done)
+    for job, ok in run_stages(jobs, stages, queue_size=conf.get("stage_queue_size", 8)):
+        cleanup_files(job["tmp_files"])
+        if ok:
+            journal.append(job["id"], job["id"], job["pred"])
+
+    n_rows = journal.finalize(out_csv, conf, index_col="row_id")
+    if n_rows:
         print(f"✅ saved → {out_csv}")
     else:
         print("⚠️ No predictions generated.")
-
-    for f in tmp_files:
-        try: os.remove(f)
-        except: pass
+    print(get_rate_limiter().report())
+    if deduper is not None:
+        print(deduper.report())
+    for section, label in (("response_cache", "GPT response cache"), ("ocr_cache", "OCR cache")):
+        cache = get_sqlite_cache(conf.get(section))
+        if cache is not None:
+            print(cache.report(label))
+    media_cache = get_file_cache(conf.get("media_cache"))
+    if media_cache is not None:
+        print(media_cache.report("preprocessed media cache"))
@@ -0,0 +1,312 @@
+# data_filling/pipelines/streaming.py
+
+import json
+import os
+import queue
+import threading
+from typing import Callable, Iterable, List, Optional
+
+import pandas as pd
+
+from data_filling.tools.post_rules import apply_logic_rules
+
+_DONE = object()
+
+
+# ------------------------------------------------------------------ #
+#  Étage de pipeline
+# ------------------------------------------------------------------ #
+class Stage:
+    """
+    Un étage = une fonction job → job exécutée par `workers` threads.
+
+    Le job est un dict enrichi en place ; la fonction renvoie le job ou
+    None pour l'abandonner. Une exception est loggée et abandonne aussi
+    le job.
+    """
+
+    def __init__(self, name: str, fn: Callable[[dict], Optional[dict]], workers: int = 1):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, int(workers or 1))
+
+
+def run_stages(items: Iterable[dict], stages: List[Stage], *, queue_size: int = 8):
+    """
+    Fait circuler les jobs dans les étages reliés par des files bornées et
+    renvoie (job, ok) dans l'ordre d'entrée (ok=False : job abandonné en
+    route, l'appelant peut encore nettoyer ses fichiers temporaires).
+
+    Le nombre de jobs en vol est plafonné : la mémoire ne dépend pas de la
+    taille de l'entrée, même si un job lent bloque la remise en ordre.
+
+    Une erreur levée par `items` (lu dans un thread dédié) termine les
+    étages proprement, puis est relevée ici, dans le thread appelant,
+    après les jobs déjà entrés.
+    """
+    queue_size = max(1, int(queue_size))
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    max_in_flight = queue_size * (len(stages) + 1) + sum(s.workers for s in stages)
+    in_flight = threading.Semaphore(max_in_flight)
+    stop = threading.Event()
+    feed_error: list = []
+
+    def _feed():
+        try:
+            for seq, job in enumerate(items):
+                in_flight.acquire()
+                if stop.is_set():
+                    break
+                queues[0].put((seq, job, True))
+        except BaseException as e:  # relevée dans le thread appelant
+            feed_error.append(e)
+        finally:
+            for _ in range(stages[0].workers):
+                queues[0].put(_DONE)
+
+    def _work(stage: Stage, q_in: queue.Queue, q_out: queue.Queue, next_workers: int, state: dict):
+        while True:
+            try:
+                msg = q_in.get(timeout=0.1)
+            except queue.Empty:
+                if stop.is_set():  # le vidage final a pu emporter _DONE
+                    break
+                continue
+            if msg is _DONE:
+                break
+            seq, job, ok = msg
+            if ok and not stop.is_set():
+                try:
+                    ok = stage.fn(job) is not None
+                except Exception as e:
+                    print(f"❌ [{stage.name}] {job.get('id', seq)}: {e}")
+                    ok = False
+            q_out.put((seq, job, ok))
+
+        # le dernier worker de l'étage propage la fin à l'étage suivant
+        with state["lock"]:
+            state["alive"] -= 1
+            last = state["alive"] == 0
+        if last:
+            for _ in range(next_workers):
+                q_out.put(_DONE)
+
+    threads = [threading.Thread(target=_feed, name="stage-feed", daemon=True)]
+    for i, stage in enumerate(stages):
+        next_workers = stages[i + 1].workers if i + 1 < len(stages) else 1
+        state = {"lock": threading.Lock(), "alive": stage.workers}
+        for w in range(stage.workers):
+            threads.append(threading.Thread(
+                target=_work,
+                args=(stage, queues[i], queues[i + 1], next_workers, state),
+                name=f"stage-{stage.name}-{w}",
+                daemon=True,
+            ))
+    for t in threads:
+        t.start()
+
+    # ---------- remise en ordre ---------------------------------------
+    pending, next_seq = {}, 0
+    try:
+        while True:
+            msg = queues[-1].get()
+            if msg is _DONE:
+                break
+            seq, job, ok = msg
+            pending[seq] = (job, ok)
+            while next_seq in pending:
+                yield pending.pop(next_seq)
+                next_seq += 1
+                in_flight.release()
+        if feed_error:
+            raise feed_error[0]
+    finally:
+        # arrêt anticipé : on vide les files pour débloquer les threads
+        stop.set()
+        for _ in range(max_in_flight):
+            in_flight.release()
+        while any(t.is_alive() for t in threads):
+            for q in queues:
+                try:
+                    while True:
+                        q.get_nowait()
+                except queue.Empty:
+                    pass
+            for t in threads:
+                t.join(timeout=0.05)
+
+
+def cleanup_files(paths: Iterable[str]):
+    for f in paths:
+        try:
+            os.remove(f)
+        except OSError:
+            pass
+
+
+# ------------------------------------------------------------------ #
+#  Sortie : staging JSONL → CSV final par blocs
+# ------------------------------------------------------------------ #
+def append_jsonl(path: str, record: dict):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def iter_jsonl_chunks(path: str, chunk_size: int = 500):
+    chunk = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            chunk.append(json.loads(line))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+class Journal:
+    """
+    Journal append-only des prédictions (`<output>.journal.jsonl`) : chaque
+    ligne terminée est écrite et synchronisée sur disque aussitôt, avec
+    son identifiant de job et sa position dans l'entrée.
+
+    resume=True reprend le journal existant : `done` contient les jobs
+    déjà prédits (à sauter). Une dernière ligne tronquée par un crash est
+    ignorée. finalize() trie par position d'entrée et dédoublonne avant
+    finalize_csv : le CSV est identique à celui d'un run sans reprise.
+    """
+
+    ID, ORDER = "_job_id", "_job_order"
+
+    def __init__(self, out_csv: str, *, resume: bool = False):
+        self.path = out_csv + ".journal.jsonl"
+        self.done = set()
+        self._lock = threading.Lock()
+        if not resume:
+            cleanup_files([self.path])
+        elif os.path.isfile(self.path):
+            self._repair()
+            print(f"♻️ Resuming from {self.path}: {len(self.done)} rows already done")
+
+    def _repair(self):
+        """Charge les ids terminés ; réécrit le journal s'il finit par une ligne tronquée."""
+        good, bad = [], 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    self.done.add(json.loads(line)[self.ID])
+                    good.append(line if line.endswith("\n") else line + "\n")
+                except (ValueError, KeyError):
+                    bad += 1
+        if bad:
+            print(f"⚠️ {bad} unreadable journal line(s) dropped")
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.writelines(good)
+            os.replace(tmp, self.path)
+
+    def append(self, job_id, order, record: dict):
+        line = json.dumps({**record, self.ID: job_id, self.ORDER: order}, ensure_ascii=False) + "\n"
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.done.add(job_id)
+
+    def _sorted_copy(self) -> str:
+        """Copie du journal triée par position d'entrée (dernier enregistrement par job)."""
+        offsets = {}
+        with open(self.path, "rb") as f:
+            pos = f.tell()
+            for raw in iter(f.readline, b""):
+                if raw.strip():
+                    rec = json.loads(raw)
+                    offsets[rec[self.ID]] = (rec[self.ORDER], pos)
+                pos = f.tell()
+        out = self.path + ".sorted"
+        with open(self.path, "rb") as src, open(out, "wb") as dst:
+            for _, pos in sorted(offsets.values()):
+                src.seek(pos)
+                dst.write(src.readline())
+        return out
+
+    def finalize(self, out_csv: str, conf: dict, **kwargs) -> int:
+        """finalize_csv sur le journal trié ; le journal est supprimé si tout s'est bien passé."""
+        if not os.path.isfile(self.path):
+            return 0
+        ordered = self._sorted_copy()
+        try:
+            n_rows = finalize_csv(ordered, out_csv, conf, drop_columns=(self.ID, self.ORDER), **kwargs)
+        finally:
+            cleanup_files([ordered])
+        cleanup_files([self.path])
+        return n_rows
+
+
+def load_column_order(conf: dict) -> Optional[List[str]]:
+    if conf.get("column_order"):
+        return conf["column_order"]
+    if conf.get("column_order_path"):
+        with open(conf["column_order_path"]) as f:
+            return [line.strip() for line in f if line.strip()]
+    return None
+
+
+def finalize_csv(staging_path: str, out_csv: str, conf: dict, *,
+                 index_col: Optional[str] = None,
+                 ordered_columns: Optional[List[str]] = None,
+                 drop_columns: Iterable[str] = (),
+                 chunk_size: int = 500) -> int:
+    """
+    Écrit le CSV final depuis le staging JSONL, bloc par bloc.
+
+    Même résultat qu'un DataFrame construit d'un coup : colonnes dans
+    l'ordre de première apparition, logic rules puis column_order.
+    Renvoie le nombre de lignes écrites.
+    """
+    if not os.path.isfile(staging_path):
+        return 0
+
+    # 1ʳᵉ passe : union ordonnée des colonnes (clés seulement)
+    columns = {}
+    for chunk in iter_jsonl_chunks(staging_path, chunk_size):
+        for rec in chunk:
+            columns.update(dict.fromkeys(rec))
+    for col in drop_columns:
+        columns.pop(col, None)
+    if not columns:
+        return 0
+    columns = list(columns)
+
+    rules_path = conf.get("logic_rules_path")
+    header = None
+    n_rows = 0
+    for chunk in iter_jsonl_chunks(staging_path, chunk_size):
+        df = pd.DataFrame(chunk).reindex(columns=columns)
+        if index_col:
+            df = df.set_index(index_col)
+
+        if rules_path:
+            df = apply_logic_rules(df, rules_path)
+
+        if ordered_columns:
+            for col in ordered_columns:
+                if col not in df.columns:
+                    df[col] = ""  # Ajoute colonne vide si manquante
+            df = df[ordered_columns]
+
+        if header is None:
+            header = list(df.columns)
+            df.to_csv(out_csv, index=bool(index_col), encoding="utf-8-sig")
+        else:
+            df = df.reindex(columns=header)
+            df.to_csv(out_csv, index=bool(index_col), mode="a", header=False, encoding="utf-8")
+        n_rows += len(df)
+
+    return n_rows
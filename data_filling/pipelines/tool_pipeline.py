@@ -5,15 +5,19 @@ from io import BytesIO
 from typing import List
 
 
+import cv2
+import numpy as np
 from PIL import Image, ImageOps
 
-from data_filling.utils.constants import SUPPORTED_MEDIA_EXTENSIONS
+from data_filling.utils.constants import SUPPORTED_MEDIA_EXTENSIONS, SUPPORTED_VIDEO_EXTENSIONS
+from data_filling.utils.file_cache import FileCache
 
 from PIL import Image, ImageOps
 
 import os
 import time
 import tempfile
+import threading
 import requests
 from urllib.parse import unquote, urlparse
 from requests.adapters import HTTPAdapter
@@ -54,69 +58,119 @@ def gather_media_files(row_dir: str, *, convert_png: bool) -> List[str]:
 
 
 # ------------------------------------------------------------------ #
-#  Télécharge une image URL → fichier temporaire
+#  Sessions HTTP partagées (une par hôte, pool de connexions borné)
 # ------------------------------------------------------------------ #
+_SESSIONS: dict = {}
+_SESSIONS_LOCK = threading.Lock()
 
 
+def get_http_session(url: str, *, max_connections_per_host: int = 4, retries: int = 5,
+                     backoff_factor: float = 0.5) -> requests.Session:
+    """
+    Renvoie la session réutilisable associée à l'hôte de `url`.
 
-def download_image_tmp(url: str, retries: int = 5, backoff_factor: float = 0.5, timeout: int = 30,
-                       verify_ssl: bool = True) -> str:
+    Les connexions TCP/TLS restent ouvertes d'un appel à l'autre ; le pool
+    est bloquant, donc au plus `max_connections_per_host` requêtes
+    simultanées par hôte.
     """
-    Télécharge une image depuis une URL dans un fichier temporaire.
+    parsed = urlparse(url)
+    key = (parsed.scheme, parsed.netloc, max_connections_per_host, retries, backoff_factor)
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(key)
+        if session is None:
+            session = requests.Session()
+            retry_strategy = Retry(
+                total=retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=[500, 502, 503, 504],
+                allowed_methods=["GET"]
+            )
+            adapter = HTTPAdapter(
+                max_retries=retry_strategy,
+                pool_connections=1,
+                pool_maxsize=max_connections_per_host,
+                pool_block=True,
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _SESSIONS[key] = session
+    return session
 
-    ✅ Gère :
-        - Les retries avec backoff exponentiel
-        - Les liens encodés (UPSIIDE, etc.)
-        - La détection d'extension à partir du Content-Type
-        - L'option verify_ssl (par défaut True)
+
+# ------------------------------------------------------------------ #
+#  Télécharge une image URL → fichier temporaire (ou octets en mémoire)
+# ------------------------------------------------------------------ #
+def _is_video_response(url: str, content_type: str) -> bool:
+    return content_type.startswith("video/") or urlparse(url).path.lower().endswith(SUPPORTED_VIDEO_EXTENSIONS)
+
+
+def _media_ext(url: str, content_type: str) -> str:
+    """Extension du fichier local : Content-Type, sinon celle de l'URL, sinon .png."""
+    if "image" in content_type or content_type.startswith("video/"):
+        ext = "." + content_type.split("/")[-1].split(";")[0]
+        return ".mov" if ext == ".quicktime" else ext
+    url_ext = os.path.splitext(urlparse(url).path)[1].lower()
+    return url_ext if url_ext in SUPPORTED_MEDIA_EXTENSIONS else ".png"  # fallback par défaut
+
+
+def _http_get(url: str, *, in_memory: bool = False, extra_headers: dict | None = None, retries: int = 5,
+              backoff_factor: float = 0.5, timeout: int = 30, verify_ssl: bool = True,
+              max_connections_per_host: int = 4):
+    """
+    GET avec retries → (réponse, chemin temporaire, octets). Sur 304
+    (requête conditionnelle), aucun corps n'est lu : chemin et octets
+    valent None.
+
+    in_memory=True : une image est renvoyée en octets, sans fichier ; une
+    vidéo passe toujours par un fichier (OpenCV l'ouvre par son nom).
     """
 
     # Si verify_ssl=False, désactiver les warnings
     if not verify_ssl:
         urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-    # Configurer la session avec stratégie de retry
-    session = requests.Session()
-    retry_strategy = Retry(
-        total=retries,
+    session = get_http_session(
+        url,
+        max_connections_per_host=max_connections_per_host,
+        retries=retries,
         backoff_factor=backoff_factor,
-        status_forcelist=[500, 502, 503, 504],
-        allowed_methods=["GET"]
     )
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
 
     headers = {
-        "User-Agent": "Mozilla/5.0 (compatible; ImageDownloader/1.0)"
+        "User-Agent": "Mozilla/5.0 (compatible; ImageDownloader/1.0)",
+        **(extra_headers or {}),
     }
 
     for attempt in range(1, retries + 1):
         try:
-            response = session.get(url, headers=headers, stream=True, timeout=timeout, verify=verify_ssl)
-            response.raise_for_status()
-
-            # Déterminer l'extension depuis Content-Type
-            content_type = response.headers.get("Content-Type", "").lower()
-            if "image" in content_type:
-                ext = "." + content_type.split("/")[-1].split(";")[0]
-            else:
-                ext = ".png"  # fallback par défaut
-
-            # Décoder le nom dans l'URL (même si encodé)
-            url_path = urlparse(url).path
-            filename = os.path.basename(unquote(url_path)) or "image"
-            filename = filename.replace(" ", "_")
-
-            # Créer un fichier temporaire avec extension correcte
-            tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix=ext)
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    tmp_file.write(chunk)
-            tmp_path = tmp_file.name
-            tmp_file.close()
-
-            return tmp_path
+            # `with` : la connexion retourne au pool même en cas d'erreur
+            # (pool bloquant → une connexion perdue bloquerait les autres)
+            with session.get(url, headers=headers, stream=True, timeout=timeout, verify=verify_ssl) as response:
+                if response.status_code == 304:
+                    return response, None, None
+                response.raise_for_status()
+
+                # Déterminer l'extension depuis Content-Type
+                content_type = response.headers.get("Content-Type", "").lower()
+                if in_memory and not _is_video_response(url, content_type):
+                    return response, None, b"".join(response.iter_content(chunk_size=65536))
+
+                ext = _media_ext(url, content_type)
+
+                # Décoder le nom dans l'URL (même si encodé)
+                url_path = urlparse(url).path
+                filename = os.path.basename(unquote(url_path)) or "image"
+                filename = filename.replace(" ", "_")
+
+                # Créer un fichier temporaire avec extension correcte
+                tmp_file = tempfile.NamedTemporaryFile(delete=False, suffix=ext)
+                for chunk in response.iter_content(chunk_size=8192):
+                    if chunk:
+                        tmp_file.write(chunk)
+                tmp_path = tmp_file.name
+                tmp_file.close()
+
+                return response, tmp_path, None
 
         except (requests.exceptions.RequestException, requests.exceptions.ChunkedEncodingError,
                 requests.exceptions.ConnectionError) as e:
@@ -129,6 +183,90 @@ def download_image_tmp(url: str, retries: int = 5, backoff_factor: float = 0.5,
                 raise e
 
 
+def download_image_tmp(url: str, retries: int = 5, backoff_factor: float = 0.5, timeout: int = 30,
+                       verify_ssl: bool = True, max_connections_per_host: int = 4) -> str:
+    """
+    Télécharge une image depuis une URL dans un fichier temporaire.
+
+    ✅ Gère :
+        - Les retries avec backoff exponentiel
+        - Les liens encodés (UPSIIDE, etc.)
+        - La détection d'extension à partir du Content-Type
+        - L'option verify_ssl (par défaut True)
+        - La réutilisation des connexions (session partagée par hôte)
+    """
+    _, tmp_path, _ = _http_get(
+        url,
+        retries=retries,
+        backoff_factor=backoff_factor,
+        timeout=timeout,
+        verify_ssl=verify_ssl,
+        max_connections_per_host=max_connections_per_host,
+    )
+    return tmp_path
+
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def download_image_cached(url: str, cache: FileCache | None, *, in_memory: bool = False,
+                          **kwargs) -> tuple[str | bytes, bool]:
+    """
+    download_image_tmp avec cache disque des URLs (kwargs identiques).
+
+    Le corps est conservé avec son ETag / Last-Modified ; les appels
+    suivants revalident par If-None-Match / If-Modified-Since et un 304
+    réutilise le fichier sans rien télécharger. Si le serveur est
+    injoignable, la copie en cache est servie telle quelle.
+
+    Renvoie (chemin, temporaire) : un fichier du cache ne doit pas être
+    supprimé par l'appelant. in_memory=True : une image est renvoyée en
+    octets (temporaire=False), sans fichier temporaire.
+    """
+    if cache is None:
+        _, tmp_path, data = _http_get(url, in_memory=in_memory, **kwargs)
+        return (data, False) if data is not None else (tmp_path, True)
+
+    key = cache.make_key("url", url)
+    cached = cache.get(key, count=False)
+    meta = cache.meta(key) if cached else {}
+    validators = {}
+    if cached and meta.get("etag"):
+        validators["If-None-Match"] = meta["etag"]
+    if cached and meta.get("last_modified"):
+        validators["If-Modified-Since"] = meta["last_modified"]
+
+    def from_cache(path: str):
+        if in_memory and not path.lower().endswith(SUPPORTED_VIDEO_EXTENSIONS):
+            return _read_bytes(path), False
+        return path, False
+
+    try:
+        response, tmp_path, data = _http_get(url, in_memory=in_memory, extra_headers=validators, **kwargs)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        if not cached:
+            raise
+        print(f"⚠️ revalidation failed, serving cached copy: {e}")
+        cache.record(True)
+        return from_cache(cached)
+
+    if tmp_path is None and data is None:  # 304 Not Modified
+        cache.record(True)
+        return from_cache(cached)
+
+    cache.record(False)
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    meta = {"url": url, "etag": etag, "last_modified": last_modified}
+    if data is not None:
+        if etag or last_modified:
+            cache.put_bytes(key, data, _media_ext(url, response.headers.get("Content-Type", "").lower()), meta=meta)
+        return data, False
+    if not (etag or last_modified):  # rien pour revalider : pas de cache
+        return tmp_path, True
+    return cache.put(key, tmp_path, meta=meta), False
 
 
 def optimize_image(
@@ -144,49 +282,94 @@ def optimize_image(
     Retourne le chemin du fichier temporaire optimisé.
     """
     with Image.open(input_path) as im:
-        # Uniformiser en RGBA pour gérer la transparence
-        im = im.convert("RGBA")
+        im_cropped = _optimize_pil(im, max_size=max_size, padding=padding, save_as_jpeg=save_as_jpeg)
 
-        # Trouver la bounding box utile
-        gray = ImageOps.grayscale(im)
-        inverted = ImageOps.invert(gray)
-        bbox = inverted.getbbox()
-
-        if bbox:
-            im_cropped = im.crop(bbox)
+        # Sauvegarder dans un fichier temporaire
+        if save_as_jpeg:
+            tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".jpg")
+            im_cropped.save(tmp.name, "JPEG", quality=90, optimize=True)
         else:
-            im_cropped = im
+            tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
+            im_cropped.save(tmp.name, "PNG", optimize=True)
 
-        # Ajouter un padding
-        if padding > 0:
-            new_w = im_cropped.width + 2 * padding
-            new_h = im_cropped.height + 2 * padding
-            new_img = Image.new("RGBA", (new_w, new_h), (255, 255, 255, 0))
-            new_img.paste(im_cropped, (padding, padding))
-            im_cropped = new_img
+        return tmp.name
 
-        # Redimensionner si trop grand
-        if max(im_cropped.width, im_cropped.height) > max_size:
-            im_cropped.thumbnail((max_size, max_size), Image.LANCZOS)
 
-        # Choisir format de sortie
-        if save_as_jpeg:
-            # Forcer la conversion sans alpha sur fond blanc
-            bg = Image.new("RGB", im_cropped.size, (255, 255, 255))
-            bg.paste(im_cropped, mask=im_cropped.split()[-1])
-            im_cropped = bg
-            suffix = ".jpg"
-            fmt = "JPEG"
-        else:
-            # Conserver la transparence
-            suffix = ".png"
-            fmt = "PNG"
+def _optimize_pil(im: Image.Image, *, max_size: int, padding: int, save_as_jpeg: bool) -> Image.Image:
+    """Crop + padding + resize d'optimize_image, sur une image déjà ouverte (RGB si save_as_jpeg, sinon RGBA)."""
+    # Uniformiser en RGBA pour gérer la transparence
+    im = im.convert("RGBA")
 
-        # Sauvegarder dans un fichier temporaire
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-        if fmt == "JPEG":
-            im_cropped.save(tmp.name, fmt, quality=90, optimize=True)
-        else:
-            im_cropped.save(tmp.name, fmt, optimize=True)
+    # Trouver la bounding box utile
+    gray = ImageOps.grayscale(im)
+    inverted = ImageOps.invert(gray)
+    bbox = inverted.getbbox()
 
-        return tmp.name
+    if bbox:
+        im_cropped = im.crop(bbox)
+    else:
+        im_cropped = im
+
+    # Ajouter un padding
+    if padding > 0:
+        new_w = im_cropped.width + 2 * padding
+        new_h = im_cropped.height + 2 * padding
+        new_img = Image.new("RGBA", (new_w, new_h), (255, 255, 255, 0))
+        new_img.paste(im_cropped, (padding, padding))
+        im_cropped = new_img
+
+    # Redimensionner si trop grand
+    if max(im_cropped.width, im_cropped.height) > max_size:
+        im_cropped.thumbnail((max_size, max_size), Image.LANCZOS)
+
+    # Choisir format de sortie
+    if save_as_jpeg:
+        # Forcer la conversion sans alpha sur fond blanc
+        bg = Image.new("RGB", im_cropped.size, (255, 255, 255))
+        bg.paste(im_cropped, mask=im_cropped.split()[-1])
+        im_cropped = bg
+    # sinon : transparence conservée
+
+    return im_cropped
+
+
+# ------------------------------------------------------------------ #
+#  Chemin en mémoire : octets (ou fichier) → un seul décodage → BGR
+# ------------------------------------------------------------------ #
+def load_image_array(
+        source: str | bytes,
+        *,
+        convert_png: bool = False,
+        optimize: bool = False,
+        max_size: int = 1024,
+        padding: int = 10,
+        save_as_jpeg: bool = True
+) -> np.ndarray:
+    """
+    Image (octets téléchargés ou chemin) → tableau BGR prêt pour
+    encode_frame_b64, sans fichier intermédiaire ni JPEG de transit :
+    mêmes traitements que convert_png_to_jpg / optimize_image, appliqués
+    à l'image décodée une seule fois. Fonction de module : exécutable en
+    sous-processus.
+    """
+    data = source if isinstance(source, bytes) else _read_bytes(source)
+    if not optimize:
+        # OpenCV direct (orientation EXIF appliquée, alpha ignoré, comme cv2.imread)
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None and data[:2] == b"\xff\xd8" and not data.rstrip(b"\0").endswith(b"\xff\xd9"):
+            # JPEG tronqué : imread (lecteur fichier de libjpeg) ajoute un EOI
+            # fictif et décode le début, imdecode abandonne → même repli ici
+            img = cv2.imdecode(np.frombuffer(data + b"\xff\xd9", dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is not None:
+            return img
+
+    try:  # PIL : optimisation, ou format qu'OpenCV ne lit pas (GIF…)
+        with Image.open(BytesIO(data)) as im:
+            if convert_png and im.format == "PNG":
+                im = im.convert("RGB")  # comme convert_png_to_jpg : transparence abandonnée
+            if optimize:
+                im = _optimize_pil(im, max_size=max_size, padding=padding, save_as_jpeg=save_as_jpeg)
+            rgb = np.asarray(im.convert("RGB"))
+    except OSError as e:
+        raise ValueError(f"Failed to decode image: {e}") from e
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR)
@@ -1,5 +1,5 @@
 # data_filling/tools/__init__.py
 
-from .template import load_template
+from .template import load_template, CompiledTemplate
 from .normalization import normalize_output
 from .export import outputs_to_dataframe, save_dataframe
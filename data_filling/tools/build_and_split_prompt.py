@@ -1,15 +1,30 @@
 # data_filling/tools/build_and_split_prompt.py
 
+from functools import lru_cache
 from typing import List, Dict, Tuple, Optional
 import json
 import tiktoken
-import random
 
-def estimate_tokens_from_messages(messages: List[Dict], model: str = "gpt-4o") -> int:
+from data_filling.tools.image_payload import b64_image_tokens, image_tokens
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str):
+    """Encodeur tiktoken du modèle (chargé une seule fois par process)."""
     try:
-        enc = tiktoken.encoding_for_model(model)
+        return tiktoken.encoding_for_model(model)
     except KeyError:
-        enc = tiktoken.get_encoding("cl100k_base")
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def estimate_tokens_from_messages(messages: List[Dict], model: str = "gpt-4o") -> int:
+    """
+    Tokens de contexte des messages. Les images sont comptées sur la grille
+    de gpt-4o quel que soit `model` : les coûts par tuile de gpt-4o-mini
+    (2833 + 5667) sont un multiplicateur de facturation, pas une place
+    occupée dans le prompt, et videraient le budget de découpage.
+    """
+    enc = get_encoding(model)
 
     total = 0
     for m in messages:
@@ -21,19 +36,37 @@ def estimate_tokens_from_messages(messages: List[Dict], model: str = "gpt-4o") -
                 if part["type"] == "text":
                     total += len(enc.encode(part["text"]))
                 elif part["type"] == "image_url":
-                    total += 100  # estimation OpenAI pour 1 image
+                    total += _image_part_tokens(part["image_url"])
     return total
 
 
-def build_prompt_messages(fields_dict: Dict, images_b64: List[str], ocr_context: str | None = None) -> List[Dict]:
-    """Assemble un message complet format OpenAI avec un sous-ensemble de champs + images."""
-    fields = {
-        k: {
-            "description": v["prompt_ai"],
-            "accepted_values": v.get("accepted_values", [])
-        }
+def _image_part_tokens(image_url: Dict) -> int:
+    """Tuiles de 512 px selon `detail` (auto est compté comme high), grille gpt-4o."""
+    detail = image_url.get("detail", "auto")
+    url = image_url["url"]
+    if url.startswith("data:"):
+        return b64_image_tokens(url.split(",", 1)[1], detail=detail)
+    return image_tokens(768, 768, detail=detail)  # URL distante : taille inconnue
+
+
+def build_prompt_messages(
+    fields_dict: Dict,
+    images_b64: List[str],
+    ocr_context: str | None = None,
+    extra_context: str | None = None,
+    fragments: Dict[str, str] | None = None,
+    detail: str | None = None,
+) -> List[Dict]:
+    """
+    Assemble un message complet format OpenAI avec un sous-ensemble de champs + images.
+    `fragments` : JSON pré-sérialisé de chaque champ (cf. CompiledTemplate),
+    sinon chaque champ est sérialisé ici.
+    `detail` : low / high / auto envoyé avec chaque image (None = omis).
+    """
+    fields_json = "{" + ", ".join(
+        fragments[k] if fragments and k in fragments else field_fragment(k, v)
         for k, v in fields_dict.items()
-    }
+    ) + "}"
 
     system_prompt = (
         "You are an expert in marketing analysis for alcoholic beverage products.\n"
@@ -41,14 +74,16 @@ def build_prompt_messages(fields_dict: Dict, images_b64: List[str], ocr_context:
         "Return a valid JSON dictionary with key: value pairs.\n"
         "Use only the keys and descriptions provided below. If you have no clue, return 'N/A'.\n"
         "Respond in the format: {key: value, ...} with no explanation.\n\n"
-        f"Fields:\n{json.dumps(fields)}"
+        f"Fields:\n{fields_json}"
     )
 
     user_content = [{"type": "text", "text": "Here are the product images:"}]
     if ocr_context:
         user_content.append({"type": "text", "text": f"Context OCR:\n{ocr_context}"})
+    if extra_context:
+        user_content.append({"type": "text", "text": f"Additional context:\n{extra_context}"})
     user_content += [
-        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64}"}}
+        {"type": "image_url", "image_url": _image_url(b64, detail)}
         for b64 in images_b64
     ]
 
@@ -60,15 +95,38 @@ def build_prompt_messages(fields_dict: Dict, images_b64: List[str], ocr_context:
 
 
 
+def _image_url(b64: str, detail: str | None) -> Dict:
+    image_url = {"url": f"data:image/jpeg;base64,{b64}"}
+    if detail:
+        image_url["detail"] = detail
+    return image_url
+
+
+def _field_payload(meta: Dict) -> Dict:
+    return {
+        "description": meta["prompt_ai"],
+        "accepted_values": meta.get("accepted_values", [])
+    }
+
+
+def field_fragment(key: str, meta: Dict) -> str:
+    """Texte du champ dans le JSON du prompt système (`"key": {...}`)."""
+    return json.dumps({key: _field_payload(meta)})[1:-1]
+
+
 def smart_split_prompt(
     prompt_data: Dict,
     images_b64: List[str],
     ocr_context: str | None = None,
+    extra_context: str | None = None,
     max_tokens: int = 8000,
     model: str = "gpt-4o",
     max_images_per_chunk: int = 3,
     max_chunks: int = 10,
-    max_fields_per_chunk: Optional[int] = None
+    max_fields_per_chunk: Optional[int] = None,
+    fragments: Dict[str, str] | None = None,
+    details: Dict[str, str] | None = None,
+    default_detail: str | None = None,
 ) -> List[Tuple[Dict, List[str], Optional[str]]]:
     """
     Split intelligently the fields in chunks to respect token and image constraints.
@@ -76,58 +134,113 @@ def smart_split_prompt(
     Args:
         prompt_data: dict of fields (tags) to include
         images_b64: list of base64-encoded images
+        ocr_context: optional OCR transcription added to every chunk
+        extra_context: optional free text context (e.g. CSV column) added to every chunk
         max_tokens: max token count per prompt
         model: model used for token estimation
-        max_images_per_chunk: max number of images allowed (random sample if exceeded)
+        max_images_per_chunk: max number of images allowed (evenly spaced subset if exceeded)
         max_chunks: max number of allowed chunks total
         max_fields_per_chunk: optional max number of fields per chunk (None = no limit)
+        fragments: optional pre-serialized JSON of each field (see build_prompt_messages)
+        details: optional image detail hint per field (low / high / auto)
+        default_detail: detail of fields without hint (None = not sent, counted as high)
 
     Returns:
-        List of (fields_chunk, image_chunk) or [] if aborted
+        List of (fields_chunk, image_chunk, detail) or [] if aborted
+
+    Coût linéaire : chaque champ est tokenisé une fois ; le coût d'un chunk
+    est estimé par somme (prompt sans champ + fragments + séparateurs).
+    La tokenisation BPE n'étant pas strictement additive aux jonctions,
+    un candidat proche de la limite est recompté exactement sur le message
+    complet : les chunks sont identiques au glouton d'origine.
+
+    Les champs sont groupés par `detail` d'image (ordre du template conservé
+    dans chaque groupe) : un chunk en `low` coûte 85 tokens par image au
+    lieu de 85 + 170 par tuile de 512 px, ce que le découpage prend en compte.
     """
     all_chunks = []
 
-    # Échantillonner les images si on dépasse la limite
+    # Échantillonner les images si on dépasse la limite : sous-ensemble
+    # régulier (déterministe → mêmes messages, donc même clé de cache)
     if len(images_b64) > max_images_per_chunk:
-        image_chunk = random.sample(images_b64, max_images_per_chunk)
+        n = len(images_b64)
+        image_chunk = [images_b64[i * n // max_images_per_chunk] for i in range(max_images_per_chunk)]
     else:
         image_chunk = images_b64
 
-    field_keys = list(prompt_data.keys())
+    groups: Dict[str | None, List[str]] = {}
+    for k in prompt_data:
+        groups.setdefault((details or {}).get(k) or default_detail, []).append(k)
+
+    enc = get_encoding(model)
+    sep_cost = len(enc.encode(", "))
+
+    for detail, field_keys in groups.items():
+        all_chunks += _split_group(
+            prompt_data, field_keys, image_chunk, detail, ocr_context, extra_context,
+            max_tokens, model, max_fields_per_chunk, fragments, enc, sep_cost,
+        )
+
+    if len(all_chunks) > max_chunks:
+        print(f"❌ Skipping prompt: {len(all_chunks)} chunks needed (max allowed is {max_chunks}).")
+        return []
+
+    return all_chunks
+
+
+def _split_group(prompt_data, field_keys, image_chunk, detail, ocr_context, extra_context,
+                 max_tokens, model, max_fields_per_chunk, fragments, enc, sep_cost):
+    """Découpage glouton d'un groupe de champs partageant le même `detail`."""
+    all_chunks = []
     i = 0
 
+    base_cost = estimate_tokens_from_messages(
+        build_prompt_messages({}, image_chunk, ocr_context, extra_context, detail=detail), model
+    )
+    field_cost = [
+        len(enc.encode(fragments[k] if fragments and k in fragments else field_fragment(k, prompt_data[k])))
+        for k in field_keys
+    ]
+
+    def too_heavy(current_fields: Dict, key: str, val: Dict, approx: int) -> bool:
+        # marge d'erreur : quelques tokens par jonction entre fragments
+        margin = 4 * (len(current_fields) + 1) + 8
+        if approx + margin <= max_tokens:
+            return False
+        if approx - margin > max_tokens:
+            return True
+        test_fields = {**current_fields, key: val}
+        token_estimate = estimate_tokens_from_messages(
+            build_prompt_messages(test_fields, image_chunk, ocr_context, extra_context, fragments, detail),
+            model
+        )
+        return token_estimate > max_tokens
+
     while i < len(field_keys):
         current_fields = {}
+        current_cost = base_cost
         field_count = 0
 
         while i < len(field_keys) and (max_fields_per_chunk is None or field_count < max_fields_per_chunk):
             key = field_keys[i]
             val = prompt_data[key]
-            test_fields = {**current_fields, key: val}
+            test_cost = current_cost + field_cost[i] + (sep_cost if current_fields else 0)
 
-            token_estimate = estimate_tokens_from_messages(
-                build_prompt_messages(test_fields, image_chunk, ocr_context),
-                model
-            )
-
-            if token_estimate > max_tokens:
+            if too_heavy(current_fields, key, val, test_cost):
                 if not current_fields:
                     print(f"⚠️ Field '{key}' is too heavy on its own. Forcing as single-field chunk.")
-                    all_chunks.append(({key: val}, image_chunk))
+                    all_chunks.append(({key: val}, image_chunk, detail))
                     i += 1
                 else:
                     break  # stop adding more fields, save current chunk
             else:
                 current_fields[key] = val
+                current_cost = test_cost
                 field_count += 1
                 i += 1
 
         if current_fields:
-            all_chunks.append((current_fields.copy(), image_chunk))
-
-    if len(all_chunks) > max_chunks:
-        print(f"❌ Skipping prompt: {len(all_chunks)} chunks needed (max allowed is {max_chunks}).")
-        return []
+            all_chunks.append((current_fields.copy(), image_chunk, detail))
 
     return all_chunks
 
@@ -0,0 +1,67 @@
+# data_filling/tools/frame_pruning.py
+
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+
+def dhash(frame: np.ndarray) -> int:
+    """dHash 64 bits (gradients horizontaux d'une vignette 9×8 en niveaux de gris)."""
+    gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def prune_similar(signatures: List[int], max_hamming: int = 6, max_frames: Optional[int] = None) -> List[int]:
+    """
+    Indices des frames à garder (ordre d'origine).
+
+    1. une frame à moins de `max_hamming` bits d'une frame déjà gardée est
+       un quasi-doublon (packshot statique, angles presque identiques) ;
+    2. s'il en reste plus que `max_frames`, on garde les plus variées
+       (échantillonnage du point le plus éloigné, en partant de la 1ʳᵉ).
+    """
+    kept: List[int] = []
+    for i, sig in enumerate(signatures):
+        if all(hamming(sig, signatures[j]) > max_hamming for j in kept):
+            kept.append(i)
+
+    if max_frames and len(kept) > max_frames:
+        chosen = [kept[0]]
+        dist = {i: hamming(signatures[i], signatures[kept[0]]) for i in kept[1:]}
+        while len(chosen) < max_frames:
+            best = max(dist, key=lambda i: (dist[i], -i))
+            chosen.append(best)
+            del dist[best]
+            for i in dist:
+                dist[i] = min(dist[i], hamming(signatures[i], signatures[best]))
+        kept = sorted(chosen)
+
+    return kept
+
+
+def pruning_settings(value) -> Optional[dict]:
+    """
+    Section `frame_pruning` de la conf → kwargs de prune_similar (None si désactivé).
+
+    true = réglages par défaut ; un dict peut n'en surcharger qu'une partie.
+    """
+    if value is None or value is False:
+        return None
+    if value is True:
+        value = {}
+    if not isinstance(value, dict):
+        raise ValueError(
+            f"frame_pruning must be true/false or a mapping with max_hamming / max_frames, got {value!r}"
+        )
+    max_frames = value.get("max_frames")
+    return {
+        "max_hamming": int(value.get("max_hamming", 6)),
+        "max_frames": int(max_frames) if max_frames else None,
+    }
@@ -0,0 +1,134 @@
+# data_filling/tools/image_payload.py
+
+import base64
+import math
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+# ---------------------------------------------------------------------- #
+#  Coût en tokens d'une image (règles de tarification vision OpenAI)
+# ---------------------------------------------------------------------- #
+TILE = 512
+# modèle (préfixe) → (tokens de base, tokens par tuile) ; ceux de gpt-4o-mini
+# servent au calcul du coût, pas au budget de contexte (cf. estimate_tokens_from_messages)
+_TILE_COSTS = {
+    "gpt-4o-mini": (2833, 5667),
+    "gpt-4o": (85, 170),
+    "gpt-4-turbo": (85, 170),
+}
+
+
+def _tile_costs(model: str) -> tuple[int, int]:
+    for prefix, costs in _TILE_COSTS.items():  # le plus spécifique d'abord
+        if model.startswith(prefix):
+            return costs
+    return _TILE_COSTS["gpt-4o"]
+
+
+def effective_size(width: int, height: int, detail: str = "high") -> tuple[int, int]:
+    """
+    Taille à laquelle l'API ramène l'image avant découpage en tuiles :
+    low → tient dans 512×512 ; high → tient dans 2048×2048 puis petit
+    côté ≤ 768. Jamais agrandie.
+    """
+    limit = TILE if detail == "low" else 2048
+    scale = min(1.0, limit / max(width, height))
+    if detail != "low":
+        scale = min(scale, 768 / min(width, height))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def image_tokens(width: int, height: int, detail: str = "high", model: str = "gpt-4o") -> int:
+    base, per_tile = _tile_costs(model)
+    if detail == "low":
+        return base
+    w, h = effective_size(width, height, detail)
+    return base + per_tile * math.ceil(w / TILE) * math.ceil(h / TILE)
+
+
+# ---------------------------------------------------------------------- #
+#  Dimensions d'un JPEG base64 (en-tête seul, sans décodage)
+# ---------------------------------------------------------------------- #
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _jpeg_dims(data: bytes) -> tuple[int, int] | None:
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker in _SOF_MARKERS:
+            return int.from_bytes(data[i + 7:i + 9], "big"), int.from_bytes(data[i + 5:i + 7], "big")
+        i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+    return None
+
+
+def b64_dims(image_b64: str) -> tuple[int, int]:
+    """(largeur, hauteur) ; seuls les premiers Ko sont décodés quand l'en-tête y tient."""
+    dims = _jpeg_dims(base64.b64decode(image_b64[:8192]))
+    if dims is None:
+        img = cv2.imdecode(np.frombuffer(base64.b64decode(image_b64), np.uint8), cv2.IMREAD_UNCHANGED)
+        if img is None:
+            raise ValueError("Failed to decode image for token estimate.")
+        dims = img.shape[1], img.shape[0]
+    return dims
+
+
+def b64_image_tokens(image_b64: str, detail: str = "high", model: str = "gpt-4o") -> int:
+    if detail == "low":
+        return _tile_costs(model)[0]
+    return image_tokens(*b64_dims(image_b64), detail=detail, model=model)
+
+
+# ---------------------------------------------------------------------- #
+#  Construction des payloads
+# ---------------------------------------------------------------------- #
+def fit_to_tiles(frame: np.ndarray, detail: str = "high", snap: float = 0.1) -> np.ndarray:
+    """
+    Réduit la frame à la taille que l'API utiliserait (octets inutiles en
+    moins), puis, si un côté ne dépasse un multiple de 512 px que d'au plus
+    `snap` (fraction de tuile), réduit encore pour économiser la rangée de
+    tuiles entamée.
+    """
+    h, w = frame.shape[:2]
+    tw, th = effective_size(w, h, detail)
+    if detail != "low" and snap:
+        scale = 1.0
+        for side in (tw, th):
+            over = side % TILE
+            if side > TILE and 0 < over <= snap * TILE:
+                scale = min(scale, (side - over) / side)
+        tw, th = max(1, int(tw * scale)), max(1, int(th * scale))
+    if (tw, th) == (w, h):
+        return frame
+    return cv2.resize(frame, (tw, th), interpolation=cv2.INTER_AREA)
+
+
+def encode_jpeg_budget(frame: np.ndarray, max_bytes: int | None = None, quality: int = 85,
+                       min_quality: int = 50) -> bytes:
+    """JPEG ≤ max_bytes : qualité abaissée par paliers, puis réduction de 20 % en 20 %."""
+    while True:
+        q = quality
+        while True:
+            ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, q])
+            if not ok:
+                raise ValueError("Failed to encode frame.")
+            if not max_bytes or len(buf) <= max_bytes or q <= min_quality:
+                break
+            q = max(min_quality, q - 10)
+        if not max_bytes or len(buf) <= max_bytes or min(frame.shape[:2]) < 64:
+            return buf.tobytes()
+        frame = cv2.resize(frame, None, fx=0.8, fy=0.8, interpolation=cv2.INTER_AREA)
+
+
+@lru_cache(maxsize=64)
+def low_detail_b64(image_b64: str) -> str:
+    """Variante `detail: low` (≤ 512×512) d'une image base64, pour les chunks qui s'en contentent."""
+    w, h = b64_dims(image_b64)
+    if max(w, h) <= TILE:
+        return image_b64
+    img = cv2.imdecode(np.frombuffer(base64.b64decode(image_b64), np.uint8), cv2.IMREAD_COLOR)
+    return base64.b64encode(encode_jpeg_budget(fit_to_tiles(img, "low"))).decode()
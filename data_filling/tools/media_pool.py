@@ -0,0 +1,76 @@
+# data_filling/tools/media_pool.py
+
+import atexit
+import inspect
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from data_filling.utils.file_cache import FileCache
+
+_POOL: ProcessPoolExecutor | None = None
+_POOL_WORKERS = 0
+_POOL_LOCK = threading.Lock()
+
+
+def get_media_pool(workers: int | None) -> ProcessPoolExecutor | None:
+    """
+    Pool de processus partagé pour le travail PIL / OpenCV (décodage,
+    optimisation, extraction de frames, encodage JPEG).
+
+    workers <= 0 ou None → None (exécution dans le thread appelant).
+    Contexte « spawn » : le process parent fait tourner des threads
+    (boucle asyncio, étages du pipeline), un fork ne serait pas sûr.
+    """
+    global _POOL, _POOL_WORKERS
+    workers = int(workers or 0)
+    if workers <= 0:
+        return None
+
+    with _POOL_LOCK:
+        if _POOL is None or _POOL_WORKERS != workers:
+            if _POOL is not None:
+                _POOL.shutdown(wait=True)
+            _POOL = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _POOL_WORKERS = workers
+    return _POOL
+
+
+def run_in_pool(pool: ProcessPoolExecutor | None, fn, *args, **kwargs):
+    """Exécute fn dans le pool s'il existe, sinon directement."""
+    if pool is None:
+        return fn(*args, **kwargs)
+    return pool.submit(fn, *args, **kwargs).result()
+
+
+def run_cached(cache: FileCache | None, pool: ProcessPoolExecutor | None, fn, path: str, **params):
+    """
+    fn(path, **params) → fichier produit (convert_png_to_jpg, optimize_image),
+    mémorisé dans `cache` par hash du fichier source + paramètres effectifs
+    (valeurs par défaut comprises).
+
+    Renvoie (chemin produit, temporaire) : un fichier du cache n'est pas
+    temporaire, l'appelant ne doit pas le supprimer.
+    """
+    if cache is None:
+        return run_in_pool(pool, fn, path, **params), True
+
+    bound = inspect.signature(fn).bind(path, **params)
+    bound.apply_defaults()
+    source_arg = next(iter(bound.arguments))
+    effective = sorted((k, v) for k, v in bound.arguments.items() if k != source_arg)
+    key = cache.make_key(fn.__name__, cache.hash_file(path), effective)
+
+    hit = cache.get(key)
+    if hit is not None:
+        return hit, False
+    return cache.put(key, run_in_pool(pool, fn, path, **params)), False
+
+
+@atexit.register
+def _shutdown_pool():
+    if _POOL is not None:
+        _POOL.shutdown(wait=False, cancel_futures=True)
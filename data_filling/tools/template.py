@@ -1,8 +1,13 @@
 # data_filling/tools/template.py
 
+import hashlib
 import json
 import re
 import unicodedata
+from copy import deepcopy
+from types import MappingProxyType
+
+from data_filling.tools.build_and_split_prompt import field_fragment
 
 
 def load_template(template_path="data_filling/resources/template_fields.json"):
@@ -54,3 +59,83 @@ def revert_prompt_response(gpt_response: dict, original_template: dict) -> dict:
     return reverted
 
 
+
+
+class CompiledTemplate:
+    """
+    Template compilé une fois (VisionGPTModel.__init__) pour le chemin
+    chaud de predict : rien n'est recopié ni re-sérialisé par ligne.
+
+        - wanted / na_fields : partitions immuables (champs demandés à GPT
+          / remplis par N/A), dans l'ordre du template ;
+        - fragments : JSON de chaque champ tel qu'inséré dans le prompt ;
+        - field_hashes : sha256 de ce fragment (provenance, cf. field_store) ;
+        - accepted : frozenset des valeurs admises (None = texte libre) ;
+        - details : `image_detail` du champ (low / high / auto), s'il est fixé ;
+        - key_to_column : normalized_key → colonne d'origine ;
+        - row_keys / defaults : colonnes de sortie dans l'ordre du template
+          (avec la clé GPT qui les remplit) et valeur par défaut de chacune,
+          pour construire la ligne finale sans copier le template (cf. to_row).
+    """
+
+    def __init__(self, template: dict):
+        self.template = template
+        prompt_template = transform_template_for_prompt(template)
+
+        wanted, na_fields = {}, {}
+        for k, meta in prompt_template.items():
+            if {"prompt_ai", "accepted_values"} <= meta.keys():
+                wanted[k] = MappingProxyType(meta)
+            else:
+                na_fields[k] = "N/A"
+        self.wanted = MappingProxyType(wanted)
+        self.na_fields = MappingProxyType(na_fields)
+
+        self.fragments = MappingProxyType({k: field_fragment(k, meta) for k, meta in wanted.items()})
+        self.field_hashes = MappingProxyType({
+            k: hashlib.sha256(frag.encode("utf-8")).hexdigest()[:16] for k, frag in self.fragments.items()
+        })
+        self.accepted = MappingProxyType({
+            k: frozenset(meta["accepted_values"])
+            if isinstance(meta["accepted_values"], list) and meta["accepted_values"] else None
+            for k, meta in wanted.items()
+        })
+        self.details = MappingProxyType({
+            props["key"]: props["image_detail"]
+            for props in template.values()
+            if props.get("key") in wanted and props.get("image_detail")
+        })
+        self.key_to_column = MappingProxyType({
+            props["key"]: column_name
+            for column_name, props in template.items()
+            if "key" in props
+        })
+        self.row_keys = tuple(
+            (column_name, props["key"] if self.key_to_column[props["key"]] == column_name else None)
+            for column_name, props in template.items()
+        )
+        self.defaults = MappingProxyType(dict(template))
+
+    def revert(self, gpt_response: dict) -> dict:
+        """Équivalent de revert_prompt_response avec la table précalculée."""
+        reverted = {}
+        for norm_key, value in gpt_response.items():
+            original_column = self.key_to_column.get(norm_key)
+            if original_column:
+                reverted[original_column] = value
+            else:
+                print(f"⚠️ Unknown key in GPT response: {norm_key}")
+        return reverted
+
+    def to_row(self, gpt_response: dict) -> dict:
+        """
+        Équivalent de normalize_output(revert(gpt_response), template) :
+        la ligne est construite directement dans l'ordre du template, seule
+        une colonne absente (cas rare) reçoit une copie de sa valeur par défaut.
+        """
+        for norm_key in gpt_response.keys() - self.key_to_column.keys():
+            print(f"⚠️ Unknown key in GPT response: {norm_key}")
+        return {
+            column: gpt_response[key] if key in gpt_response else deepcopy(self.defaults[column])
+            for column, key in self.row_keys
+        }
@@ -1,109 +1,500 @@
 # data_filling/tools/video_to_frames.py
 
 import cv2
+import heapq
 import numpy as np
-import statistics
+import time
 from typing import List
 
+try:  # optionnel : I-frames (video_frame_strategy: keyframes) et scoring rapide
+    import av
+except ImportError:
+    av = None
+
 
 def is_uniform(frame, threshold_std: float = 5.0) -> bool:
     gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
     return np.std(gray) < threshold_std
 
 
+def _open_video(video_path: str):
+    """
+    (conteneur, flux vidéo) PyAV, ou None si PyAV est absent, le fichier
+    illisible pour lui ou sans flux vidéo : l'appelant passe alors par
+    OpenCV. Même choix pour le scoring et la relecture d'un même fichier,
+    donc mêmes index de frames.
+    """
+    if av is None:
+        return None
+    try:
+        container = av.open(video_path)
+    except av.error.FFmpegError:
+        return None
+    if not container.streams.video:
+        container.close()
+        return None
+    stream = container.streams.video[0]
+    stream.thread_type = "AUTO"
+    return container, stream
+
+
+def _read_frames_at(video_path: str, indices: List[int], positions: list | None = None) -> List[np.ndarray]:
+    """
+    Relit les frames d'indices donnés (ordre croissant). Les index sont
+    ceux de _gray_thumbs : ordre de décodage, avec le même décodeur
+    (PyAV si le fichier s'y ouvre, sinon OpenCV, grab() seul pour les
+    frames sautées).
+
+    positions : (pts, I-frame ?) de chaque frame, relevés par _gray_thumbs
+    → seek vers chaque frame retenue au lieu de tout redécoder.
+    """
+    wanted = set(indices)
+    if not wanted:
+        return []
+    if positions and len(positions) > max(wanted):
+        try:
+            return _seek_frames(video_path, sorted(wanted), positions)
+        except ValueError:
+            pass  # horodatages absents / seek imprécis : relecture séquentielle
+    opened = _open_video(video_path)
+    if opened is not None:
+        container, stream = opened
+        frames, last = [], max(wanted)
+        with container:
+            for idx, decoded in enumerate(container.decode(stream)):
+                if idx in wanted:
+                    frames.append(decoded.to_ndarray(format="bgr24"))
+                if idx >= last:
+                    break
+        return frames
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    for idx in range(max(wanted) + 1):
+        if idx in wanted:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        elif not cap.grab():
+            break
+    cap.release()
+    return frames
+
+
+def _seek_frames(video_path: str, wanted: List[int], positions: list) -> List[np.ndarray]:
+    """
+    Frames `wanted` (index croissants) : seek sur la dernière I-frame avant
+    chacune, puis décodage jusqu'à son pts. Tant qu'aucune I-frame ne sépare
+    deux frames retenues, on poursuit le décodage sans seek. Seul ~½ GOP
+    est décodé par frame retenue, au lieu du clip entier. ValueError si un
+    pts manque ou n'est pas retrouvé.
+    """
+    opened = _open_video(video_path)
+    if opened is None:
+        raise ValueError(f"Cannot seek in '{video_path}'.")
+    container, stream = opened
+    keys = np.fromiter((key for _, key in positions), dtype=bool, count=len(positions))
+    frames, decoder, current = [], None, -1
+    with container:
+        for idx in wanted:
+            target = positions[idx][0]
+            if target is None:
+                raise ValueError(f"Missing frame timestamps in '{video_path}'.")
+            if decoder is None or keys[current + 1: idx + 1].any():
+                container.seek(target, stream=stream, backward=True)
+                decoder = container.decode(stream)
+            decoded = None
+            for decoded in decoder:
+                if decoded.pts is None or decoded.pts >= target:
+                    break
+            if decoded is None or decoded.pts != target:
+                raise ValueError(f"Frame {idx} not found after seek in '{video_path}'.")
+            frames.append(decoded.to_ndarray(format="bgr24"))
+            current = idx
+    return frames
+
+
+SCORE_WIDTH = 160   # largeur des vignettes de scoring
+HIST_BINS = 32
+_Y_PLANE_FORMATS = {"yuv420p", "yuvj420p", "yuv422p", "yuvj422p", "yuv444p", "yuvj444p", "nv12", "nv21", "gray"}
+
+
+def _thumb(gray: np.ndarray, width: int) -> np.ndarray:
+    h, w = gray.shape[:2]
+    if w <= width:
+        return gray
+    # bilinéaire : ~20x moins cher qu'INTER_AREA, suffisant pour détecter une coupe
+    return cv2.resize(gray, (width, max(1, round(h * width / w))), interpolation=cv2.INTER_LINEAR)
+
+
+def _y_thumb(decoded, width: int = SCORE_WIDTH) -> np.ndarray:
+    """Vignette grise d'une frame PyAV, lue dans le plan Y quand c'est possible."""
+    if decoded.format.name in _Y_PLANE_FORMATS:
+        plane = decoded.planes[0]
+        gray = np.frombuffer(plane, np.uint8, count=plane.line_size * decoded.height)
+        gray = gray.reshape(decoded.height, plane.line_size)[:, :decoded.width]
+    else:
+        gray = decoded.to_ndarray(format="gray")
+    return _thumb(gray, width)
+
+
+def _decode_range(video_path: str, start: int = 0, stop: int | None = None):
+    """
+    (index, frame PyAV) pour les frames [start, stop) : seek sur l'I-frame
+    précédant `start`, puis décodage jusqu'à elle. L'index est déduit du
+    pts (débit constant) ; un trou ou un décalage, comme un fichier
+    illisible ou sans flux vidéo, lève ValueError, pour que l'appelant
+    repasse en décodage séquentiel.
+    """
+    opened = _open_video(video_path)
+    if opened is None:
+        raise ValueError(f"No decodable video stream in '{video_path}'.")
+    container, stream = opened
+    with container:
+        rate, t0 = stream.average_rate, stream.start_time or 0
+        if not rate:
+            raise ValueError(f"Unknown frame rate in '{video_path}'.")
+        if start > 0:
+            container.seek(t0 + int(start / (rate * stream.time_base)), stream=stream, backward=True)
+        expected = start
+        for decoded in container.decode(stream):
+            if decoded.pts is None:
+                raise ValueError(f"Missing frame timestamps in '{video_path}'.")
+            idx = round((decoded.pts - t0) * stream.time_base * rate)
+            if idx < start:
+                continue
+            if stop is not None and idx >= stop:
+                break
+            if idx != expected:
+                raise ValueError(f"Non-contiguous frame timestamps in '{video_path}'.")
+            expected += 1
+            yield idx, decoded
+
+
+def _gray_thumbs(video_path: str, width: int = SCORE_WIDTH, positions: list | None = None):
+    """
+    Vignettes grises successives du clip, dans l'ordre de décodage (index
+    communs avec _read_frames_at). Avec PyAV, le plan Y décodé sert
+    directement de niveaux de gris : ni conversion BGR ni copie pleine
+    résolution ; `positions` reçoit alors (pts, I-frame ?) de chaque frame.
+    Sinon (PyAV absent ou fichier qu'il ne sait pas ouvrir) OpenCV (read +
+    conversion).
+    """
+    opened = _open_video(video_path)
+    if opened is not None:
+        container, stream = opened
+        with container:
+            for decoded in container.decode(stream):
+                if positions is not None:
+                    positions.append((decoded.pts, decoded.key_frame))
+                yield _y_thumb(decoded, width)
+        return
+
+    cap = cv2.VideoCapture(video_path)
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield _thumb(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), width)
+    cap.release()
+
+
+def _scene_scores(video_path: str, positions: list | None = None) -> np.ndarray:
+    """
+    Score de changement de plan de chaque frame par rapport à la précédente
+    (scores[0] = 0), calculé en flux sur des vignettes basse résolution :
+    moyenne de |Δpixel| / 255 + demi-distance L1 entre histogrammes (une
+    coupe franche change les deux, un simple mouvement surtout le premier).
+    """
+    return _scores_from_thumbs(_gray_thumbs(video_path, positions=positions))
+
+
+def _scores_from_thumbs(thumbs, has_prev: bool = False) -> np.ndarray:
+    """has_prev : la 1ʳᵉ vignette ne sert que de référence (début de segment)."""
+    scores = []
+    prev_gray = prev_hist = None
+    for gray in thumbs:
+        cur_hist = np.bincount((gray // (256 // HIST_BINS)).ravel(), minlength=HIST_BINS) / gray.size
+        if prev_gray is None:
+            if not has_prev:
+                scores.append(0.0)
+        else:
+            pixel = cv2.absdiff(prev_gray, gray).mean() / 255.0
+            scores.append(float(pixel + 0.5 * np.abs(cur_hist - prev_hist).sum()))
+        prev_gray, prev_hist = gray, cur_hist
+    return np.asarray(scores, dtype=np.float64)
+
+
+def _scene_scores_full(video_path: str) -> np.ndarray:
+    """Ancien score (somme des |Δ| pleine résolution, OpenCV) : référence du benchmark."""
+    cap = cv2.VideoCapture(video_path)
+    scores = []
+    prev_gray = None
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        scores.append(float(np.sum(cv2.absdiff(prev_gray, gray))) if prev_gray is not None else 0.0)
+        prev_gray = gray
+    cap.release()
+    return np.asarray(scores, dtype=np.float64)
+
+
+def _select_keyframes(scores: np.ndarray, max_frames: int, min_frames: int, k: float) -> List[int]:
+    """
+    Indices retenus (croissants) : score ≥ moyenne + k·écart-type, plus la
+    première et la dernière frame ; complété jusqu'à `min_frames` puis
+    plafonné à `max_frames` par scores décroissants.
+    """
+    n = len(scores)
+    diffs = scores[1:]
+    threshold = diffs.mean() + k * diffs.std()
+    chosen = np.zeros(n, dtype=bool)
+    chosen[1:] = diffs >= threshold
+    chosen[[0, n - 1]] = True
+
+    by_score = np.argsort(-scores, kind="stable")  # frame 0 : score 0
+    if chosen.sum() < min_frames:
+        extra = by_score[~chosen[by_score]]
+        chosen[extra[: min_frames - chosen.sum()]] = True
+    if chosen.sum() > max_frames:
+        keep = by_score[chosen[by_score]][:max_frames]
+        chosen[:] = False
+        chosen[keep] = True
+    return np.flatnonzero(chosen).tolist()
+
+
 def extract_keyframes_dynamic(video_path: str, fps_target: float = 0.5, k: float = 4.0) -> List[np.ndarray]:
     """
     Extract keyframes dynamically based on inter-frame differences, aiming for ~1 frame every 2 seconds.
+
+    Deux passes, mémoire bornée quelle que soit la durée du clip :
+    1. scoring en flux sur des vignettes basse résolution (_scene_scores),
+       qui relève aussi le pts de chaque frame ;
+    2. seek vers les seules frames sélectionnées (sans PyAV : relecture
+       séquentielle avec grab()).
     """
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
 
         print(f"Error: Cannot open video '{video_path}'.")
         return []
+    cap.release()
 
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    duration_sec = total_frames / fps
-    max_frames = max(3, int(duration_sec * fps_target))  # 1 frame every 2 seconds
-    min_frames = min(3, max_frames)
-
-    ret, prev_frame = cap.read()
-    if not ret:
+    positions = []
+    scores = _scene_scores(video_path, positions)
+    if len(scores) == 0:
         print(f"Error: Empty or corrupted video '{video_path}'.")
         return []
 
-    frames = [prev_frame]
-    diffs = []
+    selected = keyframes_from_scores(video_path, scores, fps_target, k)
+    return [f for f in _read_frames_at(video_path, selected, positions) if not is_uniform(f)]
 
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        frames.append(frame)
 
-        prev_gray = cv2.cvtColor(frames[-2], cv2.COLOR_BGR2GRAY)
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        diff_val = np.sum(cv2.absdiff(prev_gray, gray))
-        diffs.append((diff_val, len(frames) - 1))
+def keyframes_from_scores(video_path: str, scores: np.ndarray, fps_target: float = 0.5, k: float = 4.0) -> List[int]:
+    """Indices des keyframes à partir des scores de tout le clip (~1 frame toutes les 2 s au plus)."""
+    if len(scores) < 2:
+        return [0] if len(scores) else []
+    fps, total_frames = video_meta(video_path)
+    duration_sec = total_frames / fps
+    max_frames = max(3, int(duration_sec * fps_target))  # 1 frame every 2 seconds
+    min_frames = min(3, max_frames)
+    return _select_keyframes(scores, max_frames, min_frames, k)
+
 
+def video_meta(video_path: str) -> tuple[float, int]:
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     cap.release()
+    return fps, total_frames
 
-    if not diffs:
-        return [frames[0]] if not is_uniform(frames[0]) else []
 
-    diff_values = [float(d[0]) for d in diffs]
-    threshold = statistics.mean(diff_values) + k * statistics.pstdev(diff_values)
-    selected = [idx for (val, idx) in diffs if val >= threshold]
+def extract_iframes(video_path: str, fps_target: float = 0.5) -> List[np.ndarray]:
+    """
+    Ne décode que les I-frames de l'encodeur (PyAV, skip_frame="NONKEY") :
+    elles tombent en général sur les changements de plan, sans décoder le
+    reste du flux. Au-delà de ~1 frame toutes les 2 s, on garde la 1ʳᵉ puis
+    les I-frames les plus différentes de la précédente.
 
-    if 0 not in selected:
-        selected.insert(0, 0)
-    if len(frames) - 1 not in selected:
-        selected.append(len(frames) - 1)
+    Sans PyAV, repli sur extract_keyframes_dynamic.
+    """
+    if av is None:
+        print("⚠️ PyAV not installed (pip install -r requirements-video.txt): falling back to dynamic keyframes.")
+        return extract_keyframes_dynamic(video_path, fps_target=fps_target)
 
-    selected = sorted(set(selected))
+    opened = _open_video(video_path)  # illisible ou sans flux vidéo → None
+    if opened is None:
+        print(f"Error: Cannot open video '{video_path}'.")
+        return []
 
-    if len(selected) < min_frames:
-        top_diffs = sorted(diffs, key=lambda x: x[0], reverse=True)
-        needed = min_frames - len(selected)
-        for val, idx in top_diffs:
-            if idx not in selected:
-                selected.append(idx)
-                needed -= 1
-                if needed == 0:
-                    break
-        selected = sorted(set(selected))
+    container, stream = opened
+    with container:
+        stream.codec_context.skip_frame = "NONKEY"
+        duration_sec = float(stream.duration * stream.time_base) if stream.duration else (
+            container.duration / av.time_base if container.duration else 0.0
+        )
+        max_frames = max(3, int(duration_sec * fps_target))
 
-    if len(selected) > max_frames:
-        diff_dict = {idx: val for (val, idx) in diffs if idx in selected}
-        sorted_by_diff = sorted(selected, key=lambda x: diff_dict.get(x, 0), reverse=True)
-        selected = sorted(set(sorted_by_diff[:max_frames]))
+        # mémoire bornée : la 1ʳᵉ I-frame + un tas des max_frames-1 plus gros écarts
+        first, best = None, []
+        prev_gray = None
+        for idx, decoded in enumerate(container.decode(stream)):
+            frame = decoded.to_ndarray(format="bgr24")
+            if is_uniform(frame):
+                continue
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            if first is None:
+                first = frame
+            else:
+                item = (float(np.sum(cv2.absdiff(prev_gray, gray))), -idx, frame)
+                if len(best) < max_frames - 1:
+                    heapq.heappush(best, item)
+                else:
+                    heapq.heappushpop(best, item)
+            prev_gray = gray
 
-    return [frames[i] for i in selected if not is_uniform(frames[i])]
+    if first is None:
+        print(f"Error: Empty or corrupted video '{video_path}'.")
+        return []
+    return [first] + [frame for _, _, frame in sorted(best, key=lambda x: -x[1])]
 
 
 def extract_frames_regularly(video_path: str, fps_target: float = 0.5) -> List[np.ndarray]:
     """
     Extract frames at regular intervals (e.g., every 2 seconds) from a video.
+
+    Les frames sautées passent par grab() seul (ni retrieve() ni conversion
+    BGR) : mêmes frames qu'un read() systématique, pour une fraction du coût.
     """
+    return _sample_regularly(video_path, fps_target)
+
+
+def _sample_regularly(video_path: str, fps_target: float, full_decode: bool = False) -> List[np.ndarray]:
+    """full_decode=True : ancien comportement (read() sur chaque frame), pour le benchmark."""
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         print(f"Error: Cannot open video '{video_path}'.")
         return []
 
     fps = cap.get(cv2.CAP_PROP_FPS)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    interval = max(1, int(fps / fps_target))  # e.g., if fps=30, every 60 frames for 0.5 fps (2s)
+    interval = regular_interval(fps, fps_target)
 
     selected_frames = []
     frame_idx = 0
 
     while True:
-        ret, frame = cap.read()
-        if not ret:
+        if frame_idx % interval == 0 or full_decode:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if frame_idx % interval == 0 and not is_uniform(frame):
+                selected_frames.append(frame)
+        elif not cap.grab():
             break
-        if frame_idx % interval == 0 and not is_uniform(frame):
-            selected_frames.append(frame)
         frame_idx += 1
 
     cap.release()
     return selected_frames
+
+
+def regular_interval(fps: float, fps_target: float = 0.5) -> int:
+    return max(1, int(fps / fps_target))  # e.g., if fps=30, every 60 frames for 0.5 fps (2s)
+
+
+# ---------------------------------------------------------------------- #
+#  Segments : une longue vidéo décodée par tranches dans plusieurs
+#  processus (cf. data/io.get_images_b64_from_case)
+# ---------------------------------------------------------------------- #
+def video_segments(video_path: str, segment_s: float | None) -> list | None:
+    """
+    Tranches [(start, stop)] d'environ `segment_s` secondes (stop=None :
+    jusqu'à la fin) ; None si la vidéo est courte, illisible, ou sans PyAV.
+    Bornes calculées sur les métadonnées PyAV du flux (average_rate, nombre
+    de frames) : le même repère que les index de _decode_range.
+    """
+    if not segment_s:
+        return None
+    opened = _open_video(video_path)
+    if opened is None:
+        return None
+    container, stream = opened
+    with container:
+        rate = stream.average_rate
+        total_frames = stream.frames
+        if rate and not total_frames and stream.duration:
+            total_frames = int(stream.duration * stream.time_base * rate)
+    if not rate or total_frames <= 0:
+        return None
+    step = max(1, int(segment_s * rate))
+    if total_frames <= step:
+        return None
+    bounds = list(range(0, total_frames, step))
+    return list(zip(bounds, bounds[1:])) + [(bounds[-1], None)]
+
+
+def scene_scores_segment(video_path: str, start: int, stop: int | None) -> np.ndarray:
+    """Scores des frames [start, stop) ; la concaténation des segments = _scene_scores."""
+    frames = _decode_range(video_path, max(0, start - 1), stop)
+    return _scores_from_thumbs((_y_thumb(decoded) for _, decoded in frames), has_prev=start > 0)
+
+
+def read_frames_segment(
+    video_path: str,
+    start: int,
+    stop: int | None,
+    indices: List[int] | None = None,
+    interval: int | None = None,
+) -> List[np.ndarray]:
+    """Frames BGR non uniformes de [start, stop) : `indices` (dynamic) ou une toutes les `interval` (regular)."""
+    wanted = set(indices or ())
+    frames = []
+    for idx, decoded in _decode_range(video_path, start, stop):
+        if idx in wanted if indices is not None else idx % interval == 0:
+            frame = decoded.to_ndarray(format="bgr24")
+            if not is_uniform(frame):
+                frames.append(frame)
+    return frames
+
+
+# ---------------------------------------------------------------------- #
+#  Benchmark : python -m data_filling.tools.video_to_frames clip.mp4 [...]
+# ---------------------------------------------------------------------- #
+def _bench(video_paths: List[str], fps_target: float = 0.5):
+    for path in video_paths:
+        t0 = time.perf_counter()
+        ref = _sample_regularly(path, fps_target, full_decode=True)
+        t1 = time.perf_counter()
+        fast = extract_frames_regularly(path, fps_target)
+        t2 = time.perf_counter()
+        same = len(ref) == len(fast) and all(np.array_equal(a, b) for a, b in zip(ref, fast))
+        print(
+            f"🎞️ {path}: regular read() {t1 - t0:.2f}s → grab() {t2 - t1:.2f}s "
+            f"(x{(t1 - t0) / max(t2 - t1, 1e-9):.1f}, {len(fast)} frames, identical={same})"
+        )
+
+        # scoring dynamique : pleine résolution (ancien) vs vignettes + histogrammes
+        cap = cv2.VideoCapture(path)
+        duration_sec = cap.get(cv2.CAP_PROP_FRAME_COUNT) / cap.get(cv2.CAP_PROP_FPS)
+        cap.release()
+        max_frames = max(3, int(duration_sec * fps_target))
+        t0 = time.perf_counter()
+        ref = _scene_scores_full(path)
+        t1 = time.perf_counter()
+        fast = _scene_scores(path)
+        t2 = time.perf_counter()
+        if len(ref) < 2:
+            continue
+        ref_sel = set(_select_keyframes(ref, max_frames, min(3, max_frames), 4.0))
+        fast_sel = set(_select_keyframes(fast, max_frames, min(3, max_frames), 4.0))
+        print(
+            f"🎬 {path}: dynamic scoring full-res {t1 - t0:.2f}s → {SCORE_WIDTH}px {t2 - t1:.2f}s "
+            f"(x{(t1 - t0) / max(t2 - t1, 1e-9):.1f}), keyframes {sorted(ref_sel)} → {sorted(fast_sel)} "
+            f"({len(ref_sel & fast_sel)}/{len(ref_sel)} shared)"
+        )
+
+
+if __name__ == "__main__":
+    import sys
+    _bench(sys.argv[1:])
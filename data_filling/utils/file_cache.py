@@ -0,0 +1,189 @@
+# data_filling/utils/file_cache.py
+
+from __future__ import annotations
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+
+class FileCache:
+    """
+    Cache de fichiers adressés par contenu : un fichier `<clé><ext>` par
+    entrée dans `dir`, partagé entre threads et entre runs.
+
+    Chaque entrée peut porter des métadonnées JSON (`<clé>.meta.json`,
+    p. ex. ETag / Last-Modified d'une URL), supprimées avec elle.
+
+    Éviction LRU par taille (`max_mb`) : la date de modification sert de
+    date de dernier accès (mise à jour à chaque lecture). Les fichiers lus
+    depuis moins de `grace_s` secondes ne sont jamais supprimés, pour ne
+    pas retirer un média entre deux étages du pipeline.
+    """
+
+    _EVICT_EVERY = 50  # écritures entre deux passes d'éviction
+    _EXTS = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp", ".tiff",
+             ".mp4", ".mov", ".avi", ".mkv", ".bin")
+    _META = ".meta.json"
+
+    def __init__(self, cache_dir: str, *, max_mb: float | None = None, grace_s: float = 600):
+        self.dir = cache_dir
+        self.max_bytes = int(float(max_mb) * 1024 * 1024) if max_mb else None
+        self.grace_s = grace_s
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.evict()
+
+    # ------------------------------------------------------------------ #
+    #  Clés
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def hash_file(path: str) -> str:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.sha256(repr(parts).encode("utf-8")).hexdigest()
+
+    # ------------------------------------------------------------------ #
+    #  Lecture / écriture
+    # ------------------------------------------------------------------ #
+    def _find(self, key: str) -> str | None:
+        prefix = os.path.join(self.dir, key)
+        for ext in self._EXTS:
+            if os.path.isfile(prefix + ext):
+                return prefix + ext
+        return None
+
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str, *, count: bool = True) -> str | None:
+        """
+        Chemin du fichier en cache (None si absent). count=False : l'appelant
+        compte lui-même hit / miss (cf. record), p. ex. après revalidation.
+        """
+        path = self._find(key)
+        if path is not None:
+            try:
+                os.utime(path)  # accès → fin de file LRU
+            except FileNotFoundError:  # évincé entre-temps
+                path = None
+        if count:
+            self.record(path is not None)
+        return path
+
+    def meta(self, key: str) -> dict:
+        try:
+            with open(os.path.join(self.dir, key + self._META), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write_atomic(self, final: str, write):
+        part = f"{final}.{uuid.uuid4().hex}.part"
+        write(part)
+        os.replace(part, final)  # atomique : jamais de fichier à moitié écrit
+
+    def put(self, key: str, src_path: str, *, move: bool = True, meta: dict | None = None) -> str:
+        """Range `src_path` sous `key` (déplacé par défaut) et renvoie son chemin."""
+        return self._store(
+            key,
+            os.path.splitext(src_path)[1],
+            lambda part: (shutil.move if move else shutil.copyfile)(src_path, part),
+            meta,
+        )
+
+    def put_bytes(self, key: str, data: bytes, ext: str, *, meta: dict | None = None) -> str:
+        """Comme put, depuis des octets en mémoire (aucun fichier temporaire)."""
+        def write(part):
+            with open(part, "wb") as f:
+                f.write(data)
+        return self._store(key, ext, write, meta)
+
+    def _store(self, key: str, ext: str, write, meta: dict | None) -> str:
+        ext = ext.lower() if ext.lower() in self._EXTS else ".bin"
+        final = os.path.join(self.dir, key + ext)
+        if meta is not None:
+            def write_meta(part):
+                with open(part, "w", encoding="utf-8") as f:
+                    json.dump(meta, f)
+            self._write_atomic(os.path.join(self.dir, key + self._META), write_meta)
+        self._write_atomic(final, write)
+
+        with self._lock:
+            self._writes += 1
+            due = self._writes % self._EVICT_EVERY == 0
+        if due:
+            self.evict()
+        return final
+
+    def evict(self):
+        if not self.max_bytes:
+            return
+        with self._lock:
+            entries, total = [], 0
+            for e in os.scandir(self.dir):
+                if not e.is_file() or e.name.endswith((".part", self._META)):
+                    continue
+                st = e.stat()
+                entries.append((st.st_mtime, st.st_size, e.path))
+                total += st.st_size
+            if total <= self.max_bytes:
+                return
+            horizon = time.time() - self.grace_s
+            for mtime, size, path in sorted(entries):
+                if total <= self.max_bytes or mtime > horizon:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except FileNotFoundError:
+                    pass
+                meta = os.path.splitext(path)[0] + self._META
+                if os.path.exists(meta):
+                    os.remove(meta)
+
+    # ------------------------------------------------------------------ #
+    #  Statistiques
+    # ------------------------------------------------------------------ #
+    def report(self, label: str = "file cache") -> str:
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        return f"🗄️ {label}: {self.hits} hits / {self.misses} misses ({rate:.0f}% hit rate) — {self.dir}"
+
+
+# ---------------------------------------------------------------------- #
+#  Instances partagées (une par dossier)
+# ---------------------------------------------------------------------- #
+_CACHES: dict = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_file_cache(opts: dict | None) -> FileCache | None:
+    """
+    Cache décrit par une section de conf ({dir, max_mb}) ; None si la
+    section est absente ou sans `dir`.
+    """
+    if not opts or not opts.get("dir"):
+        return None
+    with _CACHES_LOCK:
+        cache = _CACHES.get(opts["dir"])
+        if cache is None:
+            cache = FileCache(opts["dir"], max_mb=opts.get("max_mb"))
+            _CACHES[opts["dir"]] = cache
+    return cache
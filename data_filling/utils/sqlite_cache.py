@@ -0,0 +1,168 @@
+# data_filling/utils/sqlite_cache.py
+
+from __future__ import annotations
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class SqliteCache:
+    """
+    Cache clé → texte persistant (SQLite), partagé entre threads.
+
+    Éviction :
+        - par âge (`max_age_days`, depuis l'écriture) ;
+        - par taille (`max_entries`, `max_mb`) : les entrées les moins
+          récemment lues partent en premier (LRU).
+
+    Une lecture ne fait pas de commit : la date d'accès est gardée en
+    mémoire et écrite avec la prochaine écriture / éviction.
+    """
+
+    _EVICT_EVERY = 100  # écritures entre deux passes d'éviction
+
+    def __init__(self, path: str, *, max_entries: int | None = None,
+                 max_mb: float | None = None, max_age_days: float | None = None):
+        self.path = path
+        self.max_entries = int(max_entries) if max_entries else None
+        self.max_bytes = int(float(max_mb) * 1024 * 1024) if max_mb else None
+        self.max_age = float(max_age_days) * 86400 if max_age_days else None
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._touched: dict[str, float] = {}  # clé → dernier accès, pas encore écrit
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_accessed ON entries(accessed)")
+        self._db.commit()
+        self.evict()
+        atexit.register(self.flush)  # dates d'accès encore en mémoire
+
+    # ------------------------------------------------------------------ #
+    #  Clés
+    # ------------------------------------------------------------------ #
+    @staticmethod
+    def make_key(*parts) -> str:
+        """Hash stable d'objets JSON-sérialisables (modèle, messages, …)."""
+        blob = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    # ------------------------------------------------------------------ #
+    #  Lecture / écriture
+    # ------------------------------------------------------------------ #
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, created FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.max_age and now - row[1] > self.max_age):
+                self.misses += 1
+                return None
+            self._touched[key] = now
+            self.hits += 1
+            due = len(self._touched) >= self._EVICT_EVERY
+        if due:
+            self.flush()
+        return row[0]
+
+    def _write_touched(self):
+        """Écrit les dates d'accès en attente (appelé sous self._lock, sans commit)."""
+        if self._touched:
+            self._db.executemany(
+                "UPDATE entries SET accessed = ? WHERE key = ?",
+                [(ts, key) for key, ts in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def flush(self):
+        with self._lock:
+            self._write_touched()
+            self._db.commit()
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._touched.pop(key, None)
+            self._write_touched()
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created, accessed)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now),
+            )
+            self._db.commit()
+            self._writes += 1
+            due = self._writes % self._EVICT_EVERY == 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        with self._lock:
+            self._write_touched()  # l'ordre LRU tient compte des dernières lectures
+            if self.max_age:
+                self._db.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.max_age,))
+            if self.max_entries:
+                self._db.execute(
+                    "DELETE FROM entries WHERE key IN ("
+                    " SELECT key FROM entries ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+            if self.max_bytes:
+                total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+                if total > self.max_bytes:
+                    excess, doomed = total - self.max_bytes, []
+                    for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY accessed"):
+                        if excess <= 0:
+                            break
+                        doomed.append((key,))
+                        excess -= size
+                    self._db.executemany("DELETE FROM entries WHERE key = ?", doomed)
+            self._db.commit()
+
+    # ------------------------------------------------------------------ #
+    #  Statistiques
+    # ------------------------------------------------------------------ #
+    def report(self, label: str = "cache") -> str:
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        return f"🗄️ {label}: {self.hits} hits / {self.misses} misses ({rate:.0f}% hit rate) — {self.path}"
+
+
+# ---------------------------------------------------------------------- #
+#  Instances partagées (une par fichier)
+# ---------------------------------------------------------------------- #
+_CACHES: dict = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_sqlite_cache(opts: dict | None) -> SqliteCache | None:
+    """
+    Cache décrit par une section de conf ({path, max_entries, max_mb,
+    max_age_days}) ; None si la section est absente ou sans `path`.
+    """
+    if not opts or not opts.get("path"):
+        return None
+    with _CACHES_LOCK:
+        cache = _CACHES.get(opts["path"])
+        if cache is None:
+            cache = SqliteCache(
+                opts["path"],
+                max_entries=opts.get("max_entries"),
+                max_mb=opts.get("max_mb"),
+                max_age_days=opts.get("max_age_days"),
+            )
+            _CACHES[opts["path"]] = cache
+    return cache
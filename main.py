@@ -3,7 +3,7 @@
 import yaml
 from data_filling.pipelines.run_from_folder import run_pipeline_folder
 from data_filling.pipelines.run_from_csv    import run_pipeline_csv
-from scripts.batch_pipeline import run_pipeline_batch_all_combinations
+from data_filling.pipelines.run_batch       import run_pipeline_batch
 
 if __name__ == "__main__":
     # Charge la configuration
@@ -11,7 +11,9 @@ if __name__ == "__main__":
         conf = yaml.safe_load(f)
 
     # Lance la bonne pipeline selon la source déclarée
-    if "dataset_link" in conf:
+    if conf.get("execution_mode") == "batch":
+        run_pipeline_batch(conf)
+    elif "dataset_link" in conf:
         run_pipeline_csv(conf)
     else:
         run_pipeline_folder(conf)
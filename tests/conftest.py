@@ -0,0 +1,19 @@
+# tests/conftest.py
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_openai_server import FakeOpenAI  # noqa: E402
+
+TEMPLATE_PATH = os.path.join(os.path.dirname(__file__), "..", "config", "templates", "template_example.json")
+
+
+@pytest.fixture
+def fake_openai():
+    server = FakeOpenAI(polls_to_complete=2).start()
+    yield server
+    server.stop()
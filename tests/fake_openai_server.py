@@ -0,0 +1,205 @@
+# tests/fake_openai_server.py
+"""
+Serveur local qui imite le sous-ensemble de l'API OpenAI utilisé par le
+pipeline : /v1/chat/completions, /v1/files et /v1/batches.
+
+Les réponses sont déterministes : chaque champ demandé reçoit la
+première de ses `accepted_values` (ou "N/A" en texte libre), une requête
+OCR reçoit "OCR TEXT". Un batch passe à `completed` après
+`polls_to_complete` lectures de son statut. Les `rate_limited` prochains
+appels chat reçoivent un 429 (Retry-After: `retry_after_ms`).
+
+    python tests/fake_openai_server.py 8000
+    # conf : openai_base_url: http://127.0.0.1:8000/v1
+"""
+
+import email
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _answer(body: dict) -> str:
+    system = body["messages"][0]["content"]
+    if isinstance(system, str) and "Fields:\n" in system:
+        fields = json.loads(system.split("Fields:\n", 1)[1])
+        return json.dumps({
+            k: meta["accepted_values"][0] if isinstance(meta.get("accepted_values"), list) else "N/A"
+            for k, meta in fields.items()
+        })
+    return "OCR TEXT"
+
+
+def _completion(body: dict) -> dict:
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o"),
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": _answer(body)},
+        }],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    }
+
+
+class FakeOpenAI:
+    """État du serveur (fichiers, batches, compteurs) + thread HTTP."""
+
+    def __init__(self, port: int = 0, polls_to_complete: int = 1):
+        self.polls_to_complete = polls_to_complete
+        self.rate_limited = 0
+        self.retry_after_ms = 50
+        self.files: dict[str, bytes] = {}
+        self.batches: dict[str, dict] = {}
+        self.counts = {"chat": 0, "files": 0, "batches": 0, "polls": 0, "429": 0}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def start(self) -> "FakeOpenAI":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    # ------------------------------------------------------------------ #
+    #  Logique API
+    # ------------------------------------------------------------------ #
+    def _new_file(self, data: bytes, filename: str = "file.jsonl", purpose: str = "batch") -> dict:
+        with self._lock:
+            file_id = f"file-{len(self.files) + 1}"
+            self.files[file_id] = data
+            self.counts["files"] += 1
+        return {"id": file_id, "object": "file", "bytes": len(data), "created_at": int(time.time()),
+                "filename": filename, "purpose": purpose, "status": "processed"}
+
+    def _create_batch(self, req: dict) -> dict:
+        with self._lock:
+            batch_id = f"batch-{len(self.batches) + 1}"
+            n = sum(1 for line in self.files[req["input_file_id"]].splitlines() if line.strip())
+            self.batches[batch_id] = {
+                "id": batch_id, "object": "batch", "endpoint": req["endpoint"],
+                "input_file_id": req["input_file_id"], "completion_window": req["completion_window"],
+                "created_at": int(time.time()), "status": "in_progress", "polls": 0,
+                "output_file_id": None, "error_file_id": None,
+                "request_counts": {"total": n, "completed": 0, "failed": 0},
+            }
+            self.counts["batches"] += 1
+            return self._public(self.batches[batch_id])
+
+    def _retrieve_batch(self, batch_id: str) -> dict | None:
+        with self._lock:
+            batch = self.batches.get(batch_id)
+            if batch is None:
+                return None
+            self.counts["polls"] += 1
+            batch["polls"] += 1
+            if batch["status"] == "in_progress" and batch["polls"] >= self.polls_to_complete:
+                lines = []
+                for line in self.files[batch["input_file_id"]].decode("utf-8").splitlines():
+                    if not line.strip():
+                        continue
+                    req = json.loads(line)
+                    lines.append(json.dumps({
+                        "id": f"resp-{req['custom_id']}",
+                        "custom_id": req["custom_id"],
+                        "response": {"status_code": 200, "body": _completion(req["body"])},
+                        "error": None,
+                    }))
+                output_id = f"file-{len(self.files) + 1}"
+                self.files[output_id] = ("\n".join(lines) + "\n").encode("utf-8")
+                batch["output_file_id"] = output_id
+                batch["status"] = "completed"
+                batch["request_counts"]["completed"] = len(lines)
+            return self._public(batch)
+
+    @staticmethod
+    def _public(batch: dict) -> dict:
+        return {k: v for k, v in batch.items() if k != "polls"}
+
+    # ------------------------------------------------------------------ #
+    #  HTTP
+    # ------------------------------------------------------------------ #
+    def _handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, payload, content_type: str = "application/json", headers=None):
+                data = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _not_found(self):
+                self._send(404, {"error": {"message": f"Unknown route {self.path}", "type": "not_found"}})
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                path = self.path.split("?", 1)[0]
+                if path.endswith("/chat/completions"):
+                    with api._lock:
+                        limited = api.rate_limited > 0
+                        if limited:
+                            api.rate_limited -= 1
+                        api.counts["429" if limited else "chat"] += 1
+                    if limited:
+                        self._send(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                                   headers={"retry-after-ms": str(api.retry_after_ms)})
+                    else:
+                        self._send(200, _completion(json.loads(raw)))
+                elif path.endswith("/files"):
+                    msg = email.message_from_bytes(
+                        f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + raw
+                    )
+                    parts = {p.get_param("name", header="content-disposition"): p for p in msg.get_payload()}
+                    self._send(200, api._new_file(
+                        parts["file"].get_payload(decode=True),
+                        filename=parts["file"].get_filename() or "file.jsonl",
+                        purpose=parts["purpose"].get_payload(),
+                    ))
+                elif path.endswith("/batches"):
+                    self._send(200, api._create_batch(json.loads(raw)))
+                else:
+                    self._not_found()
+
+            def do_GET(self):
+                parts = self.path.split("?", 1)[0].rstrip("/").split("/")
+                if len(parts) >= 2 and parts[-2] == "batches":
+                    batch = api._retrieve_batch(parts[-1])
+                    self._send(200, batch) if batch else self._not_found()
+                elif len(parts) >= 3 and parts[-3] == "files" and parts[-1] == "content":
+                    data = api.files.get(parts[-2])
+                    self._send(200, data, "application/octet-stream") if data is not None else self._not_found()
+                else:
+                    self._not_found()
+
+        return Handler
+
+
+if __name__ == "__main__":
+    server = FakeOpenAI(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8000).start()
+    print(f"🧪 Fake OpenAI API on {server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
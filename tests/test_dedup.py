@@ -0,0 +1,113 @@
+# tests/test_dedup.py
+
+import base64
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from data_filling.data.io import encode_frame_b64
+from data_filling.pipelines.dedup import MediaDeduper, get_deduper
+
+
+def _packshot(color=(40, 90, 200), size=(480, 640), shift: int = 0) -> np.ndarray:
+    img = np.full((*size, 3), 235, np.uint8)
+    h, w = size
+    cv2.rectangle(img, (w // 4 + shift, h // 4), (3 * w // 4 + shift, 3 * h // 4), color, -1)
+    cv2.circle(img, (w // 2 + shift, h // 2), h // 8, (255, 255, 255), -1)
+    return img
+
+
+def _jpeg(img: np.ndarray, quality: int = 95) -> str:
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return base64.b64encode(buf.tobytes()).decode("ascii")
+
+
+def test_exact_key_ignores_order_but_not_context():
+    dedup = MediaDeduper("exact")
+    a, b = encode_frame_b64(_packshot()), encode_frame_b64(_packshot(color=(0, 0, 0)))
+    assert dedup.key([a, b], "ctx") == dedup.key([b, a], "ctx")
+    assert dedup.key([a, b], "ctx") != dedup.key([a, b], "other")
+    assert dedup.key([a], None) == dedup.key([a], "")
+    assert dedup.key([a]) != dedup.key([a, a])
+
+
+def test_perceptual_key_survives_reencoding_and_resizing():
+    dedup = MediaDeduper("perceptual", max_hamming=6)
+    key = dedup.key([_jpeg(_packshot())])
+    assert dedup.key([_jpeg(_packshot(), quality=40)]) == key
+    assert dedup.key([_jpeg(cv2.resize(_packshot(), (320, 240)))]) == key
+    # autre teinte, autre cadrage, autre contexte : jeux distincts
+    assert dedup.key([_jpeg(_packshot(color=(200, 60, 30)))]) != key
+    assert dedup.key([_jpeg(_packshot(shift=150))]) != key
+    assert dedup.key([_jpeg(_packshot())], "other") != key
+
+
+def test_run_predicts_once_per_key_and_returns_copies():
+    dedup = MediaDeduper("exact")
+    calls = []
+
+    def predict():
+        calls.append(1)
+        return {"Brand": "A"}
+
+    first = dedup.run("k", predict)
+    first["Brand"] = "mutated"
+    assert dedup.run("k", predict) == {"Brand": "A"}
+    assert len(calls) == 1
+    assert (dedup.rows, dedup.unique) == (2, 1)
+
+
+def test_concurrent_rows_wait_for_the_original():
+    dedup = MediaDeduper("exact")
+    started, release, calls = threading.Event(), threading.Event(), []
+
+    def predict():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"Brand": "A"}
+
+    results = []
+    owner = threading.Thread(target=lambda: results.append(dedup.run("k", predict)))
+    owner.start()
+    started.wait(5)
+    follower = threading.Thread(target=lambda: results.append(dedup.run("k", predict)))
+    follower.start()
+    release.set()
+    owner.join(5)
+    follower.join(5)
+    assert results == [{"Brand": "A"}] * 2
+    assert len(calls) == 1
+
+
+def test_failed_prediction_is_retried_by_next_row():
+    dedup = MediaDeduper("exact")
+
+    def fail():
+        raise RuntimeError("API down")
+
+    with pytest.raises(RuntimeError):
+        dedup.run("k", fail)
+    assert dedup.run("k", lambda: {"Brand": "B"}) == {"Brand": "B"}
+    assert dedup.unique == 1
+
+
+def test_lru_keeps_max_entries():
+    dedup = MediaDeduper("perceptual", max_entries=2)
+    keys = [dedup.key([_jpeg(_packshot(color=c))]) for c in ((40, 90, 200), (200, 60, 30), (30, 200, 60))]
+    for key in keys[:2]:
+        dedup.run(key, dict)
+    dedup.run(keys[0], dict)  # relu : keys[1] devient le plus ancien
+    dedup.run(keys[2], dict)
+
+    assert list(dedup._results) == [keys[0], keys[2]]
+    assert sum(len(known) for known in dedup._signatures.values()) == 2
+
+
+def test_get_deduper():
+    assert get_deduper({}) is None
+    assert get_deduper({"dedup_media": "perceptual", "dedup_max_hamming": 3}).max_hamming == 3
+    with pytest.raises(ValueError):
+        get_deduper({"dedup_media": "fuzzy"})
@@ -0,0 +1,100 @@
+# tests/test_download_cache.py
+
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from data_filling.pipelines.tool_pipeline import download_image_cached
+from data_filling.utils.file_cache import FileCache
+
+
+class _Origin:
+    """Serveur d'images local : ETag sur /etag.jpg, aucun validateur sur /plain.jpg."""
+
+    def __init__(self):
+        self.body = b"\xff\xd8 version 1"
+        self.counts = {200: 0, 304: 0}
+        origin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                etag = '"%s"' % hashlib.sha256(origin.body).hexdigest()[:12]
+                if self.path == "/etag.jpg" and self.headers.get("If-None-Match") == etag:
+                    origin.counts[304] += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                origin.counts[200] += 1
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(origin.body)))
+                if self.path == "/etag.jpg":
+                    self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(origin.body)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}{path}"
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def origin():
+    server = _Origin()
+    yield server
+    server.stop()
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_304_reuses_cached_body(tmp_path, origin):
+    cache = FileCache(str(tmp_path / "downloads"))
+    url = origin.url("/etag.jpg")
+
+    path, temporary = download_image_cached(url, cache)
+    assert not temporary and _read(path) == origin.body
+    assert download_image_cached(url, cache) == (path, False)
+    assert origin.counts == {200: 1, 304: 1}
+    assert download_image_cached(url, cache, in_memory=True) == (origin.body, False)
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    origin.body = b"\xff\xd8 version 2"  # ressource modifiée : nouvel ETag → 200
+    path, _ = download_image_cached(url, cache)
+    assert _read(path) == b"\xff\xd8 version 2"
+    assert origin.counts == {200: 2, 304: 2}
+
+
+def test_unreachable_origin_serves_cached_copy(tmp_path, origin):
+    cache = FileCache(str(tmp_path / "downloads"))
+    url = origin.url("/etag.jpg")
+    path, _ = download_image_cached(url, cache)
+    origin.stop()
+
+    assert download_image_cached(url, cache, retries=1) == (path, False)
+
+
+def test_response_without_validators_is_not_cached(tmp_path, origin):
+    cache = FileCache(str(tmp_path / "downloads"))
+    url = origin.url("/plain.jpg")
+    for _ in range(2):
+        path, temporary = download_image_cached(url, cache)
+        assert temporary and _read(path) == origin.body
+        os.remove(path)
+    assert origin.counts == {200: 2, 304: 0}
+    assert os.listdir(cache.dir) == []
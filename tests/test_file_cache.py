@@ -0,0 +1,73 @@
+# tests/test_file_cache.py
+
+import os
+
+import cv2
+import numpy as np
+
+from data_filling.pipelines.tool_pipeline import optimize_image
+from data_filling.tools.media_pool import run_cached
+from data_filling.utils.file_cache import FileCache, get_file_cache
+
+
+def _png(path, value: int = 120) -> str:
+    img = np.zeros((200, 300, 3), np.uint8)
+    img[50:150, 80:220] = value
+    cv2.imwrite(str(path), img)
+    return str(path)
+
+
+def test_put_get_and_meta(tmp_path):
+    cache = FileCache(str(tmp_path / "cache"))
+    src = tmp_path / "src.jpg"
+    src.write_bytes(b"jpeg")
+
+    path = cache.put("k1", str(src), meta={"etag": '"v1"'})
+    assert not src.exists()  # déplacé par défaut
+    assert cache.get("k1") == path and path.endswith(".jpg")
+    assert cache.meta("k1") == {"etag": '"v1"'}
+    assert open(cache.put_bytes("k2", b"raw", ".xyz"), "rb").read() == b"raw"  # extension inconnue → .bin
+    assert cache.get("absent") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert not [f for f in os.listdir(cache.dir) if f.endswith(".part")]
+
+
+def test_lru_eviction_by_size(tmp_path):
+    cache = FileCache(str(tmp_path / "cache"), max_mb=2500 / 1024 / 1024, grace_s=0)
+    for i, key in enumerate(("a", "b", "c")):
+        path = cache.put_bytes(key, b"x" * 1000, ".bin", meta={"n": i})
+        os.utime(path, (1000 + i, 1000 + i))
+    os.utime(cache.get("a"), (2000, 2000))  # relu : "b" devient le plus ancien
+
+    cache.evict()
+    assert [cache.get(k) is not None for k in ("a", "b", "c")] == [True, False, True]
+    assert cache.meta("b") == {}  # métadonnées supprimées avec l'entrée
+
+
+def test_grace_period_protects_recent_files(tmp_path):
+    cache = FileCache(str(tmp_path / "cache"), max_mb=500 / 1024 / 1024)  # grace_s par défaut
+    cache.put_bytes("a", b"x" * 1000, ".bin")
+    cache.evict()
+    assert cache.get("a") is not None
+
+
+def test_run_cached_keys_on_source_and_params(tmp_path):
+    cache = get_file_cache({"dir": str(tmp_path / "media")})
+    src = _png(tmp_path / "img.png")
+
+    first, temporary = run_cached(cache, None, optimize_image, src)
+    assert not temporary and first.startswith(cache.dir)
+    assert run_cached(cache, None, optimize_image, src, max_size=1024) == (first, False)  # défaut explicite
+    assert cache.hits == 1
+
+    other, _ = run_cached(cache, None, optimize_image, src, max_size=64)
+    assert other != first
+    assert max(cv2.imread(other).shape[:2]) <= 64
+
+    _png(src, value=200)  # même nom, autre contenu
+    assert run_cached(cache, None, optimize_image, src)[0] != first
+    assert cache.misses == 3
+
+    out, temporary = run_cached(None, None, optimize_image, src)
+    assert temporary
+    os.remove(out)
@@ -0,0 +1,30 @@
+# tests/test_frame_pruning.py
+
+import pytest
+
+from data_filling.tools.frame_pruning import prune_similar, pruning_settings
+
+
+@pytest.mark.parametrize("value, expected", [
+    (None, None),
+    (False, None),
+    (True, {"max_hamming": 6, "max_frames": None}),
+    ({"max_frames": 4}, {"max_hamming": 6, "max_frames": 4}),
+    ({"max_hamming": "3", "max_frames": None}, {"max_hamming": 3, "max_frames": None}),
+])
+def test_pruning_settings(value, expected):
+    assert pruning_settings(value) == expected
+
+
+@pytest.mark.parametrize("value", ["yes", 6, ["max_frames", 4]])
+def test_pruning_settings_rejects_other_types(value):
+    with pytest.raises(ValueError, match="frame_pruning"):
+        pruning_settings(value)
+
+
+def test_prune_similar_drops_near_duplicates_then_caps():
+    sigs = [0, 0b1, 0xFFFF, 0xFFFF_0000_0000, 0xFFFF_FFFF_FFFF_FFFF]
+    # 0b1 est à 1 bit de 0 : doublon
+    assert prune_similar(sigs, **pruning_settings(True)) == [0, 2, 3, 4]
+    # plafond : la 1ʳᵉ puis la plus éloignée, en ordre d'origine
+    assert prune_similar(sigs, max_hamming=6, max_frames=2) == [0, 4]
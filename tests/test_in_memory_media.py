@@ -0,0 +1,57 @@
+# tests/test_in_memory_media.py
+
+import cv2
+import numpy as np
+import pytest
+
+from data_filling.data.io import get_images_b64_from_case
+from data_filling.pipelines.run_from_folder import build_folder_media_stages, iter_folder_jobs
+from data_filling.pipelines.streaming import run_stages
+from data_filling.pipelines.tool_pipeline import load_image_array
+
+
+def _packshot() -> np.ndarray:
+    img = np.full((240, 320, 3), 250, np.uint8)
+    cv2.rectangle(img, (80, 60), (240, 180), (30, 120, 200), -1)
+    return img
+
+
+@pytest.fixture
+def folder(tmp_path):
+    row = tmp_path / "data" / "row_a"
+    row.mkdir(parents=True)
+    cv2.imwrite(str(row / "a.jpg"), _packshot())
+    cv2.imwrite(str(row / "b.png"), _packshot()[:, ::-1])
+    data = cv2.imencode(".jpg", _packshot())[1].tobytes()
+    (row / "c_truncated.jpg").write_bytes(data[: len(data) * 2 // 3])  # illisible pour PIL
+    return str(tmp_path / "data")
+
+
+def _preprocessed(conf: dict) -> list:
+    stages = build_folder_media_stages(conf, model=None)[:2]  # fetch → preprocess
+    [(job, ok)] = list(run_stages(iter_folder_jobs(conf), stages))
+    assert ok
+    return job["media"]
+
+
+def test_bytes_decode_like_imread(folder):
+    for name in ("a.jpg", "b.png", "c_truncated.jpg"):  # JPEG tronqué : EOI fictif comme imread
+        path = f"{folder}/row_a/{name}"
+        with open(path, "rb") as f:
+            np.testing.assert_array_equal(load_image_array(f.read()), cv2.imread(path))
+
+
+def test_in_memory_images_encode_like_files(folder):
+    conf = {"data_path": folder}
+    paths = _preprocessed(conf)
+    arrays = _preprocessed({**conf, "in_memory_media": True})
+    assert all(isinstance(a, np.ndarray) for a in arrays)
+    assert get_images_b64_from_case(arrays) == get_images_b64_from_case(paths)
+
+
+def test_failed_optimize_falls_back_to_plain_decode(folder):
+    conf = {"data_path": folder, "optimize_image": True}
+    arrays = _preprocessed({**conf, "in_memory_media": True})
+    assert len(arrays) == 3  # c_truncated : optimisation impossible, décodage simple
+    assert max(arrays[0].shape[:2]) <= 1024
+    assert len(_preprocessed(conf)) == 2  # chemin fichier : l'image est abandonnée
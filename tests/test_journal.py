@@ -0,0 +1,77 @@
+# tests/test_journal.py
+
+import os
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from conftest import TEMPLATE_PATH
+from data_filling.pipelines.run_from_folder import run_pipeline_folder
+from data_filling.pipelines.streaming import Journal
+
+
+def test_resume_skips_done_rows_and_drops_truncated_line(tmp_path):
+    out = str(tmp_path / "out.csv")
+    journal = Journal(out)
+    journal.append("b", 1, {"row_id": "b", "v": "1"})
+    with open(journal.path, "a", encoding="utf-8") as f:
+        f.write('{"row_id": "c", "v"')  # crash au milieu d'une écriture
+
+    resumed = Journal(out, resume=True)
+    assert resumed.done == {"b"}
+    resumed.append("a", 0, {"row_id": "a", "v": "0"})
+    resumed.append("b", 1, {"row_id": "b", "v": "1 bis"})  # dernier enregistrement gagnant
+    resumed.append("c", 2, {"row_id": "c", "v": "2"})
+
+    assert resumed.finalize(out, {}, index_col="row_id") == 3
+    df = pd.read_csv(out, dtype=str)
+    assert list(df.columns) == ["row_id", "v"]
+    assert df.values.tolist() == [["a", "0"], ["b", "1 bis"], ["c", "2"]]
+    assert not os.path.exists(journal.path)
+
+
+def test_without_resume_the_journal_starts_empty(tmp_path):
+    out = str(tmp_path / "out.csv")
+    Journal(out).append("a", 0, {"row_id": "a"})
+    assert Journal(out).done == set()
+    assert not os.path.exists(out + ".journal.jsonl")
+
+
+def _conf(tmp_path, base_url: str) -> dict:
+    data = tmp_path / "data"
+    for i, row_id in enumerate(["row_a", "row_b", "row_c"]):
+        (data / row_id).mkdir(parents=True)
+        cv2.imwrite(str(data / row_id / "packshot.jpg"), np.full((64, 64, 3), 60 * (i + 1), np.uint8))
+    return {
+        "model": "vision_gpt",
+        "openai_api_key": "test",
+        "openai_base_url": base_url,
+        "template_path": TEMPLATE_PATH,
+        "data_path": str(data),
+        "output_path": str(tmp_path / "out" / "predictions.csv"),
+    }
+
+
+def test_folder_run_resumes_from_journal(tmp_path, fake_openai):
+    conf = _conf(tmp_path, fake_openai.base_url)
+    run_pipeline_folder(conf)
+    clean = pd.read_csv(conf["output_path"], dtype=str)
+    calls_per_row = fake_openai.counts["chat"] // 3
+    assert calls_per_row and fake_openai.counts["chat"] == 3 * calls_per_row
+
+    # run interrompu : row_b déjà journalisée, avec une valeur reconnaissable
+    kept = clean.set_index("row_id").loc["row_b"].to_dict()
+    kept["Brand"] = "from journal"
+    os.makedirs(os.path.dirname(conf["output_path"]), exist_ok=True)
+    Journal(conf["output_path"]).append("row_b", "row_b", {**kept, "row_id": "row_b"})
+
+    fake_openai.counts["chat"] = 0
+    run_pipeline_folder({**conf, "resume": True})
+    resumed = pd.read_csv(conf["output_path"], dtype=str)
+
+    assert fake_openai.counts["chat"] == 2 * calls_per_row
+    assert list(resumed["row_id"]) == ["row_a", "row_b", "row_c"]
+    assert list(resumed.columns) == list(clean.columns)
+    assert resumed.set_index("row_id").loc["row_b", "Brand"] == "from journal"
+    pd.testing.assert_frame_equal(resumed.drop(columns="Brand"), clean.drop(columns="Brand"))
@@ -0,0 +1,86 @@
+# tests/test_rate_limiter.py
+
+import time
+import types
+
+import pytest
+
+from data_filling.agents import TextExtractionAgent
+from data_filling.agents import rate_limiter
+from data_filling.agents.rate_limiter import RateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Horloge figée du module : le test avance le temps lui-même."""
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter, "time", types.SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_rpm_bucket_spaces_requests(clock):
+    limiter = RateLimiter(rpm=60)
+    assert [limiter._reserve(0) for _ in range(60)] == [0.0] * 60
+    assert limiter._reserve(0) == pytest.approx(1.0)   # 1 requête / s une fois le seau vide
+    assert limiter._reserve(0) == pytest.approx(2.0)   # servies dans l'ordre d'arrivée
+    clock[0] += 3.0
+    assert limiter._reserve(0) == 0.0
+    assert limiter.stats()["throttled"] == 2
+
+
+def test_tpm_bucket_counts_estimated_tokens(clock):
+    limiter = RateLimiter(tpm=6000)
+    assert limiter._reserve(5000) == 0.0
+    assert limiter._reserve(1600) == pytest.approx(6.0)  # 600 tokens de dette à 100 tokens/s
+    clock[0] += 6.0
+    assert limiter._reserve(0) == 0.0
+    # une requête plus grosse que le TPM ne bloque pas indéfiniment
+    assert limiter._reserve(50_000) == pytest.approx(60.0)
+
+
+def test_headers_set_limits_and_pause(clock):
+    limiter = RateLimiter()
+    assert limiter._reserve(10_000) == 0.0  # limites inconnues : pas d'attente
+    limiter.update_from_headers({
+        "x-ratelimit-limit-requests": "100",
+        "x-ratelimit-remaining-requests": "0",
+        "x-ratelimit-reset-requests": "1.5s",
+        "x-ratelimit-limit-tokens": "30000",
+        "x-ratelimit-remaining-tokens": "29000",
+    })
+    assert limiter._reserve(100) == pytest.approx(1.5)  # reset-requests
+    clock[0] += 2.0
+    assert limiter._reserve(100) == 0.0
+
+
+def test_429_pauses_every_caller(clock):
+    limiter = RateLimiter(rpm=1000)
+    assert limiter.on_rate_limited({"retry-after-ms": "250"}) == pytest.approx(0.25)
+    assert limiter.on_rate_limited({"retry-after": "2"}) == pytest.approx(2.0)
+    assert limiter._reserve(0) == pytest.approx(2.0)
+    assert limiter.on_rate_limited(None) == 1.0
+    assert limiter.stats()["rate_limited"] == 3
+
+
+def test_agent_retries_after_429(fake_openai):
+    fake_openai.rate_limited = 2
+    agent = TextExtractionAgent({"openai_api_key": "test", "openai_base_url": fake_openai.base_url})
+    agent._limiter = RateLimiter()  # l'instance du process est partagée entre tests
+
+    start = time.monotonic()
+    assert agent.extract(["eA=="]) == "OCR TEXT"
+    assert fake_openai.counts["429"] == 2 and fake_openai.counts["chat"] == 1
+    assert time.monotonic() - start >= 2 * fake_openai.retry_after_ms / 1000
+    assert agent._limiter.stats()["rate_limited"] == 2
+
+
+def test_agent_gives_up_after_max_retries(fake_openai):
+    fake_openai.rate_limited = 10
+    agent = TextExtractionAgent({
+        "openai_api_key": "test", "openai_base_url": fake_openai.base_url,
+        "rate_limit": {"max_retries": 1},
+    })
+    agent._limiter = RateLimiter()
+    with pytest.raises(Exception, match="Rate limit"):
+        agent.extract(["eA=="])
+    assert fake_openai.counts["429"] == 2 and fake_openai.counts["chat"] == 0
@@ -0,0 +1,76 @@
+# tests/test_run_batch.py
+
+import json
+import os
+import types
+
+import cv2
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import TEMPLATE_PATH
+from data_filling.pipelines import run_batch
+from data_filling.pipelines.run_batch import BatchRun
+
+
+class _Interrupted(Exception):
+    pass
+
+
+def _conf(tmp_path, base_url: str) -> dict:
+    data = tmp_path / "data"
+    for i, row_id in enumerate(["row_a", "row_b"]):
+        (data / row_id).mkdir(parents=True)
+        img = np.full((64, 64, 3), 40 * (i + 1), np.uint8)
+        cv2.imwrite(str(data / row_id / "packshot.jpg"), img)
+    return {
+        "model": "vision_gpt",
+        "openai_api_key": "test",
+        "openai_base_url": base_url,
+        "template_path": TEMPLATE_PATH,
+        "data_path": str(data),
+        "output_path": str(tmp_path / "out" / "predictions.csv"),
+        "execution_mode": "batch",
+        "batch": {"work_dir": str(tmp_path / "work"), "poll_interval": 0},
+    }
+
+
+def test_batch_run_completes(tmp_path, fake_openai):
+    conf = _conf(tmp_path, fake_openai.base_url)
+    BatchRun(conf).run()
+
+    out = pd.read_csv(conf["output_path"])
+    assert len(out) == 2
+    assert set(out["Brand"]) == {"Value1"}
+    assert fake_openai.counts["batches"] == 1
+    assert fake_openai.counts["chat"] == 0
+
+
+def test_batch_run_resumes_from_state(tmp_path, fake_openai, monkeypatch):
+    conf = _conf(tmp_path, fake_openai.base_url)
+
+    # 1er run : interrompu pendant l'attente du batch (process tué)
+    def interrupt(_seconds):
+        raise _Interrupted()
+
+    monkeypatch.setattr(run_batch, "time", types.SimpleNamespace(sleep=interrupt))
+    with pytest.raises(_Interrupted):
+        BatchRun(conf).run()
+
+    state_path = os.path.join(conf["batch"]["work_dir"], "state.json")
+    with open(state_path, "r", encoding="utf-8") as f:
+        state = json.load(f)
+    assert state["prepared"] and len(state["rows"]) == 2
+    assert state["rounds"]["main"]["parts"][0]["batch_id"]
+    assert not os.path.exists(conf["output_path"])
+
+    # 2e run : reprise depuis state.json, sans resoumettre le batch
+    monkeypatch.undo()
+    BatchRun(conf).run()
+
+    assert fake_openai.counts["files"] == 1  # fichier d'entrée non renvoyé
+    assert fake_openai.counts["batches"] == 1
+    out = pd.read_csv(conf["output_path"])
+    assert len(out) == 2
+    assert set(out["Category"]) == {"Category1"}
@@ -0,0 +1,42 @@
+# tests/test_split_prompt.py
+
+import cv2
+import numpy as np
+import pytest
+
+from conftest import TEMPLATE_PATH
+from data_filling.data.io import encode_frame_b64
+from data_filling.tools.build_and_split_prompt import estimate_tokens_from_messages, build_prompt_messages, smart_split_prompt
+from data_filling.tools.image_payload import b64_image_tokens
+from data_filling.tools.template import CompiledTemplate, load_template
+
+
+def _frame_720p() -> str:
+    rng = np.random.default_rng(0)
+    frame = cv2.GaussianBlur((rng.random((720, 1280, 3)) * 255).astype(np.uint8), (0, 0), 3)
+    return encode_frame_b64(frame)
+
+
+@pytest.mark.parametrize("model", ["gpt-4o", "gpt-4o-mini"])
+def test_split_with_images_fits_budget(model):
+    compiled = CompiledTemplate(load_template(TEMPLATE_PATH))
+    images = [_frame_720p()] * 4
+
+    chunks = smart_split_prompt(
+        dict(compiled.wanted), images, model=model, max_tokens=10_000,
+        fragments=compiled.fragments, details=compiled.details,
+    )
+
+    # un chunk par niveau de détail, pas un par champ (ni abandon → N/A)
+    assert [detail for _, _, detail in chunks] == [None, "low"]
+    assert sorted(k for fields, _, _ in chunks for k in fields) == sorted(compiled.wanted)
+    for fields, imgs, detail in chunks:
+        messages = build_prompt_messages(fields, imgs, fragments=compiled.fragments, detail=detail)
+        assert estimate_tokens_from_messages(messages, model) <= 10_000
+
+
+def test_mini_pricing_is_not_the_context_budget():
+    image = _frame_720p()
+    assert b64_image_tokens(image, model="gpt-4o-mini") > 10_000  # coût facturé
+    messages = build_prompt_messages({}, [image], detail="high")
+    assert estimate_tokens_from_messages(messages, "gpt-4o-mini") < 1_500
@@ -0,0 +1,98 @@
+# tests/test_sqlite_cache.py
+
+import asyncio
+import sqlite3
+import types
+
+import numpy as np
+import pytest
+
+from data_filling.agents import SplitVisionAgent
+from data_filling.data.io import encode_frame_b64
+from data_filling.utils import sqlite_cache
+from data_filling.utils.sqlite_cache import SqliteCache, get_sqlite_cache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(sqlite_cache, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def _accessed(path, key):
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT accessed FROM entries WHERE key = ?", (key,)).fetchone()[0]
+
+
+def test_values_persist_across_instances(tmp_path):
+    path = str(tmp_path / "c.sqlite")
+    key = SqliteCache.make_key("gpt-4o", [{"role": "user", "content": "é"}], None)
+    assert key == SqliteCache.make_key("gpt-4o", [{"content": "é", "role": "user"}], None)
+
+    SqliteCache(path).set(key, "réponse")
+    cache = SqliteCache(path)
+    assert cache.get(key) == "réponse"
+    assert cache.get("absent") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_reads_are_not_committed_until_flush(tmp_path, clock):
+    path = str(tmp_path / "c.sqlite")
+    cache = SqliteCache(path)
+    cache.set("k", "v")
+    clock[0] += 10
+    assert cache.get("k") == "v"
+    assert _accessed(path, "k") == 1_700_000_000.0  # date d'accès gardée en mémoire
+    cache.flush()
+    assert _accessed(path, "k") == 1_700_000_010.0
+
+
+def test_lru_eviction_counts_unflushed_reads(tmp_path, clock):
+    cache = SqliteCache(str(tmp_path / "c.sqlite"), max_entries=2)
+    for key in ("a", "b"):
+        cache.set(key, key)
+        clock[0] += 1
+    cache.get("a")  # "b" devient la moins récemment lue
+    clock[0] += 1
+    cache.set("c", "c")
+    cache.evict()
+    assert [cache.get(k) for k in ("a", "b", "c")] == ["a", None, "c"]
+
+
+def test_size_and_age_limits(tmp_path, clock):
+    cache = SqliteCache(str(tmp_path / "c.sqlite"), max_mb=1500 / 1024 / 1024, max_age_days=1)
+    for key in ("a", "b", "c"):
+        cache.set(key, "x" * 600)
+        clock[0] += 1
+    cache.evict()
+    assert [cache.get(k) for k in ("a", "b", "c")] == [None, "x" * 600, "x" * 600]
+
+    clock[0] += 86400
+    assert cache.get("c") is None  # expirée à la lecture
+    cache.evict()
+    assert cache._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0] == 0
+
+
+def test_shared_instance_per_path(tmp_path):
+    opts = {"path": str(tmp_path / "shared.sqlite")}
+    assert get_sqlite_cache(opts) is get_sqlite_cache(dict(opts))
+    assert get_sqlite_cache({"path": None}) is None
+    assert get_sqlite_cache(None) is None
+
+
+def test_response_cache_skips_repeated_calls(tmp_path, fake_openai):
+    agent = SplitVisionAgent({
+        "openai_api_key": "test",
+        "openai_base_url": fake_openai.base_url,
+        "response_cache": {"path": str(tmp_path / "responses.sqlite")},
+    })
+    image = encode_frame_b64(np.full((64, 64, 3), 90, np.uint8))
+    fields = {"brand": {"prompt_ai": "Brand?", "accepted_values": ["A", "B"]}}
+
+    for _ in range(2):
+        assert asyncio.run(agent._call_gpt(fields, [image], None, None)) == {"brand": "A"}
+    assert fake_openai.counts["chat"] == 1
+    # contexte différent → autres messages → nouvel appel
+    asyncio.run(agent._call_gpt(fields, [image], None, "other context"))
+    assert fake_openai.counts["chat"] == 2
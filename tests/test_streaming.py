@@ -0,0 +1,94 @@
+# tests/test_streaming.py
+
+import random
+import threading
+import time
+
+import pytest
+
+from data_filling.pipelines.streaming import Stage, run_stages
+
+
+def _collect(items, stages, timeout: float = 10.0, **kw):
+    """run_stages dans un thread : un blocage fait échouer le test au lieu de le figer."""
+    result = {}
+
+    def target():
+        out = []
+        try:
+            for job, ok in run_stages(items, stages, **kw):
+                out.append((job["id"], ok))
+        except BaseException as e:
+            result["error"] = e
+        result["out"] = out
+
+    t = threading.Thread(target=target, daemon=True)
+    t.start()
+    t.join(timeout)
+    assert not t.is_alive(), "run_stages is blocked"
+    return result
+
+
+def test_jobs_come_back_in_input_order():
+    rng = random.Random(0)
+
+    def slow(job):
+        time.sleep(rng.random() * 0.01)
+        job["seen"] = True
+        return job
+
+    res = _collect(({"id": i} for i in range(50)), [Stage("a", slow, 4), Stage("b", slow, 3)], queue_size=2)
+    assert res["out"] == [(i, True) for i in range(50)]
+
+
+def test_dropped_and_failed_jobs_skip_later_stages():
+    calls = []
+
+    def first(job):
+        if job["id"] == 1:
+            return None  # abandonné
+        if job["id"] == 2:
+            raise RuntimeError("boom")
+        return job
+
+    def second(job):
+        calls.append(job["id"])
+        return job
+
+    res = _collect(({"id": i} for i in range(4)), [Stage("a", first, 2), Stage("b", second)])
+    assert res["out"] == [(0, True), (1, False), (2, False), (3, True)]
+    assert sorted(calls) == [0, 3]
+
+
+def test_feeder_error_is_raised_in_caller():
+    def items():
+        yield {"id": 0}
+        raise KeyError("dataset_link.column")
+
+    res = _collect(items(), [Stage("a", lambda job: job, 2), Stage("b", lambda job: job)])
+    assert isinstance(res["error"], KeyError)
+    assert res["out"] == [(0, True)]
+
+
+def test_feeder_error_before_first_job():
+    def items():
+        raise FileNotFoundError("missing.csv")
+        yield  # pragma: no cover
+
+    res = _collect(items(), [Stage("a", lambda job: job, 3)])
+    assert isinstance(res["error"], FileNotFoundError)
+    assert res["out"] == []
+
+
+def test_early_exit_releases_threads():
+    gen = run_stages(({"id": i} for i in range(1000)), [Stage("a", lambda job: job, 2)], queue_size=1)
+    assert next(gen)[0]["id"] == 0
+    gen.close()  # l'appelant s'arrête : aucun thread ne doit rester bloqué
+    time.sleep(0.1)
+    assert not [t for t in threading.enumerate() if t.name.startswith("stage-")]
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_empty_input(workers):
+    res = _collect(iter(()), [Stage("a", lambda job: job, workers)])
+    assert res == {"out": []}
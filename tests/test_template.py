@@ -0,0 +1,26 @@
+# tests/test_template.py
+
+from conftest import TEMPLATE_PATH
+from data_filling.tools.normalization import normalize_output
+from data_filling.tools.template import CompiledTemplate, load_template
+
+
+def test_to_row_matches_revert_then_normalize():
+    template = load_template(TEMPLATE_PATH)
+    compiled = CompiledTemplate(template)
+    keys = list(compiled.key_to_column)
+
+    for response in (
+        {k: f"v{i}" for i, k in enumerate(keys)},       # ligne complète
+        {k: "x" for k in keys[::2]},                    # colonnes manquantes
+        {keys[0]: "x", "not_in_template": "y"},         # clé inconnue ignorée
+    ):
+        expected = normalize_output(compiled.revert(response), template)
+        row = compiled.to_row(response)
+        assert row == expected
+        assert list(row) == list(expected)
+
+    # la valeur par défaut est une copie : le template maître reste intact
+    row = compiled.to_row({})
+    row[next(iter(row))]["mutated"] = True
+    assert "mutated" not in template[next(iter(template))]
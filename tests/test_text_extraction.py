@@ -0,0 +1,40 @@
+# tests/test_text_extraction.py
+
+import numpy as np
+import pytest
+
+from data_filling.agents import TextExtractionAgent
+from data_filling.data.io import encode_frame_b64
+
+
+def _image(value: int) -> str:
+    return encode_frame_b64(np.full((32, 32, 3), value, np.uint8))
+
+
+@pytest.mark.parametrize("section", ["ocr_cache", "response_cache"])
+def test_ocr_is_cached_per_image(tmp_path, fake_openai, section):
+    conf = {
+        "openai_api_key": "test",
+        "openai_base_url": fake_openai.base_url,
+        section: {"path": str(tmp_path / f"{section}.sqlite")},
+    }
+    agent = TextExtractionAgent(conf)
+    packshot, other = _image(40), _image(200)
+
+    assert agent.extract([packshot]) == "OCR TEXT"
+    # seule la 1ʳᵉ image compte : les suivantes ne changent pas la clé
+    assert agent.extract([packshot, other]) == "OCR TEXT"
+    assert fake_openai.counts["chat"] == 1
+
+    # nouvel agent (autre run) sur le même fichier : toujours en cache
+    assert TextExtractionAgent(conf).lookup([packshot]) == "OCR TEXT"
+    assert agent.extract([other]) == "OCR TEXT"
+    assert fake_openai.counts["chat"] == 2
+
+
+def test_ocr_without_cache_calls_api(fake_openai):
+    agent = TextExtractionAgent({"openai_api_key": "test", "openai_base_url": fake_openai.base_url})
+    assert agent.lookup([_image(40)]) is None
+    agent.extract([_image(40)])
+    agent.extract([_image(40)])
+    assert fake_openai.counts["chat"] == 2
@@ -0,0 +1,194 @@
+# tests/test_video_frames.py
+
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+
+import numpy as np
+import pytest
+
+from data_filling.data.io import get_images_b64_from_case
+from data_filling.tools import video_to_frames as vtf
+
+av = pytest.importorskip("av")  # extra vidéo : pip install -r requirements-video.txt
+
+SCENE_LEN = 45  # une coupe franche toutes les 1,5 s
+
+
+def _write_clip(path, n_frames: int = 300, fps: int = 30, gop: int = 30, vfr: bool = False) -> str:
+    """Clip H.264 synthétique : texture en mouvement, nouvelle scène tous les SCENE_LEN frames."""
+    rng = np.random.default_rng(0)
+    out = av.open(str(path), "w")
+    stream = out.add_stream("libx264", rate=fps)
+    stream.width, stream.height, stream.pix_fmt = 160, 120, "yuv420p"
+    stream.codec_context.gop_size = gop
+    if vfr:
+        stream.codec_context.time_base = Fraction(1, 1000)
+    pts, scene = 0, None
+    for i in range(n_frames):
+        if i % SCENE_LEN == 0:
+            scene = (rng.random((120, 160, 3)) * 255).astype(np.uint8)
+        frame = av.VideoFrame.from_ndarray(np.roll(scene, 2 * i, axis=1), format="rgb24")
+        if vfr:  # débit variable : horodatages non contigus
+            frame.pts, frame.time_base = pts, Fraction(1, 1000)
+            pts += 20 if (i // 25) % 2 else 50
+        for packet in stream.encode(frame):
+            out.mux(packet)
+    for packet in stream.encode():
+        out.mux(packet)
+    out.close()
+    return str(path)
+
+
+def _decode_all(path) -> list:
+    """Référence : décodage séquentiel complet (PyAV, BGR)."""
+    with av.open(path) as container:
+        return [f.to_ndarray(format="bgr24") for f in container.decode(video=0)]
+
+
+@pytest.fixture(scope="module")
+def clip(tmp_path_factory):
+    return _write_clip(tmp_path_factory.mktemp("video") / "clip.mp4")
+
+
+@pytest.fixture(scope="module")
+def vfr_clip(tmp_path_factory):
+    return _write_clip(tmp_path_factory.mktemp("video") / "vfr.mp4", vfr=True)
+
+
+@pytest.fixture(scope="module")
+def reference(clip):
+    return _decode_all(clip)
+
+
+def _same_frames(frames, expected):
+    assert len(frames) == len(expected)
+    for got, want in zip(frames, expected):
+        np.testing.assert_array_equal(got, want)
+
+
+# ---------- relecture par seek ----------------------------------------
+@pytest.mark.parametrize("path_fixture", ["clip", "vfr_clip"])
+def test_seek_returns_the_frames_of_a_sequential_decode(request, path_fixture):
+    path = request.getfixturevalue(path_fixture)
+    expected = _decode_all(path)
+    positions = []
+    assert len(vtf._scene_scores(path, positions)) == len(positions) == len(expected)
+    assert sum(key for _, key in positions) >= 2
+
+    # mêmes GOP (sans seek), GOP différents, première et dernière frame
+    wanted = [0, 5, 6, 44, 45, 140, len(expected) - 1]
+    _same_frames(vtf._seek_frames(path, wanted, positions), [expected[i] for i in wanted])
+    _same_frames(vtf._read_frames_at(path, wanted, positions), [expected[i] for i in wanted])
+
+
+def test_read_frames_falls_back_without_timestamps(clip, reference):
+    wanted = [3, 90, 200]
+    _same_frames(vtf._read_frames_at(clip, wanted), [reference[i] for i in wanted])
+    positions = [(None, False)] * len(reference)
+    with pytest.raises(ValueError):
+        vtf._seek_frames(clip, wanted, positions)
+    _same_frames(vtf._read_frames_at(clip, wanted, positions), [reference[i] for i in wanted])
+
+
+def test_dynamic_keyframes_land_on_scene_cuts(clip, reference):
+    scores = vtf._scene_scores(clip)
+    selected = vtf.keyframes_from_scores(clip, scores)
+    cuts = set(range(SCENE_LEN, len(reference), SCENE_LEN))
+    # 10 s → 5 frames au plus, prises parmi les coupes (plus gros scores)
+    assert len(selected) == 5 and set(selected) <= cuts
+    _same_frames(vtf.extract_keyframes_dynamic(clip), [reference[i] for i in selected])
+
+
+# ---------- échantillonnage régulier -----------------------------------
+def test_regular_sampling_with_grab_matches_full_decode(clip, reference):
+    frames = vtf.extract_frames_regularly(clip)  # 30 fps, 0,5 fps visé → 1 frame sur 60
+    assert vtf.regular_interval(30.0) == 60
+    assert len(frames) == len(range(0, len(reference), 60))
+    _same_frames(frames, vtf._sample_regularly(clip, 0.5, full_decode=True))
+
+
+# ---------- I-frames (video_frame_strategy: keyframes) -----------------
+def _write_audio_only(path) -> str:
+    out = av.open(str(path), "w")
+    stream = out.add_stream("aac", rate=44100)
+    for _ in range(20):
+        frame = av.AudioFrame.from_ndarray(np.zeros((1, 1024), np.float32), format="fltp", layout="mono")
+        frame.sample_rate = 44100
+        for packet in stream.encode(frame):
+            out.mux(packet)
+    for packet in stream.encode():
+        out.mux(packet)
+    out.close()
+    return str(path)
+
+
+def test_iframes_are_decoded_keyframes(clip, reference):
+    positions = []
+    vtf._scene_scores(clip, positions)
+    keys = [i for i, (_, key) in enumerate(positions) if key]
+
+    frames = vtf.extract_iframes(clip)
+    assert len(frames) == 5  # 10 s à 0,5 fps
+    np.testing.assert_array_equal(frames[0], reference[0])
+    for frame in frames:
+        assert any(np.array_equal(frame, reference[i]) for i in keys)
+
+
+def test_iframes_on_unreadable_files(tmp_path):
+    garbage = tmp_path / "garbage.mp4"
+    garbage.write_bytes(b"not a video" * 100)
+    assert vtf.extract_iframes(str(garbage)) == []
+    assert vtf.extract_iframes(_write_audio_only(tmp_path / "audio.mp4")) == []
+
+
+def test_iframes_without_pyav_fall_back_to_dynamic(clip, monkeypatch):
+    monkeypatch.setattr(vtf, "av", None)
+    _same_frames(vtf.extract_iframes(clip), vtf.extract_keyframes_dynamic(clip))
+
+
+# ---------- scoring sur vignettes --------------------------------------
+def test_select_keyframes_threshold_then_bounds():
+    scores = np.array([0.0, 0.1, 0.1, 5.0, 0.1, 0.1, 4.0, 0.1, 0.1, 0.2])
+    assert vtf._select_keyframes(scores, max_frames=10, min_frames=3, k=2.0) == [0, 3, 9]
+    assert vtf._select_keyframes(scores, max_frames=10, min_frames=4, k=2.0) == [0, 3, 6, 9]
+    assert vtf._select_keyframes(scores, max_frames=2, min_frames=2, k=0.5) == [3, 6]
+
+
+def test_scoring_and_rereads_share_the_decoder(clip, monkeypatch):
+    monkeypatch.setattr(vtf, "av", None)  # OpenCV pour le scoring comme pour la relecture
+    scores = vtf._scene_scores(clip)
+    assert len(scores) == 300
+    selected = vtf.keyframes_from_scores(clip, scores)
+
+    every_frame = vtf._sample_regularly(clip, 30.0)  # read() de chaque frame
+    _same_frames(vtf.extract_keyframes_dynamic(clip), [every_frame[i] for i in selected])
+
+
+# ---------- décodage par segments --------------------------------------
+def test_video_segments_bounds(clip, tmp_path):
+    assert vtf.video_segments(clip, 3) == [(0, 90), (90, 180), (180, 270), (270, None)]
+    assert vtf.video_segments(clip, None) is None
+    assert vtf.video_segments(clip, 10) is None  # clip de 10 s : un seul segment
+    garbage = tmp_path / "garbage.mp4"
+    garbage.write_bytes(b"not a video")
+    assert vtf.video_segments(str(garbage), 3) is None
+
+
+def test_segment_scores_concatenate_to_whole_clip(clip):
+    parts = [vtf.scene_scores_segment(clip, start, stop) for start, stop in vtf.video_segments(clip, 3)]
+    np.testing.assert_allclose(np.concatenate(parts), vtf._scene_scores(clip))
+
+
+@pytest.mark.parametrize("path_fixture", ["clip", "vfr_clip"])
+@pytest.mark.parametrize("mode", ["dynamic", "regular"])
+def test_segmented_decoding_matches_sequential(request, capsys, path_fixture, mode):
+    path = request.getfixturevalue(path_fixture)
+    with ThreadPoolExecutor(4) as pool:
+        sequential = get_images_b64_from_case([path], mode=mode, pool=pool)
+        segmented = get_images_b64_from_case([path], mode=mode, pool=pool, segment_s=3)
+    if mode == "dynamic":
+        assert segmented == sequential  # même décodeur, mêmes frames
+    else:
+        assert len(segmented) == len(sequential)  # PyAV par segments, OpenCV en séquentiel
+    # débit variable : horodatages non contigus → repli séquentiel
+    assert ("decoding sequentially" in capsys.readouterr().out) == (path_fixture == "vfr_clip")